@@ -0,0 +1,85 @@
+import os
+import re
+import json
+
+from token_store import TokenStore, TOKEN_STORE_PATH
+
+# --- Configuration ---
+# Registry of the TikTok accounts every post is published to. Without this file the
+# single account configured through TIKTOK_REFRESH_TOKEN is used, exactly as before.
+TIKTOK_ACCOUNTS_FILE = os.getenv("TIKTOK_ACCOUNTS_FILE", "tiktok_accounts.json")
+DEFAULT_ACCOUNT = "default"
+DEFAULT_PRIVACY_LEVEL = "SELF_ONLY"
+
+def refresh_token_env(name):
+    """Name of the environment variable holding an account's refresh token."""
+    if name == DEFAULT_ACCOUNT:
+        return "TIKTOK_REFRESH_TOKEN"
+    return "TIKTOK_REFRESH_TOKEN_" + re.sub(r"[^A-Z0-9]", "_", name.upper())
+
+def token_store_path(name):
+    """Token store file of an account: '.tiktok_token.json' for the default one, '.tiktok_token.<name>.json' otherwise."""
+    if name == DEFAULT_ACCOUNT:
+        return TOKEN_STORE_PATH
+    root, ext = os.path.splitext(TOKEN_STORE_PATH)
+    return f"{root}.{name}{ext or '.json'}"
+
+class Account:
+    """
+    One TikTok account. Each account has its own refresh token and token store, so
+    token refreshes of different accounts never share state or block each other.
+    """
+
+    def __init__(self, name, refresh_token=None, token_store=None, privacy_level=DEFAULT_PRIVACY_LEVEL):
+        self.name = name
+        self.refresh_token = refresh_token
+        self.privacy_level = privacy_level
+        self.store = TokenStore(token_store or token_store_path(name))
+
+    def __repr__(self):
+        return f"Account({self.name!r})"
+
+def load_accounts(path=TIKTOK_ACCOUNTS_FILE, names=None):
+    """
+    Returns the list of configured accounts, optionally only those in `names`.
+
+    The registry is a JSON list (or {"accounts": [...]}) of entries such as
+        {"name": "main", "privacy_level": "SELF_ONLY"}
+    Refresh tokens are never stored in the registry: they are read from the variable
+    in 'refresh_token_env' (default TIKTOK_REFRESH_TOKEN_<NAME>) and then kept
+    up to date in the account's own token store.
+    Raises ValueError if the registry is invalid or a requested account is unknown.
+    """
+    if os.path.exists(path):
+        try:
+            with open(path, "r") as f:
+                entries = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"'{path}' is not valid JSON: {e}")
+        if isinstance(entries, dict):
+            entries = entries.get("accounts", [])
+        accounts = []
+        for entry in entries:
+            if not isinstance(entry, dict) or not entry.get("name"):
+                raise ValueError(f"Every account in '{path}' needs a 'name'.")
+            name = entry["name"]
+            accounts.append(Account(
+                name,
+                refresh_token=os.getenv(entry.get("refresh_token_env") or refresh_token_env(name)),
+                token_store=entry.get("token_store"),
+                privacy_level=entry.get("privacy_level", DEFAULT_PRIVACY_LEVEL),
+            ))
+        if len({account.name for account in accounts}) != len(accounts):
+            raise ValueError(f"Account names in '{path}' must be unique.")
+    else:
+        accounts = [Account(DEFAULT_ACCOUNT, refresh_token=os.getenv(refresh_token_env(DEFAULT_ACCOUNT)))]
+
+    if names:
+        known = {account.name for account in accounts}
+        unknown = [name for name in names if name not in known]
+        if unknown:
+            raise ValueError(f"Unknown account(s): {', '.join(unknown)}. Known: {', '.join(sorted(known))}.")
+        accounts = [account for account in accounts if account.name in names]
+    if not accounts:
+        raise ValueError(f"No accounts configured in '{path}'.")
+    return accounts
@@ -0,0 +1,166 @@
+import os
+import re
+from datetime import datetime, timedelta, timezone
+
+import metrics
+import post_queue
+import r2_storage
+import stage_cache
+from config import settings
+
+# --- Configuration ---
+# Every run uploads images to R2, including regenerations that are rejected and the
+# frames of live previews, and nothing else ever removes them. This command deletes
+# the objects no post needs any more, so the bucket (and the cost of storing and
+# listing it) stays the size of the recent posts, however long the account runs.
+#
+# Images of posts that are still on their way (generated, approved, publishing) are
+# always kept. Images of finished posts (published, failed, rejected) are kept for
+# ASSET_RETENTION_DAYS after the post last changed, so a failed post can still be
+# re-approved. Objects no post or cached stage refers to are deleted only with
+# --orphans, once they are ASSET_ORPHAN_GRACE_HOURS old, which leaves a run that is
+# uploading right now alone. The queue and the stage cache live in the Actions cache,
+# which can be evicted: an empty queue knows no post at all, so orphans are never
+# deleted against one.
+ASSET_RETENTION_DAYS = float(os.getenv("ASSET_RETENTION_DAYS", "30"))
+ORPHAN_GRACE_HOURS = float(os.getenv("ASSET_ORPHAN_GRACE_HOURS", "24"))
+LIVE_STATUSES = (post_queue.STATUS_GENERATED, post_queue.STATUS_APPROVED, post_queue.STATUS_PUBLISHING)
+# Before images were content-addressed, they were uploaded to the bucket root as
+# '<date>-pending_image.png'.
+LEGACY_KEY_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}-pending_image\.png$")
+
+def _urls(value):
+    """Yields every string nested in a post or cache value."""
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _urls(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _urls(item)
+
+def referenced_keys(value):
+    """Returns the object keys of every R2 public URL in a post or cache value."""
+    prefix = r2_storage.public_url("")
+    return {url[len(prefix):] for url in _urls(value) if url.startswith(prefix)}
+
+def collect_references(queue, cache, retention_days=ASSET_RETENTION_DAYS):
+    """
+    Returns {object key: expiry datetime or None}. None means the object must be kept
+    whatever its age: a live post or a cached stage (whose upload a later run may reuse)
+    refers to it.
+    """
+    retention = timedelta(days=retention_days)
+    references = {}
+    for post in queue.all_posts():
+        if post["status"] in LIVE_STATUSES:
+            expires = None
+        else:
+            expires = datetime.fromisoformat(post["updated_at"]).astimezone(timezone.utc) + retention
+        # An image shared by several posts lives as long as the longest-lived of them.
+        for key in referenced_keys(post):
+            if expires is None or references.get(key, expires) is None:
+                references[key] = None
+            else:
+                references[key] = max(expires, references.get(key, expires))
+    for stage in ("upload", "checkpoints"):
+        for value in cache.values(stage):
+            for key in referenced_keys(value):
+                references[key] = None
+    return references
+
+def classify(objects, references, now, grace_hours=ORPHAN_GRACE_HOURS):
+    """
+    Sorts listed objects into 'keep', 'expired' (only finished posts past their
+    retention refer to it) and 'orphaned' (nothing refers to it and it is past the
+    grace period). Returns {category: [object, ...]}.
+    """
+    grace_cutoff = now - timedelta(hours=grace_hours)
+    plan = {"keep": [], "expired": [], "orphaned": []}
+    for obj in objects:
+        key = obj["Key"]
+        if key in references:
+            expires = references[key]
+            plan["expired" if expires is not None and expires < now else "keep"].append(obj)
+        elif obj["LastModified"] < grace_cutoff:
+            plan["orphaned"].append(obj)
+        else:
+            plan["keep"].append(obj)
+    return plan
+
+def list_assets():
+    """Yields the managed objects: everything under R2_KEY_PREFIX plus legacy root-level images."""
+    yield from r2_storage.list_objects(r2_storage.R2_KEY_PREFIX)
+    for obj in r2_storage.list_objects("", delimiter="/"):
+        if LEGACY_KEY_PATTERN.match(obj["Key"]):
+            yield obj
+
+def _megabytes(objects):
+    return sum(obj["Size"] for obj in objects) / 1e6
+
+@metrics.timed("assets.run", check_result=False)
+def main(argv=None):
+    """
+    Usage: python asset_lifecycle.py [--dry-run] [--orphans] [--retention-days N] [--grace-hours N]
+    Deletes the R2 images of posts finished more than ASSET_RETENTION_DAYS ago, and with
+    --orphans the images no post refers to. --dry-run only reports what would be deleted.
+    """
+    import sys
+    argv = sys.argv[1:] if argv is None else argv
+    dry_run = "--dry-run" in argv
+    delete_orphans = "--orphans" in argv
+    options = {"--retention-days": ASSET_RETENTION_DAYS, "--grace-hours": ORPHAN_GRACE_HOURS}
+    for option in options:
+        if option in argv:
+            index = argv.index(option)
+            try:
+                options[option] = float(argv[index + 1])
+            except (IndexError, ValueError):
+                print(f"Error: {option} expects a number.")
+                exit(1)
+
+    if not r2_storage.is_configured():
+        print("Error: Missing one or more Cloudflare R2 environment variables. Please check repository secrets.")
+        exit(1)
+
+    now = datetime.now(timezone.utc)
+    queue = post_queue.open_queue()
+    if delete_orphans and not queue.all_posts():
+        print("Warning: the post queue is empty (new, or lost from the cache), so images of live posts "
+              "would look orphaned. Orphaned images are kept.")
+        delete_orphans = False
+    references = collect_references(queue, stage_cache.StageCache(), options["--retention-days"])
+    print(f"Listing bucket '{settings.r2_bucket_name}'...")
+    try:
+        plan = classify(list_assets(), references, now, options["--grace-hours"])
+    except Exception as e:
+        print(f"Could not list the bucket: {repr(e)}")
+        exit(1)
+
+    doomed = plan["expired"] + (plan["orphaned"] if delete_orphans else [])
+    for category in ("keep", "expired", "orphaned"):
+        objects = plan[category]
+        print(f"  {category:<9}{len(objects):>7} object(s) {_megabytes(objects):>10.1f} MB")
+    if plan["orphaned"] and not delete_orphans:
+        print("  Orphaned images are kept; pass --orphans to delete them.")
+    metrics.set_attrs(kept=len(plan["keep"]), expired=len(plan["expired"]), orphaned=len(plan["orphaned"]))
+    if dry_run:
+        for obj in doomed[:20]:
+            print(f"  would delete {obj['Key']} ({obj['LastModified']:%Y-%m-%d})")
+        if len(doomed) > 20:
+            print(f"  ... and {len(doomed) - 20} more.")
+        print("Dry run: nothing was deleted.")
+        return
+    if not doomed:
+        print("Nothing to delete.")
+        return
+
+    failed = r2_storage.delete_objects(obj["Key"] for obj in doomed)
+    print(f"Deleted {len(doomed) - len(failed)} object(s), {_megabytes(doomed):.1f} MB.")
+    if failed:
+        print(f"Error: {len(failed)} object(s) could not be deleted; the next run tries again.")
+        exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,435 @@
+"""
+Local stand-ins for OpenAI, Cloudflare R2 (S3 API), TikTok and Slack.
+
+One threaded HTTP server answers every provider on its own path prefix:
+
+    /openai/v1/...   chat completions and image generations (plain or streamed)
+    /s3/<bucket>/... PutObject, HeadObject, GetObject, ListObjectsV2, DeleteObjects
+    /tiktok/v2/...   OAuth token, creator info, content/init, publish status
+    /slack/webhook   incoming webhook
+    /slack/api/...   chat.postMessage and chat.update of the Web API
+
+Each provider has an injectable latency (mean and jitter), an error rate (the
+share of requests answered with a 500 or 429), and the image payload size is
+configurable, so benchmarks can model slow or flaky providers without spending
+real API money. Image latency is scaled by the requested quality, as with gpt-image-1.
+"""
+import io
+import os
+import re
+import json
+import time
+import random
+import base64
+import threading
+import itertools
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from xml.sax.saxutils import escape
+
+from PIL import Image
+
+WORDS = (
+    "fox owl whale rabbit deer cat bear otter hedgehog turtle moth firefly lantern teacup kite "
+    "boat bridge lighthouse windmill balloon comet moon star cloud meadow forest lake island "
+    "mountain garden library train treehouse umbrella violin piano candle blanket pillow acorn "
+    "mushroom snail butterfly dragonfly jellyfish seahorse penguin koala panda sloth fawn swan"
+).split()
+
+# Image generation latency per quality, relative to the configured latency ('medium').
+QUALITY_LATENCY = {"low": 0.25, "medium": 1.0, "high": 4.0}
+
+class ServiceProfile:
+    """Latency and failure settings for one provider."""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    def sample(self, scale=1.0):
+        """Returns one latency draw in seconds."""
+        if self.latency or self.jitter:
+            return max(0.0, random.gauss(self.latency, self.jitter)) * scale
+        return 0.0
+
+    def delay(self, scale=1.0):
+        time.sleep(self.sample(scale))
+
+    def should_fail(self):
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+def make_png(size, noise=True):
+    """Returns a PNG of size x size pixels. Noise keeps it about as large as a real render."""
+    if noise:
+        image = Image.frombytes("RGB", (size, size), os.urandom(size * size * 3))
+    else:
+        image = Image.new("RGB", (size, size), (20, 30, 90))
+    output = io.BytesIO()
+    image.save(output, "PNG")
+    return output.getvalue()
+
+class FakeServices:
+    """
+    Runs the stand-in server on a background thread.
+
+    `profiles` maps 'openai_text', 'openai_image', 'r2', 'tiktok' and 'slack' to a
+    ServiceProfile. `ingest_seconds` is how long TikTok takes to go from
+    content/init to PUBLISH_COMPLETE.
+    """
+
+    def __init__(self, profiles=None, image_size=1024, ingest_seconds=0.5, host="127.0.0.1", port=0):
+        self.profiles = {name: ServiceProfile() for name in ("openai_text", "openai_image", "r2", "tiktok", "slack")}
+        self.profiles.update(profiles or {})
+        self.image_b64 = base64.b64encode(make_png(image_size)).decode("ascii")
+        # Partial frames are flat images: the content of a preview does not matter here.
+        self.partial_b64 = base64.b64encode(make_png(image_size, noise=False)).decode("ascii")
+        self.ingest_seconds = ingest_seconds
+        self.objects = {}
+        self.publishes = {}
+        self.slack_messages = []
+        self.slack_posts = {}
+        self.request_counts = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self):
+        """Environment variables that point the scripts at this server."""
+        return {
+            "OPENAI_API_KEY": "sk-fake",
+            "OPENAI_BASE_URL": f"{self.base_url}/openai/v1",
+            "R2_ACCOUNT_ID": "fake-account",
+            "R2_ACCESS_KEY_ID": "fake-key",
+            "R2_SECRET_ACCESS_KEY": "fake-secret",
+            "R2_BUCKET_NAME": "fake-bucket",
+            "R2_PUBLIC_DOMAIN": f"{self.base_url.split('://', 1)[1]}/s3/fake-bucket",
+            "R2_ENDPOINT_URL": f"{self.base_url}/s3",
+            "TIKTOK_API_BASE": f"{self.base_url}/tiktok",
+            "TIKTOK_CLIENT_KEY": "fake-client",
+            "TIKTOK_CLIENT_SECRET": "fake-secret",
+            "TIKTOK_REFRESH_TOKEN": "fake-refresh",
+            "SLACK_WEBHOOK_URL": f"{self.base_url}/slack/webhook",
+            "SLACK_BOT_TOKEN": "xoxb-fake",
+            "SLACK_CHANNEL_ID": "C0FAKE",
+            "SLACK_API_BASE": f"{self.base_url}/slack/api",
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _count(self, name):
+        with self._lock:
+            self.request_counts[name] = self.request_counts.get(name, 0) + 1
+
+    # --- Provider behaviour ---
+    def chat_completion(self, request):
+        messages = json.dumps(request.get("messages", []))
+        is_caption = "Scene description" in messages
+        scene = " ".join(random.sample(WORDS, 6))
+        content = {"caption": f"Rest easy tonight, {scene}.", "hashtags": "#dreamy #bedtime #aiart #calm #art"}
+        carousel = re.search(r"Write (\d+) more scenes", messages)
+        bank = re.search(r"Write (\d+) new posts", messages)
+        if bank:
+            content = {"posts": []}
+            for _ in range(int(bank.group(1))):
+                words = " ".join(random.sample(WORDS, 6))
+                content["posts"].append({
+                    "description": f"A tiny {words} under a glowing sky",
+                    "caption": f"Rest easy tonight, {words}.",
+                    "hashtags": "#dreamy #bedtime #aiart #calm #art",
+                })
+        elif carousel:
+            content = {"scenes": [f"The same {scene}, moment {i + 2}" for i in range(int(carousel.group(1)))]}
+        elif not is_caption:
+            content["description"] = f"A tiny {scene} under a glowing sky"
+        return {
+            "id": f"chatcmpl-{next(self._ids)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": json.dumps(content)},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 180, "completion_tokens": 60, "total_tokens": 240},
+        }
+
+    def image_generation(self, request):
+        return {
+            "created": int(time.time()),
+            "data": [{"b64_json": self.image_b64}],
+            "usage": {"input_tokens": 50, "output_tokens": 1056, "total_tokens": 1106},
+        }
+
+    def image_stream(self, request, seconds):
+        """
+        Returns the (delay, event, payload) server-sent events of a streamed generation
+        that takes `seconds` in total, with its partial frames spread evenly before the end.
+        """
+        partials = int(request.get("partial_images") or 0)
+        step = seconds / (partials + 1)
+        common = {"created_at": int(time.time()), "size": request.get("size", "1024x1024"),
+                  "quality": request.get("quality", "medium"), "background": "opaque", "output_format": "png"}
+        events = [
+            (step, "image_generation.partial_image", dict(common, type="image_generation.partial_image",
+                                                          b64_json=self.partial_b64, partial_image_index=i))
+            for i in range(partials)
+        ]
+        events.append((step, "image_generation.completed", dict(
+            common, type="image_generation.completed", b64_json=self.image_b64,
+            usage={"input_tokens": 50, "output_tokens": 1056, "total_tokens": 1106,
+                   "input_tokens_details": {"image_tokens": 0, "text_tokens": 50}},
+        )))
+        return events
+
+    def slack_api(self, method, request):
+        with self._lock:
+            self.slack_messages.append(dict(request, method=method))
+            if method == "chat.postMessage":
+                ts = f"{time.time():.6f}"
+                self.slack_posts[ts] = request
+                return {"ok": True, "channel": request.get("channel"), "ts": ts}
+            if method == "chat.update":
+                if request.get("ts") not in self.slack_posts:
+                    return {"ok": False, "error": "message_not_found"}
+                self.slack_posts[request["ts"]] = request
+                return {"ok": True, "channel": request.get("channel"), "ts": request["ts"]}
+        return {"ok": False, "error": "unknown_method"}
+
+    def tiktok(self, path, body):
+        if path.endswith("/oauth/token/"):
+            return {
+                "access_token": f"act.{next(self._ids)}",
+                "expires_in": 86400,
+                "refresh_token": f"rft.{next(self._ids)}",
+                "refresh_expires_in": 31536000,
+                "open_id": "fake-open-id",
+                "scope": "user.info.basic,video.publish",
+            }
+        if path.endswith("/creator_info/query/"):
+            return {"data": {"privacy_level_options": ["SELF_ONLY", "PUBLIC_TO_EVERYONE"]}, "error": {"code": "ok"}}
+        if path.endswith("/content/init/"):
+            publish_id = f"p_pub_{next(self._ids)}"
+            with self._lock:
+                self.publishes[publish_id] = time.time()
+            return {"data": {"publish_id": publish_id}, "error": {"code": "ok"}}
+        if path.endswith("/status/fetch/"):
+            publish_id = json.loads(body or b"{}").get("publish_id")
+            started = self.publishes.get(publish_id)
+            if started is None:
+                return {"data": {}, "error": {"code": "invalid_params", "message": "unknown publish_id"}}
+            done = time.time() - started >= self.ingest_seconds
+            return {"data": {"status": "PUBLISH_COMPLETE" if done else "PROCESSING_DOWNLOAD"}, "error": {"code": "ok"}}
+        return None
+
+    def _handler_class(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _read_body(self):
+                if "chunked" in self.headers.get("Transfer-Encoding", ""):
+                    chunks = []
+                    while True:
+                        size = int(self.rfile.readline().split(b";")[0].strip() or b"0", 16)
+                        if size == 0:
+                            # Skip trailers (e.g. S3 checksum trailers) up to the blank line.
+                            while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                                pass
+                            break
+                        chunks.append(self.rfile.read(size))
+                        self.rfile.readline()
+                    body = b"".join(chunks)
+                else:
+                    body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if "aws-chunked" in self.headers.get("Content-Encoding", ""):
+                    body = _decode_aws_chunked(body)
+                return body
+
+            def _send(self, status, body=b"", content_type="application/json", headers=None):
+                if isinstance(body, (dict, list)):
+                    body = json.dumps(body).encode("utf-8")
+                elif isinstance(body, str):
+                    body = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+
+            def _send_events(self, events):
+                """Sends (delay, event, payload) tuples as a chunked server-sent event stream."""
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for delay, event, payload in events:
+                    time.sleep(delay)
+                    chunk = f"event: {event}\ndata: {json.dumps(payload)}\n\n".encode("utf-8")
+                    self.wfile.write(f"{len(chunk):x}\r\n".encode("ascii") + chunk + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _profile_gate(self, name, delay=True, scale=1.0):
+                services._count(name)
+                profile = services.profiles[name]
+                if delay:
+                    profile.delay(scale)
+                if profile.should_fail():
+                    status = random.choice((429, 500))
+                    headers = {"Retry-After": "0"} if status == 429 else None
+                    self._send(status, {"error": {"code": "fake_error", "message": "injected failure"}}, headers=headers)
+                    return False
+                return True
+
+            def _dispatch(self):
+                parsed = urlparse(self.path)
+                path = parsed.path
+                body = self._read_body() if self.command in ("POST", "PUT") else b""
+
+                if path.startswith("/openai/"):
+                    name = "openai_image" if "images" in path else "openai_text"
+                    request = json.loads(body or b"{}")
+                    # A streamed generation spends its latency between the events instead of up front.
+                    streamed = bool(request.get("stream"))
+                    scale = QUALITY_LATENCY.get(request.get("quality"), 1.0) if name == "openai_image" else 1.0
+                    if name == "openai_image":
+                        services._count(f"openai_image.{request.get('quality', 'auto')}")
+                    if not self._profile_gate(name, delay=not streamed, scale=scale):
+                        return
+                    if path.endswith("/images/generations") and streamed:
+                        return self._send_events(services.image_stream(request, services.profiles[name].sample(scale)))
+                    if path.endswith("/chat/completions"):
+                        return self._send(200, services.chat_completion(request))
+                    if path.endswith("/images/generations"):
+                        return self._send(200, services.image_generation(request))
+                    return self._send(404, {"error": {"message": f"unknown path {path}"}})
+
+                if path.startswith("/s3/"):
+                    if not self._profile_gate("r2"):
+                        return
+                    return self._s3(path[len("/s3/"):], parse_qs(parsed.query, keep_blank_values=True), body)
+
+                if path.startswith("/tiktok/"):
+                    if not self._profile_gate("tiktok"):
+                        return
+                    result = services.tiktok(path, body)
+                    return self._send(200 if result is not None else 404, result or {})
+
+                if path.startswith("/slack/"):
+                    if not self._profile_gate("slack"):
+                        return
+                    if path.startswith("/slack/api/"):
+                        return self._send(200, services.slack_api(path.rsplit("/", 1)[1], json.loads(body or b"{}")))
+                    with services._lock:
+                        services.slack_messages.append(json.loads(body or b"{}"))
+                    return self._send(200, "ok", content_type="text/plain")
+
+                self._send(404, {"error": "not found"})
+
+            def _s3(self, path, query, body):
+                bucket, _, key = path.partition("/")
+                if self.command == "PUT" and key:
+                    etag = f'"{len(body):x}-{next(services._ids)}"'
+                    with services._lock:
+                        services.objects[(bucket, key)] = (body, self.headers.get("Content-Type"), time.time(), etag)
+                    return self._send(200, headers={"ETag": etag})
+                if self.command in ("HEAD", "GET") and key:
+                    stored = services.objects.get((bucket, key))
+                    if stored is None:
+                        return self._send(404, b"", content_type="application/xml")
+                    data, content_type, _, etag = stored
+                    return self._send(200, data, content_type=content_type or "application/octet-stream",
+                                      headers={"ETag": etag})
+                if self.command == "GET" and "list-type" in query:
+                    return self._send(200, services.list_objects_xml(bucket, query), content_type="application/xml")
+                if self.command == "POST" and "delete" in query:
+                    return self._send(200, services.delete_objects_xml(bucket, body), content_type="application/xml")
+                self._send(400, b"", content_type="application/xml")
+
+            do_GET = do_POST = do_PUT = do_HEAD = do_DELETE = _dispatch
+
+        return Handler
+
+    # --- S3 listing and batch deletion ---
+    def list_objects_xml(self, bucket, query):
+        prefix = query.get("prefix", [""])[0]
+        max_keys = int(query.get("max-keys", ["1000"])[0])
+        start_after = query.get("continuation-token", [""])[0]
+        with self._lock:
+            keys = sorted(key for (b, key) in self.objects if b == bucket and key.startswith(prefix))
+        keys = [key for key in keys if key > start_after]
+        page, truncated = keys[:max_keys], len(keys) > max_keys
+        contents = "".join(
+            "<Contents><Key>{}</Key><LastModified>{}</LastModified><Size>{}</Size><ETag>{}</ETag></Contents>".format(
+                escape(key),
+                time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(self.objects[(bucket, key)][2])),
+                len(self.objects[(bucket, key)][0]),
+                escape(self.objects[(bucket, key)][3]),
+            )
+            for key in page
+        )
+        token = f"<NextContinuationToken>{escape(page[-1])}</NextContinuationToken>" if truncated else ""
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+            f"<Name>{escape(bucket)}</Name><Prefix>{escape(prefix)}</Prefix><KeyCount>{len(page)}</KeyCount>"
+            f"<MaxKeys>{max_keys}</MaxKeys><IsTruncated>{'true' if truncated else 'false'}</IsTruncated>"
+            f"{token}{contents}</ListBucketResult>"
+        )
+
+    def delete_objects_xml(self, bucket, body):
+        import xml.etree.ElementTree as ElementTree
+        root = ElementTree.fromstring(body)
+        keys = [element.text for element in root.iter() if element.tag.endswith("Key")]
+        with self._lock:
+            for key in keys:
+                self.objects.pop((bucket, key), None)
+        deleted = "".join(f"<Deleted><Key>{escape(key)}</Key></Deleted>" for key in keys)
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            f'<DeleteResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">{deleted}</DeleteResult>'
+        )
+
+def _decode_aws_chunked(body):
+    """Strips the aws-chunked framing (chunk sizes, signatures and trailers) from an S3 upload."""
+    output = io.BytesIO()
+    stream = io.BytesIO(body)
+    while True:
+        header = stream.readline()
+        if not header:
+            break
+        size = int(header.split(b";")[0].strip() or b"0", 16)
+        if size == 0:
+            break
+        output.write(stream.read(size))
+        stream.readline()
+    return output.getvalue()
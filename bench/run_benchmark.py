@@ -0,0 +1,463 @@
+"""
+Offline end-to-end benchmark of generate_content.py and publish_content.py.
+
+Starts the local stand-ins from fake_services.py, points the scripts at them
+through their base-URL settings, runs each script's main() in single-post and
+batch scenarios, and reports per-stage p50/p95 latency, throughput and peak
+memory. Nothing leaves the machine and no API is billed.
+
+Usage:
+    python bench/run_benchmark.py                      # run and print the report
+    python bench/run_benchmark.py --save-baseline      # ... and store it in bench/baseline.json
+    python bench/run_benchmark.py --compare            # ... and compare it with the baseline
+    python bench/run_benchmark.py --latency openai_image=2.0 --error-rate r2=0.1 --count 8
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import contextlib
+import importlib
+from datetime import date, datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+DEFAULT_BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_services import FakeServices, ServiceProfile  # noqa: E402
+
+SERVICES = ("openai_text", "openai_image", "r2", "tiktok", "slack")
+# Scaled-down but proportionate provider latencies: image generation dominates.
+DEFAULT_LATENCY = {"openai_text": 0.05, "openai_image": 0.4, "r2": 0.02, "tiktok": 0.02, "slack": 0.01}
+# Slowdowns smaller than this never count as a regression, whatever the percentage.
+MIN_REGRESSION_S = 0.02
+
+# (module, function, stage name) wrapped with timers. Stages are looked up as module
+# attributes at call time, so wrapping the module attribute is enough. A call counts
+# as failed when it raises or returns None/False (or a tuple starting with None/False,
+# like generate_image_bytes), except for the notification stages, which return nothing.
+GENERATE_STAGES = (
+    ("generate_content", "generate_prompt_and_caption", "gen.text"),
+    ("generate_content", "generate_caption_for_description", "gen.caption"),
+    ("generate_content", "generate_carousel_scenes", "gen.scenes"),
+    ("generate_content", "generate_scene_bank", "gen.scene_bank"),
+    ("generate_content", "generate_image_bytes", "gen.image"),
+    ("renditions", "render_all", "gen.render"),
+    ("generate_content", "upload_variants_to_r2", "gen.upload"),
+    ("generate_content", "generate_post", "gen.post"),
+    ("generate_content", "save_batch_for_approval", "gen.queue"),
+    ("generate_content", "send_approval_request_to_slack", "gen.slack"),
+)
+NO_RESULT_STAGES = {"gen.slack", "pub.slack"}
+PUBLISH_STAGES = (
+    ("generate_content", "finalize_draft", "pub.final"),
+    ("publish_content", "get_access_token", "pub.auth"),
+    ("publish_content", "query_creator_info", "pub.creator_info"),
+    ("publish_content", "post_to_tiktok", "pub.init"),
+    ("publish_status", "wait_for_publishes", "pub.ingest_wait"),
+    ("publish_content", "send_slack_message", "pub.slack"),
+)
+
+# *** 1. Measurement ***
+def read_rss_bytes():
+    """Returns the current resident set size of this process from /proc, or 0 where unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+def peak_rss_bytes():
+    """Returns the peak RSS of this process so far (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+class Recorder:
+    """
+    Collects (stage, start, end) spans from the wrapped stage functions and RSS
+    samples from a background thread, so each stage's peak memory is the largest
+    sample taken while one of its calls was running.
+    """
+
+    def __init__(self, sample_interval=0.005):
+        self.sample_interval = sample_interval
+        self.spans = []
+        self.samples = []
+        self.run_started = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            sample = (time.perf_counter(), read_rss_bytes())
+            with self._lock:
+                self.samples.append(sample)
+            self._stop.wait(self.sample_interval)
+
+    def record(self, stage, start, end, ok):
+        with self._lock:
+            self.spans.append((stage, start, end, ok))
+            # Calls shorter than the sampling interval still get one sample.
+            self.samples.append((end, read_rss_bytes()))
+
+    def wrap(self, module_name, function_name, stage):
+        module = importlib.import_module(module_name)
+        original = getattr(module, function_name)
+        recorder = self
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            ok = False
+            try:
+                result = original(*args, **kwargs)
+                first = result[0] if isinstance(result, tuple) and result else result
+                ok = stage in NO_RESULT_STAGES or (first is not None and first is not False)
+                return result
+            finally:
+                recorder.record(stage, start, time.perf_counter(), ok)
+
+        setattr(module, function_name, timed)
+        return module, function_name, original
+
+    def peak_during(self, stage):
+        intervals = [(start, end) for name, start, end, _ in self.spans if name == stage]
+        peak = 0
+        for t, rss in self.samples:
+            if rss > peak and any(start <= t <= end for start, end in intervals):
+                peak = rss
+        return peak
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+def summarize_stages(recorder):
+    stages = {}
+    for name in dict.fromkeys(span[0] for span in recorder.spans):
+        durations = [end - start for stage, start, end, _ in recorder.spans if stage == name]
+        failures = sum(1 for stage, _, _, ok in recorder.spans if stage == name and not ok)
+        stages[name] = {
+            "calls": len(durations),
+            "failures": failures,
+            "p50_s": round(percentile(durations, 50), 4),
+            "p95_s": round(percentile(durations, 95), 4),
+            "mean_s": round(sum(durations) / len(durations), 4),
+            "peak_rss_mb": round(recorder.peak_during(name) / 2**20, 1),
+        }
+    return stages
+
+# *** 2. Scenarios ***
+@contextlib.contextmanager
+def quiet(enabled):
+    if not enabled:
+        yield
+        return
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+def run_main(module, argv, quiet_output):
+    """Runs a script's main() with the given argv. Returns True unless it exited non-zero."""
+    try:
+        with quiet(quiet_output):
+            module.main(argv)
+        return True
+    except SystemExit as e:
+        return e.code in (None, 0)
+
+def reset_state(workdir):
+    """Clears the stage cache between iterations so every run does the full work."""
+    shutil.rmtree(os.path.join(workdir, "stage_cache"), ignore_errors=True)
+
+def wrap_first_preview(recorder):
+    """
+    Records 'gen.first_preview', the time from the start of a generate run to its first
+    live preview in Slack (only with --partial-images).
+    """
+    import slack_api
+    original = slack_api.post_message
+
+    def timed(*args, **kwargs):
+        result = original(*args, **kwargs)
+        with recorder._lock:
+            started, recorder.run_started = recorder.run_started, None
+        if started is not None:
+            recorder.record("gen.first_preview", started, time.perf_counter(), result is not None)
+        return result
+
+    slack_api.post_message = timed
+    return slack_api, "post_message", original
+
+def run_scenario(name, count, iterations, concurrency, workdir, quiet_output, carousel=1):
+    """
+    Generates `count` posts (one run of generate_content.main per iteration) and then
+    approves and publishes them (one run of publish_content.main per post), recording every stage.
+    """
+    import generate_content
+    import publish_content
+    import post_queue
+    import slack_outbox
+    # The scripts import these on first use; importing them here keeps import time
+    # (see 'python cli.py startup') out of the first scenario's stage timings.
+    import openai, boto3, PIL.Image  # noqa: F401,E401
+
+    recorder = Recorder()
+    wrapped = [recorder.wrap(*spec) for spec in GENERATE_STAGES + PUBLISH_STAGES]
+    wrapped.append(wrap_first_preview(recorder))
+    generate_argv = ["--count", str(count), "--concurrency", str(concurrency)] if count > 1 else []
+    if carousel > 1:
+        generate_argv += ["--carousel", str(carousel)]
+    original_today = post_queue._today
+    # Batches are scheduled on future dates; publish them as if those dates had come.
+    post_queue._today = lambda: (date.today() + timedelta(days=count + 1)).isoformat()
+
+    generate_runs = publish_runs = failed_runs = 0
+    generate_time = publish_time = 0.0
+    recorder.start()
+    try:
+        for _ in range(iterations):
+            reset_state(workdir)
+            start = recorder.run_started = time.perf_counter()
+            ok = run_main(generate_content, generate_argv, quiet_output)
+            end = time.perf_counter()
+            recorder.record("generate.main", start, end, ok)
+            generate_time += end - start
+            generate_runs += 1
+            failed_runs += not ok
+
+            for _ in range(count):
+                # publish_content only approves today's post by itself; approve the rest as an operator would.
+                queue = post_queue.open_queue()
+                pending = queue.next_due(post_queue.STATUS_GENERATED)
+                if pending:
+                    queue.approve(pending["id"])
+                queue.close()
+                start = time.perf_counter()
+                ok = run_main(publish_content, [], quiet_output)
+                end = time.perf_counter()
+                recorder.record("publish.main", start, end, ok)
+                publish_time += end - start
+                publish_runs += 1
+                failed_runs += not ok
+        # The scripts only queue their Slack messages; deliver what is left before the next scenario.
+        start = time.perf_counter()
+        slack_outbox.get_outbox().close()
+        recorder.record("slack.drain", start, time.perf_counter(), True)
+    finally:
+        slack_outbox._outbox = None
+        recorder.stop()
+        post_queue._today = original_today
+        for module, function_name, original in wrapped:
+            setattr(module, function_name, original)
+
+    posts = count * iterations
+    return {
+        "scenario": name,
+        "posts": posts,
+        "generate_runs": generate_runs,
+        "publish_runs": publish_runs,
+        "failed_runs": failed_runs,
+        "generate_posts_per_s": round(posts / generate_time, 3) if generate_time else None,
+        "publish_posts_per_s": round(publish_runs / publish_time, 3) if publish_time else None,
+        "stages": summarize_stages(recorder),
+    }
+
+# *** 3. Reporting and baselines ***
+def print_report(report):
+    print(f"\nBenchmark run at {report['recorded_at']} on {report['machine']}")
+    print(f"Settings: {json.dumps(report['settings'])}")
+    for scenario in report["scenarios"].values():
+        print(
+            f"\n== {scenario['scenario']}: {scenario['posts']} post(s), "
+            f"{scenario['generate_posts_per_s']} generated/s, {scenario['publish_posts_per_s']} published/s, "
+            f"{scenario['failed_runs']} failed run(s)"
+        )
+        print(f"   {'stage':<20}{'calls':>6}{'fail':>6}{'p50 s':>10}{'p95 s':>10}{'peak MB':>10}")
+        for name, stage in scenario["stages"].items():
+            print(
+                f"   {name:<20}{stage['calls']:>6}{stage['failures']:>6}{stage['p50_s']:>10.4f}"
+                f"{stage['p95_s']:>10.4f}{stage['peak_rss_mb']:>10.1f}"
+            )
+    print(f"\nPeak RSS: {report['peak_rss_mb']} MB (largest child process: {report['peak_child_rss_mb']} MB)")
+
+def compare_with_baseline(report, baseline, tolerance):
+    """
+    Prints the change of every stage's p95 and each scenario's throughput against a
+    baseline. Returns the list of regressions beyond `tolerance` (a fraction).
+    """
+    regressions = []
+    print(f"\nComparison with the baseline recorded at {baseline.get('recorded_at')}:")
+    for name, scenario in report["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            print(f"   {name}: not in the baseline, skipped.")
+            continue
+        for key in ("generate_posts_per_s", "publish_posts_per_s"):
+            if base.get(key) and scenario.get(key):
+                change = scenario[key] / base[key] - 1
+                print(f"   {name:<8}{key:<28}{base[key]:>10}{scenario[key]:>10}{change:>+9.1%}")
+                if change < -tolerance:
+                    regressions.append(f"{name} {key} {change:+.1%}")
+        for stage_name, stage in scenario["stages"].items():
+            base_stage = base.get("stages", {}).get(stage_name)
+            if not base_stage or not base_stage.get("p95_s"):
+                continue
+            change = stage["p95_s"] / base_stage["p95_s"] - 1
+            print(f"   {name:<8}{stage_name + ' p95':<28}{base_stage['p95_s']:>10}{stage['p95_s']:>10}{change:>+9.1%}")
+            # Millisecond-scale stages are dominated by scheduling noise.
+            if change > tolerance and stage["p95_s"] - base_stage["p95_s"] > MIN_REGRESSION_S:
+                regressions.append(f"{name} {stage_name} p95 {change:+.1%}")
+    return regressions
+
+def parse_assignments(values, option):
+    """Parses repeated SERVICE=VALUE options into a dict of floats."""
+    result = {}
+    for value in values or []:
+        service, _, number = value.partition("=")
+        if service not in SERVICES:
+            raise SystemExit(f"Error: {option} expects SERVICE=VALUE with SERVICE one of {', '.join(SERVICES)}.")
+        try:
+            result[service] = float(number)
+        except ValueError:
+            raise SystemExit(f"Error: {option} value for '{service}' must be a number.")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the generate and publish pipeline.")
+    parser.add_argument("--scenarios", default="single,batch", help="comma-separated: single, batch")
+    parser.add_argument("--iterations", type=int, default=3, help="runs of each scenario (default 3)")
+    parser.add_argument("--count", type=int, default=4, help="posts per batch run (default 4)")
+    parser.add_argument("--concurrency", type=int, default=4, help="generation concurrency of batch runs")
+    parser.add_argument("--latency", action="append", metavar="SERVICE=SECONDS",
+                        help=f"mean provider latency; services: {', '.join(SERVICES)}")
+    parser.add_argument("--jitter", type=float, default=0.2, help="latency std-dev as a fraction of the mean")
+    parser.add_argument("--error-rate", action="append", metavar="SERVICE=RATE",
+                        help="share of requests answered with 429/500")
+    parser.add_argument("--carousel", type=int, default=1, metavar="K", help="images per post (default 1)")
+    parser.add_argument("--partial-images", type=int, default=0, metavar="N",
+                        help="stream N partial frames per image to a live Slack preview (default 0: off)")
+    parser.add_argument("--scene-bank", type=int, default=0, metavar="M",
+                        help="take each post's text from a scene bank refilled M entries at a time (default 0: off)")
+    parser.add_argument("--draft-quality", default="", metavar="QUALITY",
+                        help="generate drafts at this quality and render the final image on publish (e.g. low)")
+    parser.add_argument("--image-size", type=int, default=1024, help="edge of the fake generated PNG in pixels")
+    parser.add_argument("--ingest-seconds", type=float, default=0.3, help="fake TikTok ingest time")
+    parser.add_argument("--rate-limit-scale", type=float, default=1000.0,
+                        help="multiplier of the providers' default RPM limits (default 1000: no pacing)")
+    parser.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE_PATH, metavar="PATH")
+    parser.add_argument("--compare", nargs="?", const=DEFAULT_BASELINE_PATH, metavar="PATH")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed regression before --compare fails")
+    parser.add_argument("--json", metavar="PATH", help="also write the report to PATH")
+    parser.add_argument("--keep-metrics", metavar="PATH", help="copy the scripts' metrics.jsonl spans to PATH")
+    parser.add_argument("--verbose", action="store_true", help="show the scripts' own output")
+    args = parser.parse_args()
+
+    latency = {**DEFAULT_LATENCY, **parse_assignments(args.latency, "--latency")}
+    error_rate = parse_assignments(args.error_rate, "--error-rate")
+    profiles = {
+        service: ServiceProfile(latency[service], latency[service] * args.jitter, error_rate.get(service, 0.0))
+        for service in SERVICES
+    }
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    for name in scenarios:
+        if name not in ("single", "batch"):
+            parser.error(f"unknown scenario '{name}'")
+
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    services = FakeServices(profiles, image_size=args.image_size, ingest_seconds=args.ingest_seconds).start()
+    # The scripts read their configuration at import time, so it must be in place first.
+    os.environ.update(services.env())
+    os.environ.update({
+        "POST_QUEUE_DB": os.path.join(workdir, "post_queue.db"),
+        "STAGE_CACHE_DIR": os.path.join(workdir, "stage_cache"),
+        "TIKTOK_TOKEN_STORE": os.path.join(workdir, "tiktok_token.json"),
+        "PUBLISH_LOG_PATH": os.path.join(workdir, "publish_log.jsonl"),
+        "METRICS_PATH": os.path.join(workdir, "metrics.jsonl"),
+        "SLACK_OUTBOX_PATH": os.path.join(workdir, "slack_outbox.jsonl"),
+        "RATE_LIMIT_SCALE": str(args.rate_limit_scale),
+        "IMAGE_PARTIAL_IMAGES": str(args.partial_images),
+        "IMAGE_DRAFT_QUALITY": args.draft_quality,
+        "SCENE_BANK_SIZE": str(args.scene_bank),
+        "PUBLISH_POLL_INITIAL_DELAY": "0.05",
+        "PUBLISH_POLL_MAX_DELAY": "0.5",
+    })
+    saved_cwd = os.getcwd()
+    # Legacy files and --keep-local output land in the scratch directory, not the repo.
+    os.chdir(workdir)
+
+    results = {}
+    try:
+        for name in scenarios:
+            count = args.count if name == "batch" else 1
+            print(f"Running scenario '{name}' ({args.iterations} x {count} post(s))...")
+            results[name] = run_scenario(name, count, args.iterations, args.concurrency, workdir, not args.verbose,
+                                         args.carousel)
+    finally:
+        os.chdir(saved_cwd)
+        services.stop()
+        if args.keep_metrics:
+            shutil.copy(os.path.join(workdir, "metrics.jsonl"), args.keep_metrics)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "recorded_at": datetime.now().isoformat(timespec="seconds"),
+        "machine": f"{platform.system()} {platform.machine()}, {os.cpu_count()} CPUs, Python {platform.python_version()}",
+        "settings": {
+            "iterations": args.iterations, "count": args.count, "concurrency": args.concurrency, "carousel": args.carousel,
+            "partial_images": args.partial_images, "draft_quality": args.draft_quality, "scene_bank": args.scene_bank,
+            "latency": latency, "jitter": args.jitter, "error_rate": error_rate,
+            "image_size": args.image_size, "ingest_seconds": args.ingest_seconds,
+            "rate_limit_scale": args.rate_limit_scale,
+        },
+        "peak_rss_mb": round(peak_rss_bytes() / 2**20, 1),
+        "peak_child_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        "requests": services.request_counts,
+        "scenarios": results,
+    }
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to '{args.save_baseline}'.")
+    if args.compare:
+        try:
+            with open(args.compare, "r") as f:
+                baseline = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            print(f"Error: could not read the baseline '{args.compare}': {e}")
+            exit(1)
+        regressions = compare_with_baseline(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for regression in regressions:
+                print(f"   {regression}")
+            exit(1)
+        print("\nNo regressions beyond the tolerance.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+import os
+import sys
+import time
+import subprocess
+
+# --- Configuration ---
+# Every subcommand maps to the function of the script behind it. The script is only
+# imported when its subcommand runs, and 'sdks' lists the provider SDKs it imports on
+# first use, so the startup report can include them.
+COMMANDS = {
+    "generate": {
+        "module": "generate_content",
+        "function": "main",
+        "args": True,
+        "sdks": ("openai", "boto3", "PIL.Image"),
+        "help": "Generate posts, upload their images to R2 and queue them for approval.",
+    },
+    "notify": {
+        "module": "generate_content",
+        "function": "notify",
+        "args": False,
+        "sdks": (),
+        "help": "Send a Slack approval request for every post waiting for review.",
+    },
+    "publish": {
+        "module": "publish_content",
+        "function": "main",
+        "args": True,
+        "sdks": (),
+        "help": "Publish the next due post to every configured TikTok account.",
+    },
+    "daemon": {
+        "module": "daemon",
+        "function": "main",
+        "args": True,
+        "sdks": ("openai", "boto3", "PIL.Image"),
+        "help": "Run continuously: generate on a schedule and publish posts as soon as they are approved.",
+    },
+    "assets": {
+        "module": "asset_lifecycle",
+        "function": "main",
+        "args": True,
+        "sdks": ("boto3",),
+        "help": "Delete R2 images that no queued or recent post needs any more.",
+    },
+    "auth": {
+        "module": "get_tiktok_token",
+        "function": "main",
+        "args": True,
+        "sdks": (),
+        "help": "Authorize a TikTok account and store its tokens.",
+    },
+}
+# Modules whose presence is called out in the startup report.
+HEAVY_MODULES = ("openai", "boto3", "PIL", "requests")
+# Reference point for the report: what importing every SDK up front costs.
+EAGER_IMPORTS = "import openai, boto3, PIL.Image, requests"
+
+def load(command, with_sdks=False):
+    """
+    Imports the script behind a subcommand and returns its entry point.
+    With with_sdks=True the SDKs it imports lazily are imported as well.
+    """
+    spec = COMMANDS[command]
+    # Spans keep the name of the script they came from, as when it is run directly.
+    os.environ.setdefault("METRICS_SCRIPT", spec["module"])
+    # Loads .env before any module reads its settings.
+    import config  # noqa: F401
+
+    # __import__ rather than importlib.import_module, so -X importtime reports these imports too.
+    __import__(spec["module"])
+    if with_sdks:
+        for name in spec["sdks"]:
+            __import__(name)
+    return getattr(sys.modules[spec["module"]], spec["function"])
+
+# *** Startup report ***
+def parse_importtime(output):
+    """
+    Parses the stderr of 'python -X importtime'.
+    Returns (total import seconds, {module: cumulative seconds} of top-level imports, set of all modules).
+    """
+    top_level = {}
+    modules = set()
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue  # the header line
+        name = fields[2][1:]
+        modules.add(name.strip())
+        if not name.startswith(" "):
+            top_level[name] = int(fields[1]) / 1e6
+    return sum(top_level.values()), top_level, modules
+
+def measure_startup(code, runs=3):
+    """
+    Runs `code` in fresh interpreters with -X importtime, keeping the fastest run.
+    Returns {'wall_s', 'import_s', 'top', 'heavy'}.
+    """
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=dict(os.environ, METRICS_PATH=""),
+            capture_output=True,
+            text=True,
+        )
+        wall = time.perf_counter() - start
+        if completed.returncode != 0:
+            print(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "failed")
+            exit(1)
+        total, top_level, modules = parse_importtime(completed.stderr)
+        if best is None or wall < best["wall_s"]:
+            best = {
+                "wall_s": wall,
+                "import_s": total,
+                "top": sorted(top_level.items(), key=lambda item: -item[1])[:3],
+                "heavy": [name for name in HEAVY_MODULES if name in modules],
+            }
+    return best
+
+def startup_report(argv):
+    """
+    Usage: python cli.py startup [command ...] [--runs N]
+    Measures how long each subcommand takes to start (interpreter plus imports,
+    including the SDKs it loads on first use) without running it.
+    """
+    runs = 3
+    if "--runs" in argv:
+        index = argv.index("--runs")
+        try:
+            runs = max(1, int(argv[index + 1]))
+        except (IndexError, ValueError):
+            print("Error: --runs expects an integer value.")
+            exit(1)
+        argv = argv[:index] + argv[index + 2:]
+    unknown = [name for name in argv if name not in COMMANDS]
+    if unknown:
+        print(f"Error: unknown command(s): {', '.join(unknown)}.")
+        exit(1)
+
+    rows = [("python", "pass"), ("eager SDKs", EAGER_IMPORTS)]
+    rows += [(name, f"import cli; cli.load({name!r}, with_sdks=True)") for name in argv or COMMANDS]
+    print(f"Startup times, fastest of {runs} run(s):\n")
+    print(f"{'command':<12}{'wall ms':>9}{'import ms':>11}  {'loads':<30}heaviest imports")
+    for name, code in rows:
+        result = measure_startup(code, runs)
+        top = ", ".join(f"{module} {seconds * 1000:.0f}" for module, seconds in result["top"])
+        print(f"{name:<12}{result['wall_s'] * 1000:>9.0f}{result['import_s'] * 1000:>11.0f}  "
+              f"{', '.join(result['heavy']) or '-':<30}{top}")
+
+# *** Main execution flow ***
+def print_usage():
+    print("Usage: python cli.py <command> [options]\n")
+    for name, spec in COMMANDS.items():
+        print(f"  {name:<10}{spec['help']}")
+    print(f"  {'startup':<10}Report how long each command takes to start.")
+    print("\nRun 'python cli.py <command> --help' for the options of a command.")
+
+def main():
+    """Dispatches to the subcommand named by the first argument."""
+    argv = sys.argv[1:]
+    if not argv or argv[0] in ("-h", "--help", "help"):
+        print_usage()
+        exit(0 if argv else 1)
+
+    command, args = argv[0], argv[1:]
+    if command == "startup":
+        startup_report(args)
+        return
+    if command not in COMMANDS:
+        print(f"Error: unknown command '{command}'.\n")
+        print_usage()
+        exit(1)
+
+    spec = COMMANDS[command]
+    function = load(command)
+    if "--help" in args or "-h" in args:
+        print(spec["help"])
+        if function.__doc__:
+            print(function.__doc__.rstrip())
+        return
+    if spec["args"]:
+        function(args)
+    else:
+        function()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import os
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+DEFAULT_TIKTOK_API_BASE = "https://open.tiktokapis.com"
+DEFAULT_SLACK_API_BASE = "https://slack.com/api"
+
+class Settings:
+    """
+    Credentials and provider endpoints shared by the scripts, read from the
+    environment (and .env) once. Tuning knobs such as timeouts, rate limits and
+    cache paths stay in the module that uses them.
+    """
+
+    def __init__(self, environ=None):
+        env = os.environ if environ is None else environ
+        # OpenAI. The base URL can point at a local stand-in for benchmarks.
+        self.openai_api_key = env.get("OPENAI_API_KEY")
+        self.openai_base_url = env.get("OPENAI_BASE_URL")
+
+        # Slack incoming webhook for approval requests and publish results.
+        self.slack_webhook_url = env.get("SLACK_WEBHOOK_URL")
+        # Optional Slack bot (scope chat:write) and channel, for messages that are edited
+        # after posting, such as live image previews. Webhooks can only post new messages.
+        self.slack_bot_token = env.get("SLACK_BOT_TOKEN")
+        self.slack_channel_id = env.get("SLACK_CHANNEL_ID")
+        self.slack_api_base = env.get("SLACK_API_BASE", DEFAULT_SLACK_API_BASE)
+
+        # TikTok app credentials and the default account's refresh token.
+        self.tiktok_client_key = env.get("TIKTOK_CLIENT_KEY")
+        self.tiktok_client_secret = env.get("TIKTOK_CLIENT_SECRET")
+        self.tiktok_refresh_token = env.get("TIKTOK_REFRESH_TOKEN")
+        # Base URL of the TikTok Open API; override it to point at a local stand-in.
+        self.tiktok_api_base = env.get("TIKTOK_API_BASE", DEFAULT_TIKTOK_API_BASE)
+
+        # Cloudflare R2. The S3 endpoint defaults to the account's R2 endpoint.
+        self.r2_account_id = env.get("R2_ACCOUNT_ID")
+        self.r2_access_key_id = env.get("R2_ACCESS_KEY_ID")
+        self.r2_secret_access_key = env.get("R2_SECRET_ACCESS_KEY")
+        self.r2_bucket_name = env.get("R2_BUCKET_NAME")
+        self.r2_public_domain = env.get("R2_PUBLIC_DOMAIN")
+        self.r2_endpoint_url = env.get("R2_ENDPOINT_URL") or (
+            f"https://{self.r2_account_id}.r2.cloudflarestorage.com" if self.r2_account_id else None
+        )
+
+    def missing(self, *names):
+        """Returns the names of the given settings that are not set, e.g. missing('tiktok_client_key')."""
+        return [name for name in names if not getattr(self, name)]
+
+    def r2_configured(self):
+        return not self.missing(
+            "r2_account_id", "r2_access_key_id", "r2_secret_access_key", "r2_bucket_name", "r2_public_domain"
+        )
+
+settings = Settings()
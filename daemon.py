@@ -0,0 +1,474 @@
+import os
+import hmac
+import html
+import json
+import time
+import signal
+import hashlib
+import secrets
+import threading
+from datetime import date, datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import accounts
+import metrics
+import post_queue
+import slack_api
+import slack_outbox
+from config import settings
+
+# --- Configuration ---
+# The daemon replaces the scheduled workflow on a machine that stays up: it generates
+# posts on its own schedule and publishes a post as soon as it is approved.
+DAEMON_HOST = os.getenv("DAEMON_HOST", "127.0.0.1")
+DAEMON_PORT = int(os.getenv("DAEMON_PORT", "8787"))
+# Base URL of the approve/reject links in Slack, e.g. a tunnel or reverse proxy to the daemon.
+DAEMON_PUBLIC_URL = os.getenv("DAEMON_PUBLIC_URL")
+# Signs the approve/reject links and authorizes the other endpoints as a bearer token.
+# Without it a random secret is used, and links stop working when the daemon restarts.
+DAEMON_SECRET = os.getenv("DAEMON_SECRET")
+# When to generate, as a cron expression (minute hour day-of-month month day-of-week), local time.
+GENERATE_SCHEDULE = os.getenv("DAEMON_GENERATE_SCHEDULE", "0 9 * * *")
+GENERATE_COUNT = int(os.getenv("DAEMON_GENERATE_COUNT", "1"))
+
+# *** 1. Cron-style schedule ***
+def parse_cron_field(text, low, high):
+    """Parses one cron field ('*', '*/15', '1-5', '0,30', '8-18/2', '5/10') into a set of values."""
+    values = set()
+    for part in text.split(","):
+        part, slash, step = part.partition("/")
+        step = int(step) if step else 1
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (int(value) for value in part.split("-", 1))
+        else:
+            # As in cron, a single value with a step ('5/10') runs to the end of the range.
+            start = int(part)
+            end = high if slash else start
+        if start < low or end > high or start > end or step < 1:
+            raise ValueError(f"'{text}' is out of range {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return values
+
+class CronSchedule:
+    """
+    A five-field cron expression: minute, hour, day of month, month, day of week
+    (0 or 7 is Sunday). As in cron, when both day fields are restricted a day
+    matches if either of them does.
+    """
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression '{expression}' needs 5 fields.")
+        self.expression = expression
+        self.minutes = parse_cron_field(fields[0], 0, 59)
+        self.hours = parse_cron_field(fields[1], 0, 23)
+        self.days = parse_cron_field(fields[2], 1, 31)
+        self.months = parse_cron_field(fields[3], 1, 12)
+        self.weekdays = {day % 7 for day in parse_cron_field(fields[4], 0, 7)}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def matches_day(self, day):
+        if day.month not in self.months:
+            return False
+        day_match = day.day in self.days
+        # datetime counts Monday as 0, cron counts Sunday as 0.
+        weekday_match = (day.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day_match and weekday_match
+        return day_match or weekday_match
+
+    def matches(self, moment):
+        return moment.minute in self.minutes and moment.hour in self.hours and self.matches_day(moment)
+
+    def next_after(self, moment):
+        """Returns the first matching minute after `moment`, or None if there is none within a year."""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        end = candidate + timedelta(days=366)
+        while candidate < end:
+            if not self.matches_day(candidate):
+                candidate = (candidate + timedelta(days=1)).replace(hour=0, minute=0)
+            elif candidate.hour not in self.hours:
+                candidate = (candidate + timedelta(hours=1)).replace(minute=0)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        return None
+
+# *** 2. The daemon ***
+class Daemon:
+    """
+    Keeps the OpenAI client, the R2 client, the encoder processes, the HTTP session
+    and the TikTok tokens warm between runs.
+
+    Generation and publishing each have their own single worker, so a publish never
+    waits for a generation, and one post is never published twice at the same time.
+    """
+
+    def __init__(self, schedule=GENERATE_SCHEDULE, count=GENERATE_COUNT, host=DAEMON_HOST, port=DAEMON_PORT,
+                 public_url=DAEMON_PUBLIC_URL, secret=DAEMON_SECRET):
+        self.schedule = CronSchedule(schedule)
+        self.count = count
+        self.host = host
+        self.port = port
+        self.public_url = (public_url or f"http://{host}:{port}").rstrip("/")
+        self.secret = (secret or secrets.token_hex(16)).encode("utf-8")
+        self.started_at = datetime.now()
+        self.stopping = threading.Event()
+        self.client = None
+        self.queue = None
+        self.server = None
+        self._generator = ThreadPoolExecutor(max_workers=1, thread_name_prefix="daemon-generate")
+        self._publisher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="daemon-publish")
+        self._lock = threading.Lock()
+        self._generating = False
+        self._publishing = set()
+        self._approved_at = {}
+        self.last_results = {}
+
+    # --- Warm-up ---
+    @metrics.timed("daemon.warmup", check_result=False)
+    def warm_up(self):
+        """Creates every client once, before any thread is started."""
+        import generate_content
+        import publish_content
+        import r2_storage
+        import renditions
+        import http_transport
+
+        # Workers are forked, so this has to happen while the process is single-threaded.
+        renditions.start_process_pool()
+        self.client = generate_content.create_openai_client()
+        self.queue = post_queue.open_queue()
+        http_transport.get_session()
+        if r2_storage.is_configured():
+            r2_storage.get_client()
+        try:
+            for account in accounts.load_accounts():
+                if not publish_content.get_access_token(account):
+                    print(f"Warning: no TikTok access token for account '{account.name}'.")
+        except ValueError as e:
+            print(f"Warning: {e}")
+
+    # --- Approval links ---
+    def sign(self, action, post_id):
+        message = f"{action}:{post_id}".encode("utf-8")
+        return hmac.new(self.secret, message, hashlib.sha256).hexdigest()[:32]
+
+    def links_for(self, post_id):
+        """Signed approve/reject links for the Slack message of a post; each opens a confirmation page."""
+        return {
+            action: f"{self.public_url}/posts/{post_id}/{action}?sig={self.sign(action, post_id)}"
+            for action in ("approve", "reject")
+        }
+
+    def is_authorized(self, action, post_id, signature, authorization):
+        if signature and post_id is not None and hmac.compare_digest(signature, self.sign(action, post_id)):
+            return True
+        token = (authorization or "").removeprefix("Bearer ").strip()
+        return bool(token) and hmac.compare_digest(token.encode("utf-8"), self.secret)
+
+    # --- Jobs ---
+    def submit_generation(self, trigger, regenerate=None):
+        """Queues a generation run unless one is already running. Returns True if queued."""
+        with self._lock:
+            if self._generating:
+                return False
+            self._generating = True
+        self._generator.submit(metrics.propagate(self._generate), trigger, regenerate)
+        return True
+
+    def _generate(self, trigger, regenerate):
+        import generate_content
+
+        try:
+            with metrics.span("daemon.generate", trigger=trigger, regenerate=regenerate) as span:
+                post_ids = generate_content.run_generation(
+                    self.client, self.count, regenerate=regenerate, queue=self.queue
+                )
+                span.set(post_ids=post_ids)
+                if not post_ids:
+                    span.fail("no posts generated")
+                elif settings.slack_webhook_url or slack_api.is_configured():
+                    generate_content.notify_pending_posts(self.queue, self.links_for)
+                self.last_results["generate"] = {"at": datetime.now().isoformat(timespec="seconds"),
+                                                 "trigger": trigger, "post_ids": post_ids}
+        except Exception as e:
+            print(f"Generation run failed: {repr(e)}")
+        finally:
+            with self._lock:
+                self._generating = False
+
+    def submit_publish(self, post_id, trigger):
+        """Queues a post for publishing unless it is already queued. Returns True if queued."""
+        with self._lock:
+            if post_id in self._publishing:
+                return False
+            self._publishing.add(post_id)
+        self._publisher.submit(metrics.propagate(self._publish), post_id, trigger)
+        return True
+
+    def _publish(self, post_id, trigger):
+        import publish_content
+
+        try:
+            post = self.queue.get(post_id)
+            if not post or post["status"] not in (post_queue.STATUS_APPROVED, post_queue.STATUS_PUBLISHING):
+                return
+            with metrics.span("daemon.publish", post_id=post_id, trigger=trigger) as span:
+                success = publish_content.publish_post(self.queue, post, accounts.load_accounts())
+                approved_at = self._approved_at.pop(post_id, None)
+                if approved_at is not None:
+                    span.set(approval_to_live_s=round(time.monotonic() - approved_at, 3))
+                if not success:
+                    span.fail()
+                self.last_results["publish"] = {"at": datetime.now().isoformat(timespec="seconds"),
+                                                "post_id": post_id, "success": success}
+        except Exception as e:
+            print(f"Publishing post {post_id} failed: {repr(e)}")
+        finally:
+            with self._lock:
+                self._publishing.discard(post_id)
+
+    def publish_due(self):
+        """
+        Publishes the earliest approved post whose scheduled date has come, if any.
+        A publish that an earlier run left in flight is finished first.
+        """
+        post = self.queue.next_due(post_queue.STATUS_PUBLISHING) or self.queue.next_due_approved()
+        if post:
+            self.submit_publish(post["id"], "schedule")
+
+    # --- Approvals ---
+    def approve(self, post_id):
+        """Approves a post and publishes it right away if it is due. Returns (HTTP status, message)."""
+        post = self.queue.get(post_id)
+        if not post:
+            return 404, f"No post with id {post_id}."
+        if post["status"] in (post_queue.STATUS_PUBLISHED, post_queue.STATUS_REJECTED, post_queue.STATUS_PUBLISHING):
+            return 409, f"Post {post_id} is already {post['status']}."
+        if post["status"] != post_queue.STATUS_APPROVED:
+            self.queue.approve(post_id)
+        if post["scheduled_date"] > date.today().isoformat():
+            return 200, f"Post {post_id} approved. It will be published on {post['scheduled_date']}."
+        self._approved_at[post_id] = time.monotonic()
+        self.submit_publish(post_id, "approval")
+        return 202, f"Post {post_id} approved. Publishing now."
+
+    def reject(self, post_id):
+        post = self.queue.get(post_id)
+        if not post:
+            return 404, f"No post with id {post_id}."
+        if post["status"] == post_queue.STATUS_PUBLISHED:
+            return 409, f"Post {post_id} is already published."
+        self.queue.reject(post_id)
+        return 200, f"Post {post_id} rejected."
+
+    def status(self):
+        next_run = self.schedule.next_after(datetime.now())
+        with self._lock:
+            generating, publishing = self._generating, sorted(self._publishing)
+        return {
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "schedule": self.schedule.expression,
+            "next_generation": next_run.isoformat(timespec="minutes") if next_run else None,
+            "generating": generating,
+            "publishing": publishing,
+            "last_results": self.last_results,
+        }
+
+    # --- Scheduler ---
+    def run_scheduler(self):
+        """Wakes up every minute to start scheduled generations and publish due posts."""
+        last = datetime.now().replace(second=0, microsecond=0)
+        while not self.stopping.wait(60 - datetime.now().second + 0.5):
+            now = datetime.now().replace(second=0, microsecond=0)
+            # Catches up on minutes skipped while the machine was asleep or busy.
+            moment = last + timedelta(minutes=1)
+            while moment <= now:
+                if self.schedule.matches(moment):
+                    self.submit_generation("schedule")
+                    break
+                moment += timedelta(minutes=1)
+            last = now
+            try:
+                self.publish_due()
+            except Exception as e:
+                print(f"Could not check for due posts: {repr(e)}")
+
+    # --- Lifecycle ---
+    def serve(self):
+        self.warm_up()
+        # Only now that the encoder workers are forked may the outbox thread start.
+        slack_outbox.flush_spool()
+        self.server = ThreadingHTTPServer((self.host, self.port), make_handler(self))
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="daemon-http", daemon=True).start()
+        threading.Thread(target=self.run_scheduler, name="daemon-scheduler", daemon=True).start()
+        print(f"Daemon listening on http://{self.host}:{self.port} (links: {self.public_url}).")
+        print(f"Generating {self.count} post(s) on '{self.schedule.expression}'; "
+              f"next run at {self.status()['next_generation']}.")
+        self.publish_due()
+        self.stopping.wait()
+        self.shutdown()
+
+    def stop(self, *_):
+        self.stopping.set()
+
+    def shutdown(self):
+        import renditions
+
+        print("Stopping the daemon; waiting for running jobs...")
+        if self.server:
+            self.server.shutdown()
+        self._generator.shutdown(wait=True)
+        self._publisher.shutdown(wait=True)
+        renditions.shutdown_process_pool()
+        print("Daemon stopped.")
+
+# *** 3. HTTP endpoints ***
+def make_handler(daemon):
+    """
+    Builds the request handler:
+        GET  /health                          status, next scheduled generation, last results
+        GET  /posts                           posts waiting for review or publishing
+        GET  /posts/<id>/approve?sig=...      confirmation page for the Slack link
+        POST /posts/<id>/approve?sig=...      approve (and publish right away if due)
+        GET  /posts/<id>/reject?sig=...       confirmation page for the Slack link
+        POST /posts/<id>/reject?sig=...       reject
+        POST /generate[?regenerate=image]     start a generation run now
+    Approve/reject accept the signed link from Slack; everything except /health also
+    accepts 'Authorization: Bearer <DAEMON_SECRET>'. Only POST changes a post: link
+    previews and link scanners fetch URLs with GET on their own, so a GET only shows a
+    page whose button sends the POST.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            print(f"[daemon] {self.address_string()} {format % args}")
+
+        def _reply(self, status, payload):
+            if isinstance(payload, str):
+                body, content_type = (payload + "\n").encode("utf-8"), "text/plain; charset=utf-8"
+            else:
+                body, content_type = json.dumps(payload, indent=2).encode("utf-8"), "application/json"
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _confirm(self, action, post_id):
+            """Replies with a page whose button POSTs the action back to the same signed URL."""
+            post = daemon.queue.get(post_id)
+            if not post:
+                return self._reply(404, f"No post with id {post_id}.")
+            label = "Approve and publish" if action == "approve" else "Reject"
+            image = post.get("image_variants", {}).get("thumbnail") or post["image_url"]
+            body = (
+                "<!doctype html><html><head><meta charset='utf-8'>"
+                "<meta name='viewport' content='width=device-width, initial-scale=1'>"
+                f"<title>{label} post {post_id}</title></head><body>"
+                f"<h1>{label} post {post_id}?</h1>"
+                f"<p>Scheduled for {html.escape(post['scheduled_date'])}, currently {html.escape(post['status'])}.</p>"
+                f"<p><img src='{html.escape(image)}' alt='' width='256'></p>"
+                f"<p>{html.escape(post['caption'])}</p>"
+                # An empty action posts to this URL, signature included.
+                f"<form method='post' action=''><button type='submit'>{label}</button></form>"
+                "</body></html>"
+            ).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            # Keeps the signed URL out of the Referer of the image request.
+            self.send_header("Referrer-Policy", "no-referrer")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _dispatch(self):
+            url = urlparse(self.path)
+            parts = [part for part in url.path.split("/") if part]
+            query = parse_qs(url.query)
+            signature = query.get("sig", [None])[0]
+            authorization = self.headers.get("Authorization")
+
+            if parts == ["health"]:
+                return self._reply(200, daemon.status())
+
+            if len(parts) == 3 and parts[0] == "posts" and parts[2] in ("approve", "reject"):
+                try:
+                    post_id = int(parts[1])
+                except ValueError:
+                    return self._reply(404, "Unknown post.")
+                if not daemon.is_authorized(parts[2], post_id, signature, authorization):
+                    return self._reply(403, "Invalid or missing signature.")
+                if self.command == "GET":
+                    return self._confirm(parts[2], post_id)
+                action = daemon.approve if parts[2] == "approve" else daemon.reject
+                return self._reply(*action(post_id))
+
+            if not daemon.is_authorized(None, None, None, authorization):
+                return self._reply(403, "Missing or invalid bearer token.")
+            if parts == ["posts"] and self.command == "GET":
+                posts = [
+                    {key: post.get(key) for key in ("id", "scheduled_date", "status", "caption", "image_url")}
+                    for status in (post_queue.STATUS_GENERATED, post_queue.STATUS_APPROVED)
+                    for post in daemon.queue.list_posts(status)
+                ]
+                return self._reply(200, posts)
+            if parts == ["generate"] and self.command == "POST":
+                import generate_content
+
+                regenerate = query.get("regenerate", [None])[0]
+                if regenerate and regenerate not in generate_content.REGENERATE_STAGES:
+                    return self._reply(400, f"regenerate must be one of: {', '.join(generate_content.REGENERATE_STAGES)}.")
+                if daemon.submit_generation("api", regenerate):
+                    return self._reply(202, "Generation started.")
+                return self._reply(409, "A generation run is already in progress.")
+            return self._reply(404, "Not found.")
+
+        def do_GET(self):
+            self._dispatch()
+
+        def do_POST(self):
+            self._dispatch()
+
+    return Handler
+
+# *** Main execution flow ***
+def main(argv=None):
+    """
+    Usage: python daemon.py [--host HOST] [--port PORT] [--schedule "0 9 * * *"] [--count N]
+    Runs until interrupted (Ctrl+C or SIGTERM), generating on the schedule and
+    publishing posts as soon as they are approved.
+    """
+    import sys
+    argv = sys.argv[1:] if argv is None else argv
+    options = {"--host": DAEMON_HOST, "--port": DAEMON_PORT, "--schedule": GENERATE_SCHEDULE, "--count": GENERATE_COUNT}
+    i = 0
+    while i < len(argv):
+        if argv[i] not in options or i + 1 >= len(argv):
+            print(main.__doc__)
+            exit(1)
+        options[argv[i]] = argv[i + 1]
+        i += 2
+
+    try:
+        daemon = Daemon(options["--schedule"], int(options["--count"]), options["--host"], int(options["--port"]))
+    except ValueError as e:
+        print(f"Error: {e}")
+        exit(1)
+    if not DAEMON_SECRET:
+        print("Warning: DAEMON_SECRET is not set; approval links will stop working when the daemon restarts.")
+    signal.signal(signal.SIGTERM, daemon.stop)
+    signal.signal(signal.SIGINT, daemon.stop)
+    daemon.serve()
+
+if __name__ == "__main__":
+    main()
@@ -1,53 +1,187 @@
 import os
-import requests
-import openai
+import time
+import threading
 import json
 import base64
-import boto3
-from botocore.exceptions import ClientError
-from dotenv import load_dotenv
-from datetime import datetime
-
-# Load environment variables from .env file
-load_dotenv()
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+import renditions
+import r2_storage
+import post_queue
+import scene_index
+import scene_bank
+import stage_cache
+import metrics
+import rate_limiter
+import resilience
+import slack_api
+import slack_outbox
+from config import settings
 
 # *** 1. Configure API keys and tokens ***
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-SLACK_WEBHOOK_URL = os.getenv("SLACK_WEBHOOK_URL")
+# Keys and endpoints come from config.settings. The openai SDK is imported only by
+# the code that calls it, so '--slack-only' starts without loading it.
+
+# Batch mode setting: how many posts may be in flight at the same time.
+DEFAULT_CONCURRENCY = int(os.getenv("GENERATION_CONCURRENCY", "4"))
+# How many times a near-duplicate scene is re-rolled before it is accepted anyway.
+MAX_REROLLS = int(os.getenv("SCENE_MAX_REROLLS", "3"))
+# Images per post. Above 1 every post is a photo carousel: one scene description is
+# expanded into related scenes whose images are generated and uploaded in parallel.
+CAROUSEL_SIZE = int(os.getenv("CAROUSEL_SIZE", "1"))
+# TikTok accepts at most 35 images in one photo post.
+MAX_CAROUSEL_SIZE = 35
+# Live previews: with IMAGE_PARTIAL_IMAGES set to 1-3, gpt-image-1 streams that many
+# low-fidelity frames before the final image, and each one is shown in a Slack message
+# that the approval request later replaces. Needs SLACK_BOT_TOKEN and SLACK_CHANNEL_ID.
+PARTIAL_IMAGES = min(3, int(os.getenv("IMAGE_PARTIAL_IMAGES", "0")))
+# Scene bank: with SCENE_BANK_SIZE set (e.g. 14), one chat call writes that many posts'
+# scenes, captions and hashtags at once. They are kept in the scene bank and each run
+# takes the next one, so most days need no text call at all. When fewer than
+# SCENE_BANK_REFILL_BELOW are left, the bank is refilled in the background.
+SCENE_BANK_SIZE = int(os.getenv("SCENE_BANK_SIZE", "0"))
+SCENE_BANK_REFILL_BELOW = max(1, int(os.getenv("SCENE_BANK_REFILL_BELOW", "3")))
+# Stages that can be redone on their own with --regenerate.
+REGENERATE_STAGES = ("text", "caption", "image")
+
+# Model settings. They are part of the stage cache keys, so changing any of
+# them automatically invalidates the cached results of that stage.
+TEXT_MODEL = "gpt-4o-mini"
+TEXT_TEMPERATURE = 0.8
+IMAGE_MODEL = "gpt-image-1"
+IMAGE_SIZE = "1024x1024"
+IMAGE_QUALITY = "medium"
+# With a draft quality such as 'low', posts are generated with cheap, fast draft images
+# for approval, and only an approved post is rendered at IMAGE_QUALITY (see
+# finalize_draft). Empty means every post is rendered at IMAGE_QUALITY right away.
+IMAGE_DRAFT_QUALITY = os.getenv("IMAGE_DRAFT_QUALITY", "")
+
+# Tail-latency control (see resilience.py). A text call may take OPENAI_TEXT_DEADLINE
+# seconds and an image request OPENAI_IMAGE_DEADLINE, retries included.
+TEXT_DEADLINE = float(os.getenv("OPENAI_TEXT_DEADLINE", "60"))
+IMAGE_DEADLINE = float(os.getenv("OPENAI_IMAGE_DEADLINE", "180"))
+# With a percentile such as 90, an image request slower than 90% of recent ones gets a
+# hedged twin and the first to finish wins. The twin is billed too, so this buys a
+# bounded tail with a few extra images. 0 turns hedging off.
+IMAGE_HEDGE_PERCENTILE = float(os.getenv("OPENAI_IMAGE_HEDGE_PERCENTILE", "0"))
+# Used when an image request failed or the circuit of the image endpoint is open.
+# gpt-image-1 has no smaller square size, so the fallback lowers the quality only.
+# An empty value turns the fallback off.
+IMAGE_FALLBACK_QUALITY = os.getenv("IMAGE_FALLBACK_QUALITY", "low")
+IMAGE_FALLBACK_DEADLINE = float(os.getenv("OPENAI_IMAGE_FALLBACK_DEADLINE", "90"))
 
-# Cloudflare R2 credentials from environment
-R2_ACCOUNT_ID = os.getenv("R2_ACCOUNT_ID")
-R2_ACCESS_KEY_ID = os.getenv("R2_ACCESS_KEY_ID")
-R2_SECRET_ACCESS_KEY = os.getenv("R2_SECRET_ACCESS_KEY")
-R2_BUCKET_NAME = os.getenv("R2_BUCKET_NAME")
-R2_PUBLIC_DOMAIN = os.getenv("R2_PUBLIC_DOMAIN")
+SCENE_SYSTEM_PROMPT = (
+    "You are an AI assistant that generates creative ideas for 'Dreamy Monotone Worlds' illustrations. "
+    "Your goal is to create a unique, whimsical, and peaceful scene description each day for a bedtime-themed post. "
+    "The scenes should be minimalist and imaginative. Think about animals, magical objects, or serene landscapes. "
+    "Avoid repeating subjects. Be creative and diverse. "
+    "Alongside the scene, create a short, motivational caption with a calm, dreamy tone. "
+    "Finally, provide a string of 5-7 relevant hashtags, starting with a # and separated by spaces (e.g., '#aiart #dreamy #illustration #animation #digitalart')."
+    "You must respond ONLY in JSON format with three keys: 'description', 'caption', and 'hashtags'."
+)
+
+SCENE_BANK_SYSTEM_PROMPT = (
+    "You are an AI assistant that generates creative ideas for 'Dreamy Monotone Worlds' illustrations. "
+    "You plan the posts of the coming days in advance: each one a unique, whimsical, and peaceful scene "
+    "description for a bedtime-themed post. The scenes should be minimalist and imaginative. Think about "
+    "animals, magical objects, or serene landscapes. Every scene must have a different subject and setting. "
+    "For each scene, create a short, motivational caption with a calm, dreamy tone, and a string of 5-7 relevant "
+    "hashtags, starting with a # and separated by spaces (e.g., '#aiart #dreamy #illustration #animation #digitalart'). "
+    "You must respond ONLY in JSON format with one key, 'posts', holding a list of objects with three keys: "
+    "'description', 'caption', and 'hashtags'."
+)
+
+CAPTION_SYSTEM_PROMPT = (
+    "You write captions for 'Dreamy Monotone Worlds', a bedtime-themed illustration account. "
+    "Given a scene description, create a short, motivational caption with a calm, dreamy tone, "
+    "and a string of 5-7 relevant hashtags, starting with a # and separated by spaces. "
+    "You must respond ONLY in JSON format with two keys: 'caption' and 'hashtags'."
+)
+
+CAROUSEL_SYSTEM_PROMPT = (
+    "You plan photo carousels for 'Dreamy Monotone Worlds', a bedtime-themed illustration account. "
+    "Given the opening scene of a carousel, continue it with more scene descriptions: the same world, "
+    "main subject and palette, each one a different calm moment or viewpoint, in a gentle order. "
+    "You must respond ONLY in JSON format with one key, 'scenes', holding a list of scene descriptions."
+)
+
+def create_openai_client():
+    """
+    Imports the openai SDK and returns a client for the configured key and base URL.
+    The client never retries: resilience.call_with_deadline does, and stops at the deadline.
+    """
+    import openai
+
+    return openai.OpenAI(api_key=settings.openai_api_key, base_url=settings.openai_base_url, max_retries=0)
+
+def retryable_openai_errors():
+    """The SDK errors a request is sent again on: connection problems, rate limits and 5xx."""
+    import openai
+
+    return (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+def call_openai(endpoint, method, deadline=None, hedge_percentile=None, **params):
+    """
+    Calls a `with_raw_response` OpenAI SDK method through the rate limiter of `endpoint`
+    ('openai.chat' or 'openai.images') and returns the parsed response.
+    The raw response's rate-limit headers are fed back to the limiter, and its token
+    usage, SDK retries and size are added to the active metrics span.
+    With `deadline`, resilience.DeadlineExceeded is raised when no response came within
+    that many seconds of the request going out (time spent waiting for a rate-limiter
+    slot does not count), and `hedge_percentile` sends a hedged second request once the
+    first is slower than that percentile of recent calls.
+    """
+    import openai
+
+    limiter = rate_limiter.get_limiter(endpoint)
+
+    def call(timeout=None):
+        # The caller holds the limiter slot of this request.
+        try:
+            raw_response = method(**params, **({"timeout": timeout} if timeout else {}))
+        except openai.RateLimitError as e:
+            limiter.observe(429, e.response.headers)
+            raise
+        limiter.observe(raw_response.status_code, raw_response.headers)
+        response = raw_response.parse()
+        metrics.add_usage(getattr(response, "usage", None))
+        metrics.add_bytes(len(raw_response.content))
+        return response
+
+    if deadline is None:
+        with limiter.slot():
+            return call()
+    tracker = resilience.get_tracker(endpoint) if hedge_percentile else None
+    hedge_after = tracker.percentile(hedge_percentile) if tracker else None
+    return resilience.call_with_deadline(call, deadline, endpoint, hedge_after, tracker, limiter,
+                                         retryable_openai_errors())
 
 # *** 2. Generate daily prompt and caption using GPT-4o ***
-def generate_prompt_and_caption(client):
+@metrics.timed("generate.text")
+def generate_prompt_and_caption(client, avoid=None):
     """
     Calls GPT-4o to get a new scene, caption, and hashtags.
+    'avoid' is an optional list of past texts the new scene must not repeat.
     """
     print("Generating scene, caption, and hashtags with GPT-4o...")
-    system_msg = (
-        "You are an AI assistant that generates creative ideas for 'Dreamy Monotone Worlds' illustrations. "
-        "Your goal is to create a unique, whimsical, and peaceful scene description each day for a bedtime-themed post. "
-        "The scenes should be minimalist and imaginative. Think about animals, magical objects, or serene landscapes. "
-        "Avoid repeating subjects. Be creative and diverse. "
-        "Alongside the scene, create a short, motivational caption with a calm, dreamy tone. "
-        "Finally, provide a string of 5-7 relevant hashtags, starting with a # and separated by spaces (e.g., '#aiart #dreamy #illustration #animation #digitalart')."
-        "You must respond ONLY in JSON format with three keys: 'description', 'caption', and 'hashtags'."
-    )
+    system_msg = SCENE_SYSTEM_PROMPT
     user_msg = "Please generate a new scene description, a caption, and hashtags for today's post."
+    if avoid:
+        avoided = "\n".join(f"- {text}" for text in avoid)
+        user_msg += f" It must be clearly different from these earlier posts:\n{avoided}"
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
+        response = call_openai(
+            "openai.chat",
+            client.chat.completions.with_raw_response.create,
+            deadline=TEXT_DEADLINE,
+            model=TEXT_MODEL,
             messages=[
                 {"role": "system", "content": system_msg},
                 {"role": "user", "content": user_msg}
             ],
             response_format={"type": "json_object"},
-            temperature=0.8
+            temperature=TEXT_TEMPERATURE
         )
         content = response.choices[0].message.content
         print("Successfully got response from GPT-4o.")
@@ -67,204 +201,997 @@ def generate_prompt_and_caption(client):
         print(f"Failed to parse GPT-4o output. Error: {e}\nRaw content: {content}")
         return None, None, None
 
-# *** 3. Use gpt-image-1 to generate an image and save it to a file ***
-def generate_image_file(client, description):
+@metrics.timed("generate.caption")
+def generate_caption_for_description(client, description):
     """
-    Calls gpt-image-1, decodes the base64 response, and saves it to a file.
-    Returns the path to the saved image.
+    Calls GPT-4o to write a new caption and hashtags for an existing scene description.
+    Returns (caption, hashtags), or (None, None) on failure.
     """
-    # Generate a dynamic filename with the current date
-    current_date = datetime.now().strftime("%Y-%m-%d")
-    output_path = f"{current_date}-pending_image.png"
+    print("Generating a new caption and hashtags with GPT-4o...")
+    try:
+        response = call_openai(
+            "openai.chat",
+            client.chat.completions.with_raw_response.create,
+            deadline=TEXT_DEADLINE,
+            model=TEXT_MODEL,
+            messages=[
+                {"role": "system", "content": CAPTION_SYSTEM_PROMPT},
+                {"role": "user", "content": f"Scene description: {description}"}
+            ],
+            response_format={"type": "json_object"},
+            temperature=TEXT_TEMPERATURE
+        )
+        content = response.choices[0].message.content
+    except Exception as e:
+        print(f"Error calling OpenAI API for caption generation: {e}")
+        return None, None
 
-    print("Generating image with gpt-image-1...")
-    style_description = (
-        f"A whimsical digital illustration of: {description}. "
-        "Style: minimalist, clean, flat vector art. "
-        "Palette: calming, monotone, shades of deep color and soft, glowing bright colors."
-        "Mood: cozy, serene, dreamlike, perfect for a bedtime story. Centered composition."
-    )
-    
     try:
-        response = client.images.generate(
-            model="gpt-image-1",
-            prompt=style_description,
-            n=1,
-            size="1024x1024",
-            quality="medium",
+        result = json.loads(content)
+        caption = result.get("caption", "").strip()
+        hashtags = result.get("hashtags", "").strip()
+        if not caption or not hashtags:
+            raise ValueError("Missing 'caption' or 'hashtags' in GPT-4o response.")
+        return caption, hashtags
+    except (json.JSONDecodeError, ValueError) as e:
+        print(f"Failed to parse GPT-4o output. Error: {e}\nRaw content: {content}")
+        return None, None
+
+@metrics.timed("generate.scenes")
+def generate_carousel_scenes(client, description, count):
+    """
+    Calls GPT-4o to continue a scene description with count - 1 related scenes.
+    Returns the list of `count` descriptions, the original one first, or None on failure.
+    """
+    print(f"Planning a {count}-image carousel with GPT-4o...")
+    try:
+        response = call_openai(
+            "openai.chat",
+            client.chat.completions.with_raw_response.create,
+            deadline=TEXT_DEADLINE,
+            model=TEXT_MODEL,
+            messages=[
+                {"role": "system", "content": CAROUSEL_SYSTEM_PROMPT},
+                {"role": "user", "content": f"Opening scene: {description}\nWrite {count - 1} more scenes."}
+            ],
+            response_format={"type": "json_object"},
+            temperature=TEXT_TEMPERATURE
         )
-        
-        b64_data = response.data[0].b64_json
-        image_bytes = base64.b64decode(b64_data)
-        
-        with open(output_path, "wb") as f:
-            f.write(image_bytes)
-            
-        print(f"Image saved successfully to {output_path}")
-        return output_path
+        content = response.choices[0].message.content
     except Exception as e:
-        print(f"Error calling gpt-image-1 API for image generation. Details: {repr(e)}")
+        print(f"Error calling OpenAI API for carousel scenes: {e}")
         return None
 
-# *** 4. Upload image to Cloudflare R2 ***
-def upload_image_to_r2(image_path):
+    try:
+        scenes = [str(scene).strip() for scene in json.loads(content).get("scenes", []) if str(scene).strip()]
+        if len(scenes) < count - 1:
+            raise ValueError(f"Expected {count - 1} scenes, got {len(scenes)}.")
+        return [description] + scenes[:count - 1]
+    except (json.JSONDecodeError, ValueError, AttributeError) as e:
+        print(f"Failed to parse GPT-4o output. Error: {e}\nRaw content: {content}")
+        return None
+
+@metrics.timed("generate.scene_bank")
+def generate_scene_bank(client, count, avoid=None):
     """
-    Uploads the specified image file to a Cloudflare R2 bucket.
-    Returns the public URL of the uploaded image.
+    Calls GPT-4o once for `count` posts' scenes, captions and hashtags.
+    'avoid' is an optional list of scenes the new ones must not repeat.
+    Returns the list of entries as returned by the model (see validate_bank_entries), or None on failure.
     """
-    print("Verifying Cloudflare R2 credentials...")
-    if not all([R2_ACCOUNT_ID, R2_ACCESS_KEY_ID, R2_SECRET_ACCESS_KEY, R2_BUCKET_NAME, R2_PUBLIC_DOMAIN]):
-        print("Error: Missing one or more Cloudflare R2 environment variables. Please check repository secrets.")
+    print(f"Writing {count} scenes for the scene bank with GPT-4o...")
+    user_msg = f"Write {count} new posts."
+    if avoid:
+        avoided = "\n".join(f"- {text}" for text in avoid)
+        user_msg += f" They must be clearly different from these planned posts:\n{avoided}"
+    try:
+        response = call_openai(
+            "openai.chat",
+            client.chat.completions.with_raw_response.create,
+            deadline=TEXT_DEADLINE,
+            model=TEXT_MODEL,
+            messages=[
+                {"role": "system", "content": SCENE_BANK_SYSTEM_PROMPT},
+                {"role": "user", "content": user_msg}
+            ],
+            response_format={"type": "json_object"},
+            temperature=TEXT_TEMPERATURE
+        )
+        content = response.choices[0].message.content
+    except Exception as e:
+        print(f"Error calling OpenAI API for the scene bank: {e}")
         return None
 
     try:
-        # Construct the R2 endpoint URL
-        r2_endpoint_url = f"https://{R2_ACCOUNT_ID}.r2.cloudflarestorage.com"
-        
-        print("Connecting to Cloudflare R2...")
-        # Create a boto3 client for R2
-        s3_client = boto3.client(
-            service_name='s3',
-            endpoint_url=r2_endpoint_url,
-            aws_access_key_id=R2_ACCESS_KEY_ID,
-            aws_secret_access_key=R2_SECRET_ACCESS_KEY,
-            region_name='auto', # Required by boto3, 'auto' is fine for R2
+        posts = json.loads(content).get("posts")
+        if not isinstance(posts, list):
+            raise ValueError("Missing 'posts' list in GPT-4o response.")
+        return posts
+    except (json.JSONDecodeError, ValueError, AttributeError) as e:
+        print(f"Failed to parse GPT-4o output. Error: {e}\nRaw content: {content}")
+        return None
+
+def validate_bank_entries(entries, index=None, planned=()):
+    """
+    Keeps the entries that have a description, a caption and 5-10 hashtags, and that
+    are not near-duplicates of each other, of the `planned` (unused) bank entries, or
+    of a past post in the scene index. Returns the cleaned entries.
+    """
+    valid = []
+    seen = [scene_index.shingles(entry["description"]) for entry in planned]
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        description, caption, hashtags = (str(entry.get(key) or "").strip() for key in ("description", "caption", "hashtags"))
+        tags = hashtags.split()
+        if not description or not caption or not 5 <= len(tags) <= 10 or not all(tag.startswith("#") for tag in tags):
+            continue
+        shingle_set = scene_index.shingles(description)
+        if any(scene_index.jaccard(shingle_set, other) >= scene_index.SIMILARITY_THRESHOLD for other in seen):
+            continue
+        if index and (index.find_similar("description", description) or index.find_similar("caption", caption)):
+            continue
+        seen.append(shingle_set)
+        valid.append({"description": description, "caption": caption, "hashtags": " ".join(tags)})
+    return valid
+
+# Entries written under another prompt or model are not used, like stale cache entries.
+SCENE_BANK_SOURCE = stage_cache.cache_key(
+    "scene_bank", model=TEXT_MODEL, temperature=TEXT_TEMPERATURE, prompt=SCENE_BANK_SYSTEM_PROMPT
+)
+_bank_refill_lock = threading.Lock()
+_bank_refill_thread = None
+# Counts finished refills, so a thread that waited for another one's refill knows it
+# happened, and whether the last one added any entries.
+_bank_refills = 0
+_bank_refill_added = 0
+# How often one post waits for a refill before it gives up on the bank.
+MAX_BANK_REFILL_WAITS = 3
+
+def refill_scene_bank(client, bank, index=None):
+    """
+    Adds up to SCENE_BANK_SIZE new entries to the bank with one text call, unless it
+    still holds SCENE_BANK_REFILL_BELOW or more. A thread that finds another one
+    refilling waits for that refill and makes no call of its own, even if it failed.
+    Returns True if the bank has entries or the refill (its own or the awaited one)
+    added some, which other threads may already have taken; False if it failed.
+    """
+    global _bank_refills, _bank_refill_added
+    seen = _bank_refills
+    with _bank_refill_lock:
+        planned = bank.unused(SCENE_BANK_SOURCE)
+        if _bank_refills != seen:
+            return bool(planned) or _bank_refill_added > 0
+        if len(planned) >= SCENE_BANK_REFILL_BELOW:
+            return True
+        _bank_refill_added = 0
+        try:
+            entries = generate_scene_bank(client, SCENE_BANK_SIZE, [entry["description"] for entry in planned])
+            valid = validate_bank_entries(entries or [], index, planned)
+            if entries and len(valid) < len(entries):
+                print(f"Dropped {len(entries) - len(valid)} invalid or repeated scene(s).")
+            bank.add(valid, SCENE_BANK_SOURCE)
+            _bank_refill_added = len(valid)
+        finally:
+            _bank_refills += 1
+        print(f"Added {len(valid)} scene(s) to the scene bank; {len(planned) + len(valid)} unused.")
+        return len(planned) + len(valid) > 0
+
+def refill_scene_bank_in_background(client, bank, index=None):
+    """Starts refill_scene_bank() on a background thread unless one is already running."""
+    global _bank_refill_thread
+    if _bank_refill_thread and _bank_refill_thread.is_alive():
+        return
+    _bank_refill_thread = threading.Thread(
+        target=metrics.propagate(refill_scene_bank), args=(client, bank, index), name="scene-bank-refill", daemon=True
+    )
+    _bank_refill_thread.start()
+
+def wait_for_scene_bank_refill():
+    """Waits for a background refill, so a run never exits half-way through one."""
+    if _bank_refill_thread:
+        _bank_refill_thread.join()
+
+def take_from_scene_bank(client, bank, index=None):
+    """
+    Takes the next unused scene bank entry that is not a near-duplicate of a past post,
+    refilling the bank first if it is empty, or waiting for the refill another batch
+    worker is running. Accepted texts are added to the index.
+    Returns (description, caption, hashtags), or (None, None, None) if the bank stays empty.
+    """
+    waits = 0
+    while True:
+        entry = bank.take(SCENE_BANK_SOURCE)
+        if entry is None:
+            # Other workers may take the new entries first; only a failed refill ends the wait.
+            if waits >= MAX_BANK_REFILL_WAITS or not refill_scene_bank(client, bank, index):
+                return None, None, None
+            waits += 1
+            continue
+        match = index.check_and_add(entry["description"], entry["caption"]) if index else None
+        if match:
+            print(f"Skipping a banked scene similar to an earlier post: '{match['text']}'.")
+            continue
+        break
+    print("Using the next scene from the scene bank.")
+    metrics.set_attrs(text_source="scene_bank")
+    if len(bank.unused(SCENE_BANK_SOURCE)) < SCENE_BANK_REFILL_BELOW:
+        refill_scene_bank_in_background(client, bank, index)
+    return entry["description"], entry["caption"], entry["hashtags"]
+
+# *** 3. Use gpt-image-1 to generate an image ***
+def build_image_prompt(description):
+    """Wraps a scene description in the fixed illustration style of the account."""
+    return (
+        f"A whimsical digital illustration of: {description}. "
+        "Style: minimalist, clean, flat vector art. "
+        "Palette: calming, monotone, shades of deep color and soft, glowing bright colors."
+        "Mood: cozy, serene, dreamlike, perfect for a bedtime story. Centered composition."
+    )
+
+def stream_image_b64(client, params, on_partial):
+    """
+    Streams an image generation and passes every partial frame to on_partial(index, png_bytes)
+    as soon as it arrives. Like call_openai(), it feeds the response headers back to the
+    'openai.images' limiter; the caller holds the limiter slot (see request_image).
+    Returns the base64 of the final image.
+    """
+    import openai
+
+    limiter = rate_limiter.get_limiter("openai.images")
+    start = time.perf_counter()
+    b64_data = None
+    try:
+        raw_response = client.images.with_raw_response.generate(
+            stream=True, partial_images=PARTIAL_IMAGES, **params
         )
+    except openai.RateLimitError as e:
+        limiter.observe(429, e.response.headers)
+        raise
+    limiter.observe(raw_response.status_code, raw_response.headers)
+    for event in raw_response.parse():
+        metrics.add_bytes(len(event.b64_json or ""))
+        if event.type == "image_generation.partial_image":
+            if event.partial_image_index == 0:
+                metrics.set_attrs(first_partial_s=round(time.perf_counter() - start, 3))
+            on_partial(event.partial_image_index, base64.b64decode(event.b64_json))
+        elif event.type == "image_generation.completed":
+            metrics.add_usage(event.usage)
+            b64_data = event.b64_json
+    if b64_data is None:
+        raise ValueError("The image stream ended without a completed image.")
+    return b64_data
 
-        image_filename = os.path.basename(image_path)
-        print(f"Uploading '{image_filename}' to R2 bucket '{R2_BUCKET_NAME}'...")
+def request_image(client, params, deadline, hedge_percentile=None, on_partial=None):
+    """
+    Sends one image request, streamed when `on_partial` is given, and waits for it at
+    most `deadline` seconds. Returns the base64 of the image; raises on failure.
+    """
+    if on_partial and PARTIAL_IMAGES > 0:
+        # Streams are never hedged: two sets of partial frames would race in the preview.
+        return resilience.call_with_deadline(
+            lambda timeout: stream_image_b64(client, dict(params, timeout=timeout), on_partial), deadline,
+            "openai.images", limiter=rate_limiter.get_limiter("openai.images"), retry_on=retryable_openai_errors()
+        )
+    response = call_openai(
+        "openai.images", client.images.with_raw_response.generate, deadline, hedge_percentile, **params
+    )
+    # Only the base64 text leaves this function, so the response is dropped before decoding.
+    return response.data[0].b64_json
 
-        # Upload the file
-        with open(image_path, "rb") as f:
-            s3_client.upload_fileobj(
-                f,
-                R2_BUCKET_NAME,
-                image_filename,
-                ExtraArgs={'ContentType': 'image/png'}
-            )
-        
-        # Construct the final public URL
-        public_url = f"https://{R2_PUBLIC_DOMAIN}/{image_filename}"
-        print(f"✅ Successfully uploaded to R2. Public URL: {public_url}")
-        return public_url
-
-    except ClientError as e:
-        # Catch specific boto3 client errors for better diagnostics
-        error_code = e.response.get("Error", {}).get("Code")
-        print(f"A client-side error occurred: {error_code}. Check your credentials and bucket settings.")
-        print(f"Full error: {repr(e)}")
-        return None
-    except Exception as e:
-        print(f"An unexpected error occurred during R2 upload: {repr(e)}")
+@metrics.timed("generate.image")
+def generate_image_bytes(client, description, on_partial=None, quality=IMAGE_QUALITY, prompt=None, fallback=True):
+    """
+    Calls gpt-image-1 and decodes the base64 response in memory. `prompt` is the full
+    image prompt; by default it is built from the scene `description`.
+    With `on_partial` and IMAGE_PARTIAL_IMAGES set, the image is streamed and
+    on_partial(index, png_bytes) gets every partial frame (see stream_image_b64).
+    If the request fails or misses its deadline, or the circuit of the endpoint is
+    open after repeated failures, one request at IMAGE_FALLBACK_QUALITY is made instead,
+    unless `fallback` is False: then the image is at `quality` or there is none.
+    Returns (PNG bytes, the quality they were rendered at), or (None, None) on failure.
+    """
+    print("Generating image with gpt-image-1...")
+    params = dict(
+        model=IMAGE_MODEL,
+        prompt=prompt or build_image_prompt(description),
+        n=1,
+        size=IMAGE_SIZE,
+        quality=quality,
+    )
+
+    b64_data = None
+    breaker = resilience.get_breaker("openai.images")
+    if breaker.allow():
+        try:
+            b64_data = request_image(client, params, IMAGE_DEADLINE, IMAGE_HEDGE_PERCENTILE, on_partial)
+            breaker.record_success()
+        except Exception as e:
+            breaker.record_failure()
+            print(f"Error calling gpt-image-1 API for image generation. Details: {repr(e)}")
+    else:
+        print("gpt-image-1 keeps failing; skipping straight to the fallback quality." if fallback
+              else "gpt-image-1 keeps failing; not trying again until its circuit closes.")
+        metrics.set_attrs(circuit="open")
+
+    if b64_data is None and fallback and IMAGE_FALLBACK_QUALITY and IMAGE_FALLBACK_QUALITY != quality:
+        print(f"Generating the image at '{IMAGE_FALLBACK_QUALITY}' quality instead...")
+        metrics.set_attrs(fallback_quality=IMAGE_FALLBACK_QUALITY)
+        try:
+            b64_data = request_image(client, dict(params, quality=IMAGE_FALLBACK_QUALITY), IMAGE_FALLBACK_DEADLINE)
+            quality = IMAGE_FALLBACK_QUALITY
+        except Exception as e:
+            print(f"The fallback image request failed too. Details: {repr(e)}")
+    if b64_data is None:
+        return None, None
+
+    image_bytes = base64.b64decode(b64_data)
+    print(f"Image generated successfully ({len(image_bytes)} bytes).")
+    return image_bytes, quality
+
+# *** 4. Upload image to Cloudflare R2 ***
+# The client, transfer settings and object keys live in r2_storage.
+@metrics.timed("r2.upload_variants")
+def upload_variants_to_r2(variants):
+    """
+    Uploads every rendered variant to R2 in parallel, each under its content-hash key,
+    skipping variants that are already in the bucket.
+    Returns a dict mapping the variant name to its public URL, or None if any upload failed.
+    """
+    items = {}
+    for name, data in variants.items():
+        spec = renditions.RENDITIONS[name]
+        items[name] = (data, spec["extension"], spec["content_type"])
+    return r2_storage.upload_many(items)
+
+def render_and_upload(image_bytes):
+    """
+    Renders the compressed variants of an image and uploads them to R2 in parallel.
+    Returns a dict mapping each variant name to its public URL, or None on failure.
+    """
+    variants = renditions.render_all(image_bytes)
+    if variants is None:
         return None
+    return upload_variants_to_r2(variants)
+
+def save_local_copy(image_bytes, path):
+    """Writes the original PNG to disk for debugging (--keep-local)."""
+    with open(path, "wb") as f:
+        f.write(image_bytes)
+    print(f"Kept a local copy of the image at {path}")
 
-# *** 5. Save content to a file for the publishing workflow ***
-def save_content_for_approval(image_url, caption, hashtags):
+# *** 5. Save content to the post queue for the publishing workflow ***
+@metrics.timed("queue.save")
+def save_content_for_approval(image_url, caption, hashtags, image_variants=None, description=None,
+                              scheduled_date=None, queue=None, image_urls=None, thumbnail_urls=None,
+                              slack_message=None, draft=None):
     """
-    Saves the generated content metadata to a JSON file.
-    The key is now 'image_url' instead of 'image_path'.
+    Saves the generated content to the post queue as a 'generated' post.
+    'image_variants' maps every uploaded rendition (e.g. 'full', 'thumbnail') to its URL.
+    For a carousel, 'image_urls' and 'thumbnail_urls' list every image in order;
+    'image_url' is the first one, the cover. 'slack_message' is the post's live
+    preview message, which the approval request will replace. 'draft' records the
+    quality and exact prompts of draft images (see finalize_draft).
+    A new post replaces any unapproved post already generated for the same date.
+    Returns the id of the queued post.
     """
-    print("Saving content metadata to pending_post.json...")
-    content = {
-        "image_url": image_url,
-        "caption": caption,
-        "hashtags": hashtags
-    }
-    with open("pending_post.json", "w") as f:
-        json.dump(content, f, indent=4)
-    print("Content metadata saved.")
+    queue = queue or post_queue.open_queue()
+    scheduled_date = scheduled_date or date.today().isoformat()
+    print(f"Saving content to the post queue for {scheduled_date}...")
+    extra = {"image_variants": image_variants} if image_variants else {}
+    if image_urls and len(image_urls) > 1:
+        extra.update(image_urls=image_urls, thumbnail_urls=thumbnail_urls or [])
+    if slack_message:
+        extra["slack_message"] = slack_message
+    if draft:
+        extra["draft"] = draft
+    extra = extra or None
+    post_id = queue.add_post(
+        image_url, caption, hashtags, description=description, scheduled_date=scheduled_date, extra=extra
+    )
+    print(f"Content saved as post {post_id}.")
+    return post_id
 
 # *** 6. Send a Slack notification asking for approval ***
-def send_approval_request_to_slack(image_url, caption, hashtags):
+@metrics.timed("slack.approval")
+def send_approval_request_to_slack(image_url, caption, hashtags, thumbnail_url=None, links=None,
+                                   image_urls=None, thumbnail_urls=None, slack_message=None, draft=False):
     """
-    Sends a notification to Slack with a direct link to the published image.
+    Queues a notification to Slack with a direct link to the published image.
+    When a thumbnail URL is given, it is shown inline as a preview. For a carousel,
+    `image_urls` and `thumbnail_urls` list every image in order. `links` maps
+    'approve' and 'reject' to approval-page URLs (see daemon.py); without them the message
+    explains how to approve through the workflow. With a Slack bot configured, the
+    request replaces the post's live preview `slack_message` (see LivePreview). With
+    `draft`, the message says that the images are drafts.
+    The message is sent in the background by slack_outbox, which combines the requests
+    of a batch into one digest. Returns True once it is queued.
     """
-    print("Sending Slack notification for approval...")
+    print("Queueing Slack notification for approval...")
 
     if not image_url:
         image_url = "https://via.placeholder.com/512.png?text=Image+Upload+Failed"
         
+    if links:
+        instructions = (
+            f"✅ <{links['approve']}|Approve and publish>\n"
+            f"❌ <{links['reject']}|Reject>"
+        )
+    else:
+        instructions = (
+            f"To proceed, go to your repository's *Actions* tab, click on the *'Daily TikTok Post Workflow'*, and run it manually.\n"
+            f"🔹 Choose `publish` to post this content to TikTok.\n"
+            f"🔹 Choose `regenerate` to discard this version and create a new one."
+        )
+    if image_urls and len(image_urls) > 1:
+        numbered = "\n".join(f"{i}. {url}" for i, url in enumerate(image_urls, start=1))
+        image_text = f"This is a {len(image_urls)}-image carousel. To view the images, visit these URLs:\n{numbered}"
+    else:
+        image_text = f"To view the image, visit this URL:\n{image_url}"
+    if draft:
+        image_text += "\n\n🖼️ _This is a quick draft. The full-quality image is rendered from the same prompt when you approve, so details can differ._"
     message_text = (
         f"✨ *New Post Ready for Approval* ✨\n\n"
         f"*Caption:*\n{caption}\n\n"
         f"*Hashtags:*\n`{hashtags}`\n\n"
-        f"To view the image, visit this URL:\n{image_url}\n\n"
-        f"To proceed, go to your repository's *Actions* tab, click on the *'Daily TikTok Post Workflow'*, and run it manually.\n"
-        f"🔹 Choose `publish` to post this content to TikTok.\n"
-        f"🔹 Choose `regenerate` to discard this version and create a new one."
+        f"{image_text}\n\n"
+        f"{instructions}"
     )
 
-    slack_payload = { "text": message_text }
-    
+    blocks = None
+    previews = [url for url in (thumbnail_urls or [thumbnail_url]) if url]
+    if previews:
+        # 'text' remains the fallback for notifications; the blocks add inline previews.
+        blocks = [{"type": "section", "text": {"type": "mrkdwn", "text": message_text}}] + [
+            {"type": "image", "image_url": url, "alt_text": caption[:2000]} for url in previews
+        ]
+
+    if slack_api.is_configured() and slack_message:
+        # Each preview is its own message, so these updates are never combined.
+        slack_outbox.send("update", message_text, blocks, target=slack_message)
+    elif slack_api.is_configured() and not settings.slack_webhook_url:
+        slack_outbox.send("post", message_text, blocks, digest="approval")
+    else:
+        slack_outbox.send("webhook", message_text, blocks, digest="approval")
+    return True
+
+class LivePreview:
+    """
+    A Slack message that shows a post's image while it is still being generated.
+
+    show_frame() is the on_partial callback of generate_image_bytes(). It returns right
+    away; a background thread renders the frame to a thumbnail, uploads it and swaps it
+    into the message, skipping frames that a newer one has already overtaken.
+    finish() shows the final image, and the approval request later replaces the
+    message, so the operator sees the scene seconds after the text is ready.
+    """
+
+    def __init__(self, caption, scheduled_date):
+        self.caption = caption
+        self.scheduled_date = scheduled_date
+        self.message = None
+        self.newest = -1
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slack-preview")
+
+    def show_frame(self, index, frame_bytes):
+        with self._lock:
+            self.newest = max(self.newest, index)
+        self._executor.submit(metrics.propagate(self._show_frame), index, frame_bytes)
+
+    def _show_frame(self, index, frame_bytes):
+        with self._lock:
+            if index < self.newest:
+                return
+        with metrics.span("slack.preview", frame=index) as span:
+            try:
+                thumbnail = renditions.render_variant(frame_bytes, renditions.RENDITIONS["thumbnail"])
+            except Exception as e:
+                print(f"Could not render preview frame {index}: {repr(e)}")
+                span.fail()
+                return
+            url = r2_storage.upload_bytes(thumbnail, "jpg", "image/jpeg")
+            if not url or not self._show(f"🎨 Rendering... (preview {index + 1} of {PARTIAL_IMAGES})", url):
+                span.fail()
+
+    def _show(self, status, image_url=None):
+        """Posts the message, or updates it once it exists. Returns a truthy value on success."""
+        text = f"{status}\n\n*Post for {self.scheduled_date}:*\n{self.caption}"
+        blocks = [{"type": "section", "text": {"type": "mrkdwn", "text": text}}]
+        if image_url:
+            blocks.append({"type": "image", "image_url": image_url, "alt_text": self.caption[:2000]})
+        if self.message is None:
+            self.message = slack_api.post_message(text, blocks)
+            return self.message
+        return slack_api.update_message(self.message, text, blocks)
+
+    def finish(self, thumbnail_url=None):
+        """
+        Waits for the frames in flight, then shows the final thumbnail, or notes that the
+        image failed when there is none. Returns the message as {'channel', 'ts'}, or None.
+        """
+        self._executor.shutdown(wait=True)
+        if thumbnail_url:
+            self._show("🖼️ Final image ready; the approval request follows.", thumbnail_url)
+            return self.message
+        if self.message:
+            self._show("⚠️ Image generation failed.")
+        return None
+
+# *** 7. Batch mode: generate several posts concurrently ***
+def generate_unique_text(client, index, bank=None):
+    """
+    Generates a scene, caption and hashtags, re-rolling the (cheap) text call while
+    the result is a near-duplicate of an earlier post, before the (expensive) image
+    stage ever runs. Accepted texts are added to the index.
+    With a scene `bank`, the next banked entry is used instead whenever there is one.
+    Returns (description, caption, hashtags), or (None, None, None) on failure.
+    """
+    if bank:
+        description, caption, hashtags = take_from_scene_bank(client, bank, index)
+        if description:
+            return description, caption, hashtags
+        print("The scene bank is empty; generating the text directly.")
+    avoid = []
+    for attempt in range(MAX_REROLLS + 1):
+        description, caption, hashtags = generate_prompt_and_caption(client, avoid)
+        if not description or not caption:
+            return None, None, None
+        if index is None:
+            return description, caption, hashtags
+
+        match = index.check_and_add(description, caption)
+        if not match:
+            return description, caption, hashtags
+        print(f"Near-duplicate {match['kind']} (similarity {match['similarity']}): '{match['text']}'. Re-rolling...")
+        avoid.append(match["text"])
+
+    print(f"Still similar to an earlier post after {MAX_REROLLS} re-rolls; keeping the last result.")
+    index.add("description", description)
+    index.add("caption", caption)
+    return description, caption, hashtags
+
+def produce_image(client, description, cache=None, regenerate=None, local_path=None, on_partial=None,
+                  quality=IMAGE_QUALITY, prompt=None, fallback=True):
+    """
+    Runs the image and upload stages for one scene: generate (or reuse) the image,
+    render its variants and upload them. With `local_path` the original PNG is also
+    written to disk, and `on_partial` receives the partial frames of a generated image.
+    A recorded `prompt` is used as is instead of being built from the description.
+    With fallback=False the image is never a lower-quality fallback, generated or cached.
+    Returns the dict of variant URLs, or None on failure.
+    """
+    prompt = prompt or build_image_prompt(description)
+
+    # Image stage, keyed by the exact prompt and image parameters.
+    def image_key(quality):
+        return stage_cache.cache_key("image", model=IMAGE_MODEL, size=IMAGE_SIZE, quality=quality, prompt=prompt)
+
+    image_bytes = None
+    if cache and regenerate != "image":
+        cached_image = cache.get("image", image_key(quality))
+        # Entries record the quality they were rendered at. Older entries don't, and may
+        # hold a fallback image, so they are only reused where a fallback is acceptable.
+        if cached_image and cached_image.get("quality", quality if fallback else None) != quality:
+            cached_image = None
+        image_bytes = cache.get_blob(cached_image["digest"]) if cached_image else None
+        if image_bytes is not None:
+            print("Reusing cached image.")
+            metrics.set_attrs(image_cache="hit")
+    if image_bytes is None:
+        image_bytes, rendered_quality = generate_image_bytes(client, description, on_partial, quality, prompt, fallback)
+        if image_bytes is None:
+            print("Image generation failed.")
+            return None
+        if cache:
+            # A fallback image goes under the key of its own quality, so later runs
+            # don't take it for the image they asked for.
+            cache.put("image", image_key(rendered_quality),
+                      {"digest": cache.put_blob(image_bytes), "quality": rendered_quality})
+    if local_path:
+        save_local_copy(image_bytes, local_path)
+
+    # Upload stage, keyed by the image bytes and the renditions produced from them.
+    upload_key = stage_cache.cache_key(
+        "upload", image=stage_cache.content_hash(image_bytes), renditions=renditions.RENDITIONS,
+        prefix=r2_storage.R2_KEY_PREFIX
+    )
+    image_variants = cache.get("upload", upload_key) if cache else None
+    if image_variants:
+        print("Reusing cached R2 upload.")
+        metrics.set_attrs(upload_cache="hit")
+    else:
+        image_variants = render_and_upload(image_bytes)
+        if not image_variants:
+            print("Cloudflare R2 upload failed.")
+            return None
+        if cache:
+            cache.put("upload", upload_key, image_variants)
+    return image_variants
+
+def produce_slide(client, description, slide, cache=None, regenerate=None, local_path=None, on_partial=None,
+                  quality=IMAGE_QUALITY, prompt=None, fallback=True):
+    """Runs produce_image() for one carousel image in its own span."""
+    with metrics.span("generate.slide", slide=slide) as span:
+        image_variants = produce_image(
+            client, description, cache, regenerate, local_path, on_partial, quality, prompt, fallback
+        )
+        if not image_variants:
+            span.fail()
+        return image_variants
+
+def produce_carousel(client, scenes, cache=None, regenerate=None, local_path=None, on_partial=None,
+                     quality=IMAGE_QUALITY, prompts=None, fallback=True):
+    """
+    Generates, renders and uploads the images of every scene at the same time, so a
+    carousel takes about as long as its slowest image. `on_partial` receives the
+    partial frames of the cover. `prompts` are recorded prompts, one per scene.
+    `fallback` is passed on to produce_image().
+    Returns the list of variant dicts in scene order, or None if any image failed.
+    """
+    root, ext = os.path.splitext(local_path) if local_path else (None, None)
+    with ThreadPoolExecutor(max_workers=len(scenes)) as executor:
+        futures = [
+            executor.submit(
+                metrics.propagate(produce_slide), client, scene, i + 1, cache, regenerate,
+                f"{root}-{i + 1}{ext}" if local_path else None, on_partial if i == 0 else None,
+                quality, prompts[i] if prompts else None, fallback
+            )
+            for i, scene in enumerate(scenes)
+        ]
+        slides = [future.result() for future in futures]
+    if not all(slides):
+        print(f"{sum(1 for slide in slides if not slide)} of {len(scenes)} carousel images failed.")
+        return None
+    return slides
+
+def plan_scenes(client, description, cache=None, carousel=1):
+    """
+    Returns the scenes of a post: the scene itself for a single-image post, or that many
+    related scenes for a carousel. Returns None on failure.
+    """
+    if carousel <= 1:
+        return [description]
+
+    # Scenes stage, keyed by the opening scene, so a redone image keeps the same scenes.
+    scenes_key = stage_cache.cache_key(
+        "scenes", model=TEXT_MODEL, temperature=TEXT_TEMPERATURE, prompt=CAROUSEL_SYSTEM_PROMPT,
+        description=description, count=carousel
+    )
+    cached_scenes = cache.get("scenes", scenes_key) if cache else None
+    scenes = cached_scenes["scenes"] if cached_scenes else generate_carousel_scenes(client, description, carousel)
+    if not scenes:
+        print("Failed to plan the carousel scenes.")
+        return None
+    if cache and not cached_scenes:
+        cache.put("scenes", scenes_key, {"scenes": scenes})
+    return scenes
+
+def produce_slides(client, scenes, cache=None, regenerate=None, local_path=None, on_partial=None,
+                   quality=IMAGE_QUALITY):
+    """
+    Produces the images of a post, one per scene from plan_scenes().
+    Returns the list of variant dicts, or None on failure.
+    """
+    if len(scenes) == 1:
+        image_variants = produce_image(client, scenes[0], cache, regenerate, local_path, on_partial, quality)
+        return [image_variants] if image_variants else None
+    return produce_carousel(client, scenes, cache, regenerate, local_path, on_partial, quality)
+
+@metrics.timed("generate.post")
+def generate_post(client, scheduled_date=None, keep_local=False, index=None, cache=None, regenerate=None,
+                  carousel=CAROUSEL_SIZE, bank=None):
+    """
+    Runs the text, image and upload stages for the post scheduled on `scheduled_date`.
+
+    With a stage cache, every stage's output is stored under a content-addressed key,
+    and `regenerate` ('text', 'caption' or 'image') reuses every cached stage except
+    the one being redone: 'caption' keeps the scene and the image, 'image' keeps the
+    text. Stages downstream of a redone stage miss the cache naturally, because their
+    keys include their inputs.
+    With carousel > 1 the scene is expanded into that many related scenes, and the
+    post gets one image per scene.
+    Completed stages are also recorded in the slot's checkpoint. If an earlier run for
+    this date failed before its post was queued, a plain re-run resumes from it: the
+    text is reused, and so are the image and upload through their cache keys.
+    With IMAGE_DRAFT_QUALITY set, the images are drafts and the post records their prompts.
+    With a scene `bank`, new text is taken from it (see take_from_scene_bank).
+    Returns a dict with 'image_url', 'image_urls', 'caption', 'hashtags' and
+    'scheduled_date', or None on failure.
+    """
+    scheduled_date = scheduled_date or date.today().isoformat()
+    local_path = f"{scheduled_date}-pending_image.png" if keep_local else None
+    metrics.set_attrs(scheduled_date=scheduled_date, regenerate=regenerate, carousel=carousel)
+
+    # Text stage. Its key is per scheduled date, because the prompt alone is the same every day.
+    text_key = stage_cache.cache_key(
+        "text", model=TEXT_MODEL, temperature=TEXT_TEMPERATURE, prompt=SCENE_SYSTEM_PROMPT, slot=scheduled_date
+    )
+    checkpoint = stage_cache.Checkpoint(cache, scheduled_date) if cache else None
+    resumed = checkpoint.get("text") if checkpoint and not regenerate else None
+    cached_text = cache.get("text", text_key) if cache and regenerate in ("caption", "image") else None
+    if resumed:
+        print(f"Resuming the unfinished run for {scheduled_date} from its checkpoint.")
+        metrics.set_attrs(resumed=True)
+        description, caption, hashtags = resumed["description"], resumed["caption"], resumed["hashtags"]
+    elif cached_text:
+        print(f"Reusing cached scene text for {scheduled_date}.")
+        metrics.set_attrs(text_cache="hit")
+        description = cached_text["description"]
+        caption, hashtags = cached_text["caption"], cached_text["hashtags"]
+        if regenerate == "caption":
+            caption, hashtags = generate_caption_for_description(client, description)
+            if index and caption:
+                index.add("caption", caption)
+    else:
+        if regenerate in ("caption", "image"):
+            print(f"No cached scene text for {scheduled_date}; generating everything.")
+        description, caption, hashtags = generate_unique_text(client, index, bank)
+    if not description or not caption:
+        print("Failed to get description/caption.")
+        return None
+    if cache:
+        text = {"description": description, "caption": caption, "hashtags": hashtags}
+        cache.put("text", text_key, text)
+        checkpoint.record("text", text)
+
+    quality = IMAGE_DRAFT_QUALITY or IMAGE_QUALITY
+    slides = resumed and checkpoint.get("slides")
+    scenes = resumed and checkpoint.get("scenes")
+    if slides and scenes and len(slides) == max(1, carousel):
+        print("Reusing the checkpointed image uploads.")
+        slack_message = checkpoint.get("slack_message")
+    else:
+        scenes = plan_scenes(client, description, cache, carousel)
+        if not scenes:
+            return None
+        # The live preview opens as soon as the text is ready and shows the image while it renders.
+        preview = LivePreview(caption, scheduled_date) if PARTIAL_IMAGES > 0 and slack_api.is_configured() else None
+        on_partial = preview.show_frame if preview else None
+        slides = produce_slides(client, scenes, cache, regenerate, local_path, on_partial, quality)
+        slack_message = preview.finish(slides[0].get("thumbnail") if slides else None) if preview else None
+        if not slides:
+            return None
+        if checkpoint:
+            checkpoint.record("slack_message", slack_message)
+            checkpoint.record("scenes", scenes)
+            checkpoint.record("slides", slides)
+
+    return {
+        "image_url": slides[0]["full"],
+        "image_urls": [slide["full"] for slide in slides],
+        "thumbnail_urls": [slide.get("thumbnail") for slide in slides],
+        "description": description,
+        "caption": caption,
+        "hashtags": hashtags,
+        "image_variants": slides[0],
+        "scheduled_date": scheduled_date,
+        "slack_message": slack_message,
+        "draft": {
+            "quality": quality,
+            "prompts": [build_image_prompt(scene) for scene in scenes],
+        } if IMAGE_DRAFT_QUALITY else None,
+    }
+
+def generate_batch(client, count, concurrency=DEFAULT_CONCURRENCY, keep_local=False, index=None,
+                   cache=None, regenerate=None, start_date=None, carousel=CAROUSEL_SIZE, bank=None):
+    """
+    Generates `count` posts for consecutive days starting at `start_date` (default: today),
+    with at most `concurrency` of them in flight at once.
+    Each post runs its text, image and upload stages on a worker thread, so the
+    total run time is close to the slowest single post rather than the sum.
+    Returns the list of successfully generated posts, in submission order.
+    """
+    start_date = start_date or date.today()
+    workers = max(1, min(concurrency, count))
+    print(f"Generating {count} posts with up to {workers} running concurrently...")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                metrics.propagate(generate_post), client, (start_date + timedelta(days=i)).isoformat(), keep_local, index,
+                cache, regenerate, carousel, bank
+            )
+            for i in range(count)
+        ]
+        results = []
+        for i, future in enumerate(futures, start=1):
+            try:
+                post = future.result()
+            except Exception as e:
+                print(f"Post {i}/{count} failed with an unexpected error: {repr(e)}")
+                post = None
+            if post:
+                results.append(post)
+            else:
+                print(f"Post {i}/{count} could not be generated.")
+    return results
+
+def save_batch_for_approval(posts, queue):
+    """
+    Queues the posts of a run, each on its own scheduled date.
+    Returns the list of queued post ids.
+    """
+    return [
+        save_content_for_approval(
+            post["image_url"], post["caption"], post["hashtags"], post["image_variants"],
+            post["description"], post["scheduled_date"], queue, post.get("image_urls"), post.get("thumbnail_urls"),
+            post.get("slack_message"), post.get("draft")
+        )
+        for post in posts
+    ]
+
+def notify_pending_posts(queue, links_for=None):
+    """
+    Sends an approval request for every generated post that hasn't been announced yet.
+    `links_for(post_id)` may return approve/reject links for each message.
+    Returns the number of posts announced.
+    """
+    posts = queue.unnotified()
+    for post in posts:
+        thumbnail_url = post.get("image_variants", {}).get("thumbnail")
+        links = links_for(post["id"]) if links_for else None
+        send_approval_request_to_slack(
+            post["image_url"], post["caption"], post["hashtags"], thumbnail_url, links,
+            post.get("image_urls"), post.get("thumbnail_urls"), post.get("slack_message"), bool(post.get("draft"))
+        )
+    queue.mark_notified([post["id"] for post in posts])
+    return len(posts)
+
+def run_generation(client, count=1, concurrency=DEFAULT_CONCURRENCY, keep_local=False, regenerate=None, queue=None,
+                   carousel=CAROUSEL_SIZE):
+    """
+    Generates `count` posts and queues them for approval. main() runs it once per
+    process; the daemon runs it on its schedule with the same warm client and encoder pool.
+    Returns the list of queued post ids, empty if every post failed.
+    """
+    index = scene_index.open_index()
+    bank = scene_bank.open_bank() if SCENE_BANK_SIZE > 0 else None
+    cache = stage_cache.StageCache()
+    cache.prune()
+
+    if count > 1:
+        posts = generate_batch(client, count, concurrency, keep_local, index, cache, regenerate, carousel=carousel,
+                               bank=bank)
+    else:
+        post = generate_post(client, keep_local=keep_local, index=index, cache=cache, regenerate=regenerate,
+                             carousel=carousel, bank=bank)
+        posts = [post] if post else []
+    # A refill started during the run overlapped with the image stages; let it finish.
+    wait_for_scene_bank_refill()
+    if not posts:
+        return []
+
+    queue = queue or post_queue.open_queue()
+    post_ids = save_batch_for_approval(posts, queue)
+    print(f"Queued {len(post_ids)} post(s) in '{queue.path}'.")
+    # Queued posts are done; the checkpoints of failed ones stay for the next run.
+    for post in posts:
+        stage_cache.Checkpoint(cache, post["scheduled_date"]).clear()
+    if len(posts) < count:
+        print(f"Warning: {count - len(posts)} of {count} posts failed and were not queued.")
+    return post_ids
+
+@metrics.timed("generate.final")
+def finalize_draft(queue, post, client=None, cache=None):
+    """
+    Renders the images of an approved draft at IMAGE_QUALITY from the prompts recorded
+    when it was generated, uploads them and points the post at them. The draft image
+    URLs stay in 'draft_image_urls'. publish_content calls this before publishing.
+    There is no lower-quality fallback here: an approved post ships at IMAGE_QUALITY or
+    not at all, and a failed render is retried by approving the post again.
+    Returns the updated post, or None on failure.
+    """
+    prompts = post["draft"]["prompts"]
+    metrics.set_attrs(post_id=post["id"], images=len(prompts))
+    print(f"Rendering the approved draft of post {post['id']} at '{IMAGE_QUALITY}' quality...")
+    client = client or create_openai_client()
+    cache = cache or stage_cache.StageCache()
+    if len(prompts) == 1:
+        image_variants = produce_image(client, None, cache, prompt=prompts[0], fallback=False)
+        slides = [image_variants] if image_variants else None
+    else:
+        slides = produce_carousel(client, [None] * len(prompts), cache, prompts=prompts, fallback=False)
+    if not slides:
+        print("Rendering the final images failed.")
+        return None
+
+    extra = {
+        "image_variants": slides[0],
+        "draft": None,
+        "draft_image_urls": post.get("image_urls") or [post["image_url"]],
+    }
+    if len(slides) > 1:
+        extra.update(image_urls=[slide["full"] for slide in slides],
+                     thumbnail_urls=[slide.get("thumbnail") for slide in slides])
+    queue.replace_images(post["id"], slides[0]["full"], **extra)
+    print(f"Post {post['id']} now has its full-quality image(s).")
+    return queue.get(post["id"])
+
+def get_option(argv, name, default=None):
+    """Returns the value following `name` in argv (e.g. '--regenerate image'), or the default."""
+    if name not in argv:
+        return default
+    index = argv.index(name)
+    if index + 1 >= len(argv):
+        print(f"Error: {name} expects a value.")
+        exit(1)
+    return argv[index + 1]
+
+def get_int_option(argv, name, default):
+    """Returns the integer value following `name` in argv (e.g. '--count 7'), or the default."""
+    value = get_option(argv, name, default)
     try:
-        resp = requests.post(SLACK_WEBHOOK_URL, json=slack_payload)
-        resp.raise_for_status()
-        print("Slack notification sent successfully.")
-    except requests.exceptions.RequestException as e:
-        print(f"Error sending Slack message: {e}")
+        return int(value)
+    except (TypeError, ValueError):
+        print(f"Error: {name} expects an integer value.")
+        exit(1)
 
 # *** Main execution flow ***
-def main():
-    """Main function to handle command-line arguments."""
+@metrics.timed("notify.run", check_result=False)
+def notify():
+    """Sends a Slack approval request for every queued post that is waiting for review."""
+    print("Running in Slack notification-only mode.")
+    if not settings.slack_webhook_url and not slack_api.is_configured():
+        print("Neither SLACK_WEBHOOK_URL nor SLACK_BOT_TOKEN/SLACK_CHANNEL_ID set, skipping notification.")
+        return
+    slack_outbox.flush_spool()
+    try:
+        notified = notify_pending_posts(post_queue.open_queue())
+        print(f"Queued approval requests for {notified} post(s).")
+    except Exception as e:
+        print(f"Failed to read the post queue or send notification. Error: {repr(e)}")
+        exit(1)
+
+@metrics.timed("generate.run", check_result=False)
+def main(argv=None):
+    """
+    Usage: python generate_content.py [--count N] [--concurrency N] [--carousel K]
+                                      [--regenerate text|caption|image] [--keep-local] [--no-slack] [--slack-only]
+    """
     import sys
+    argv = sys.argv[1:] if argv is None else argv
 
     # Simple argument parsing
-    if '--slack-only' in sys.argv:
-        print("Running in Slack notification-only mode.")
-        try:
-            with open("pending_post.json", "r") as f:
-                content = json.load(f)
-            # The key is now 'image_url'
-            image_url = content["image_url"]
-            caption = content["caption"]
-            hashtags = content["hashtags"]
-            if SLACK_WEBHOOK_URL:
-                send_approval_request_to_slack(image_url, caption, hashtags)
-            else:
-                print("SLACK_WEBHOOK_URL not set, skipping notification.")
-        except Exception as e:
-            print(f"Failed to read pending files or send notification. Error: {repr(e)}")
-            exit(1)
+    if '--slack-only' in argv:
+        notify()
         return
 
-    # Default behavior: generate files
-    print("Starting content generation script...")
-    
-    client = openai.OpenAI(api_key=OPENAI_API_KEY)
-    
-    description, caption, hashtags = generate_prompt_and_caption(client)
-    if not description or not caption:
-        print("Failed to get description/caption. Exiting.")
+    count = get_int_option(argv, '--count', 1)
+    concurrency = get_int_option(argv, '--concurrency', DEFAULT_CONCURRENCY)
+    if count < 1 or concurrency < 1:
+        print("Error: --count and --concurrency must be at least 1.")
         exit(1)
-    
-    image_path = generate_image_file(client, description)
-    if not image_path:
-        print("Image generation failed. Exiting.")
+    carousel = get_int_option(argv, '--carousel', CAROUSEL_SIZE)
+    if not 1 <= carousel <= MAX_CAROUSEL_SIZE:
+        print(f"Error: --carousel must be between 1 and {MAX_CAROUSEL_SIZE}.")
         exit(1)
-        
-    # New step: Upload the generated image to Cloudflare R2
-    image_url = upload_image_to_r2(image_path)
-    if not image_url:
-        print("Cloudflare R2 upload failed. Exiting.")
+    regenerate = get_option(argv, '--regenerate')
+    if regenerate and regenerate not in REGENERATE_STAGES:
+        print(f"Error: --regenerate must be one of: {', '.join(REGENERATE_STAGES)}.")
         exit(1)
-        
-    # The image file is no longer needed after upload, so we remove it
-    try:
-        os.remove(image_path)
-        print(f"Removed local image file: {image_path}")
-    except OSError as e:
-        print(f"Error removing local image file: {e}")
 
-    save_content_for_approval(image_url, caption, hashtags)
+    # Default behavior: generate files
+    print("Starting content generation script...")
+    # The encoder workers are forked, so the pool starts before the outbox thread does.
+    renditions.start_process_pool()
+    if '--no-slack' not in argv:
+        slack_outbox.flush_spool()
+
+    client = create_openai_client()
+    queue = post_queue.open_queue()
+    post_ids = run_generation(client, count, concurrency, '--keep-local' in argv, regenerate, queue, carousel)
+    renditions.shutdown_process_pool()
+    if not post_ids:
+        print("Content generation failed. Exiting.")
+        exit(1)
     
     # Conditionally skip Slack notification if --no-slack is passed
-    if '--no-slack' in sys.argv:
+    if '--no-slack' in argv:
         print("Skipping Slack notification as requested.")
-    elif SLACK_WEBHOOK_URL:
+    elif settings.slack_webhook_url or slack_api.is_configured():
         # This path is for local runs where you want immediate notification
-        send_approval_request_to_slack(image_url, caption, hashtags)
-    
+        notify_pending_posts(queue)
     print("Content generation script finished successfully!")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
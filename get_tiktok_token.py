@@ -3,32 +3,29 @@ import hashlib
 import base64
 import os
 import requests
+import http_transport
 from urllib.parse import urlparse, parse_qs
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
+import accounts
+from config import settings
 
 # --- Configuration ---
-# This script will now load your credentials from your .env file.
+# This script will now load your credentials from your .env file (see config.py).
 # Make sure TIKTOK_CLIENT_KEY and TIKTOK_CLIENT_SECRET are set in that file.
-CLIENT_KEY = os.getenv("TIKTOK_CLIENT_KEY")
-CLIENT_SECRET = os.getenv("TIKTOK_CLIENT_SECRET")
 
 # This MUST match the redirect URI in your TikTok app's configuration
 REDIRECT_URI = "https://www.tourii.xyz/auth/callback"
 # The scopes your app requires.
 SCOPES = ["user.info.basic", "video.publish"]
 
-def get_access_token(code, code_verifier):
-    """Exchanges the authorization code for an access token."""
+def get_access_token(code, code_verifier, account):
+    """Exchanges the authorization code for an access token and stores it in the account's token store."""
     print("\n🔄 Exchanging authorization code for an access token...")
     
-    url = "https://open.tiktokapis.com/v2/oauth/token/"
+    url = f"{settings.tiktok_api_base}/v2/oauth/token/"
     headers = {'Content-Type': 'application/x-www-form-urlencoded'}
     payload = {
-        'client_key': CLIENT_KEY,
-        'client_secret': CLIENT_SECRET,
+        'client_key': settings.tiktok_client_key,
+        'client_secret': settings.tiktok_client_secret,
         'code': code,
         'grant_type': 'authorization_code',
         'redirect_uri': REDIRECT_URI,
@@ -36,7 +33,7 @@ def get_access_token(code, code_verifier):
     }
 
     try:
-        response = requests.post(url, headers=headers, data=payload)
+        response = http_transport.post(url, headers=headers, data=payload, rate_limit="tiktok.oauth")
         response.raise_for_status()
         token_data = response.json()
         
@@ -46,17 +43,41 @@ def get_access_token(code, code_verifier):
         print(f"\nRefresh Token: \n{token_data.get('refresh_token')}")
         print(f"\nScope: {token_data.get('scope')}")
         print(f"\nExpires In: {token_data.get('expires_in')} seconds")
-        print("\n📋 Copy the TIKTOK_REFRESH_TOKEN value and add it to your .env file.")
+        print(f"\n📋 Copy the {accounts.refresh_token_env(account.name)} value and add it to your .env file.")
+
+        if token_data.get("access_token"):
+            store = account.store
+            with store.locked():
+                store.save_token_response(token_data)
+            print(f"\n💾 Tokens also saved to the local token store ({store.path}).")
         
     except requests.exceptions.RequestException as e:
         print("\n❌ An error occurred while fetching the access token.")
-        print(f"Status Code: {e.response.status_code}")
-        print(f"Response: {e.response.text}")
-
-def main():
+        if e.response is not None:
+            print(f"Status Code: {e.response.status_code}")
+            print(f"Response: {e.response.text}")
+        else:
+            print(f"Details: {e}")
+
+def main(argv=None):
+    """
+    Usage: python get_tiktok_token.py [account]
+    Pass the account name from tiktok_accounts.json to authorize an extra account.
+    """
+    import sys
+    argv = sys.argv[1:] if argv is None else argv
+    account_name = argv[0] if argv else accounts.DEFAULT_ACCOUNT
     print("--- TikTok OAuth 2.0 Token Generator (Manual Flow) ---")
+    try:
+        # The registry may give the account its own token store, which the publisher reads.
+        account = accounts.load_accounts(names=[account_name])[0]
+    except ValueError as e:
+        print(f"\n❗️ Error: {e}")
+        return
+    if account_name != accounts.DEFAULT_ACCOUNT:
+        print(f"Authorizing account '{account_name}'. Log in to TikTok as that account.")
 
-    if not CLIENT_KEY or not CLIENT_SECRET:
+    if settings.missing("tiktok_client_key", "tiktok_client_secret"):
         print("\n❗️ Error: Your TIKTOK_CLIENT_KEY or TIKTOK_CLIENT_SECRET is not set.")
         print("   Please check your '.env' file and make sure it contains your credentials.")
         return
@@ -70,7 +91,7 @@ def main():
     scope_string = ",".join(SCOPES)
     auth_url = (
         f"https://www.tiktok.com/v2/auth/authorize?"
-        f"client_key={CLIENT_KEY}&"
+        f"client_key={settings.tiktok_client_key}&"
         f"scope={scope_string}&"
         f"response_type=code&"
         f"redirect_uri={REDIRECT_URI}&"
@@ -108,7 +129,7 @@ def main():
             return
 
         print("\n✅ Authorization code received successfully.")
-        get_access_token(authorization_code, code_verifier)
+        get_access_token(authorization_code, code_verifier, account)
 
     except Exception as e:
         print(f"\n❌ An error occurred while parsing the URL: {e}")
@@ -0,0 +1,118 @@
+import os
+import random
+import time
+import threading
+import contextlib
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+import rate_limiter
+
+# --- Configuration ---
+# Every TikTok/Slack call in the scripts goes through this module, so one pooled
+# session keeps TLS connections alive per host and every call gets a timeout.
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "4"))
+POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "10"))
+
+# Exponential backoff: the n-th retry waits a random time in [0, BACKOFF_BASE * 2**n],
+# capped at BACKOFF_MAX. A Retry-After header longer than RETRY_AFTER_MAX is not honored
+# by sleeping; the response is returned to the caller instead.
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+RETRY_AFTER_MAX = 120.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """
+    Returns the shared requests.Session, creating it on first use.
+    The session is safe to share between the worker threads of a batch run.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=10, pool_maxsize=POOL_MAXSIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+    return _session
+
+def backoff_delay(attempt):
+    """Returns a jittered exponential backoff delay for the given retry attempt (0-based)."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+def _finish(response):
+    """Adds the request and response sizes to the active metrics span."""
+    metrics.add_bytes(len(response.request.body or b"") + len(response.content))
+    return response
+
+def request(method, url, timeout=None, retries=MAX_RETRIES, idempotent=True, rate_limit=None,
+            rate_scope=None, **kwargs):
+    """
+    Sends an HTTP request through the shared session with timeouts and retries.
+
+    Retries connection failures and 429/5xx responses with jittered exponential
+    backoff, honoring Retry-After when the server sends one. For non-idempotent
+    calls (idempotent=False) only failures where the request can't have been
+    processed are retried: connect timeouts and 429 responses.
+
+    `rate_limit` names the rate_limiter bucket of the endpoint (e.g. 'tiktok.content_init',
+    with `rate_scope` for per-token quotas): every attempt waits for its quota, and
+    every response's status and rate-limit headers are fed back to the bucket.
+
+    `timeout` defaults to (CONNECT_TIMEOUT, READ_TIMEOUT). Returns the final
+    requests.Response; connection errors are raised once retries run out.
+    Retries and the bytes sent and received are added to the active metrics span.
+    """
+    session = get_session()
+    limiter = rate_limiter.get_limiter(rate_limit, rate_scope) if rate_limit else None
+    if timeout is None:
+        timeout = (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+    attempt = 0
+    while True:
+        try:
+            with limiter.slot() if limiter else contextlib.nullcontext():
+                response = session.request(method, url, timeout=timeout, **kwargs)
+        except requests.exceptions.ConnectTimeout as e:
+            if attempt >= retries:
+                raise
+            delay, reason = backoff_delay(attempt), repr(e)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt >= retries or not idempotent:
+                raise
+            delay, reason = backoff_delay(attempt), repr(e)
+        else:
+            status = response.status_code
+            if limiter:
+                limiter.observe(status, response.headers)
+            if status not in RETRY_STATUSES or attempt >= retries:
+                return _finish(response)
+            if not idempotent and status != 429:
+                return _finish(response)
+            delay = rate_limiter.retry_after(response.headers)
+            if delay is None:
+                delay = backoff_delay(attempt)
+            elif delay > RETRY_AFTER_MAX:
+                return _finish(response)
+            reason = f"HTTP {status}"
+
+        attempt += 1
+        metrics.add_retries()
+        print(f"Request to {url} failed ({reason}). Retrying in {delay:.1f}s (attempt {attempt}/{retries})...")
+        time.sleep(delay)
+
+def post(url, **kwargs):
+    """Shorthand for request('POST', url, ...)."""
+    return request("POST", url, **kwargs)
+
+def get(url, **kwargs):
+    """Shorthand for request('GET', url, ...)."""
+    return request("GET", url, **kwargs)
@@ -0,0 +1,320 @@
+import os
+import sys
+import json
+import time
+import uuid
+import functools
+import threading
+import contextlib
+import contextvars
+from datetime import datetime
+
+# --- Configuration ---
+# Every pipeline stage is recorded as one JSON line ("span") in this file. Set
+# METRICS_PATH to an empty string to turn recording off.
+METRICS_PATH = os.getenv("METRICS_PATH", "metrics.jsonl")
+# Once the file is larger than METRICS_MAX_MB it is moved to '<path>.1' (replacing the
+# previous one) and a new file is started, so the span log never grows without limit.
+# 0 turns rotation off.
+METRICS_MAX_MB = float(os.getenv("METRICS_MAX_MB", "20"))
+# Spans of one script run share a run id. On GitHub Actions the generate and publish
+# jobs of the same workflow run get the same id, so they can be read together.
+RUN_ID = os.getenv("METRICS_RUN_ID") or (
+    f"gh-{os.environ['GITHUB_RUN_ID']}-{os.getenv('GITHUB_RUN_ATTEMPT', '1')}"
+    if os.getenv("GITHUB_RUN_ID") else uuid.uuid4().hex[:12]
+)
+# Name of the script in every span; cli.py sets it to the module behind the subcommand.
+SCRIPT = os.getenv("METRICS_SCRIPT") or os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0]
+
+# Upper bounds (seconds) of the latency histogram buckets used by the summarizer.
+HISTOGRAM_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# OpenAI usage fields that are summed across the calls of a span.
+USAGE_FIELDS = ("prompt_tokens", "completion_tokens", "input_tokens", "output_tokens", "total_tokens")
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_write_lock = threading.Lock()
+
+class Span:
+    """
+    One timed stage. Counters (bytes moved, retries, token usage) are added while it
+    runs, from the stage itself or from the HTTP layer underneath it.
+    """
+
+    def __init__(self, stage, parent=None, **attrs):
+        self.stage = stage
+        self.span_id = uuid.uuid4().hex[:8]
+        self.parent_id = parent.span_id if parent else None
+        self.attrs = attrs
+        self.bytes = 0
+        self.retries = 0
+        self.usage = {}
+        self.outcome = "ok"
+        self._lock = threading.Lock()
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add_bytes(self, count):
+        with self._lock:
+            self.bytes += count or 0
+
+    def add_retries(self, count=1):
+        with self._lock:
+            self.retries += count or 0
+
+    def add_usage(self, usage):
+        """Adds an OpenAI 'usage' object (or dict) to the span's token counts."""
+        if usage is None:
+            return
+        if not isinstance(usage, dict):
+            usage = {field: getattr(usage, field, None) for field in USAGE_FIELDS}
+        with self._lock:
+            for field in USAGE_FIELDS:
+                if isinstance(usage.get(field), int):
+                    self.usage[field] = self.usage.get(field, 0) + usage[field]
+
+    def fail(self, reason=None):
+        self.outcome = "failed"
+        if reason:
+            self.attrs["reason"] = reason
+
+    def to_record(self, start, duration):
+        record = {
+            "ts": datetime.fromtimestamp(start).isoformat(timespec="milliseconds"),
+            "run_id": RUN_ID,
+            "script": SCRIPT,
+            "stage": self.stage,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "duration_s": round(duration, 4),
+            "outcome": self.outcome,
+            "bytes": self.bytes,
+            "retries": self.retries,
+        }
+        if self.usage:
+            record["usage"] = self.usage
+        record.update(self.attrs)
+        return record
+
+def write_record(record, path=None):
+    """Appends one record to the metrics file. Metrics never break the pipeline."""
+    path = METRICS_PATH if path is None else path
+    if not path:
+        return
+    line = json.dumps(record, default=str) + "\n"
+    try:
+        with _write_lock:
+            with open(path, "a") as f:
+                f.write(line)
+                size = f.tell()
+            if METRICS_MAX_MB > 0 and size > METRICS_MAX_MB * 2**20:
+                os.replace(path, f"{path}.1")
+    except OSError as e:
+        print(f"Could not write metrics to '{path}': {e}")
+
+@contextlib.contextmanager
+def span(stage, **attrs):
+    """
+    Times the enclosed block as a stage and writes it to the metrics file when it ends.
+    The outcome is 'ok', 'failed' (set with Span.fail()) or 'error' if an exception
+    escaped. SystemExit with a zero code counts as 'ok'.
+    """
+    current = Span(stage, _current_span.get(), **attrs)
+    token = _current_span.set(current)
+    started_at = time.time()
+    start = time.perf_counter()
+    try:
+        yield current
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            current.fail(f"exit {e.code}")
+        raise
+    except BaseException as e:
+        current.outcome = "error"
+        current.attrs["error"] = repr(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        write_record(current.to_record(started_at, time.perf_counter() - start))
+
+def _is_failure(result):
+    # The scripts signal failure by returning None (or a tuple starting with None/False).
+    if result is None or result is False:
+        return True
+    return isinstance(result, tuple) and bool(result) and result[0] in (None, False)
+
+def timed(stage, check_result=True):
+    """
+    Decorator that runs a function inside span(stage). Unless check_result is False, a
+    return value of None, False or a tuple starting with None/False marks the span 'failed'.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(stage) as current:
+                result = function(*args, **kwargs)
+                if check_result and _is_failure(result) and current.outcome == "ok":
+                    current.fail()
+                return result
+        return wrapper
+    return decorator
+
+def current_span():
+    """Returns the innermost active span of this thread/task, or None."""
+    return _current_span.get()
+
+# Shorthands that add to the active span and do nothing outside of one.
+def add_bytes(count):
+    if _current_span.get():
+        _current_span.get().add_bytes(count)
+
+def add_retries(count=1):
+    if _current_span.get():
+        _current_span.get().add_retries(count)
+
+def add_usage(usage):
+    if _current_span.get():
+        _current_span.get().add_usage(usage)
+
+def set_attrs(**attrs):
+    if _current_span.get():
+        _current_span.get().set(**attrs)
+
+def propagate(function):
+    """
+    Binds a function to the caller's context, so spans it opens on a worker thread
+    are linked to the caller's span: executor.submit(metrics.propagate(fn), ...).
+    """
+    context = contextvars.copy_context()
+    return functools.partial(context.run, function)
+
+# *** Summarizer ***
+def load_records(path=METRICS_PATH, run_id=None, since=None, tail_bytes=None):
+    """
+    Reads the spans of a metrics file, optionally of one run or from an ISO date on.
+    With `tail_bytes`, only the spans in the last that many bytes of the file are read.
+    """
+    records = []
+    try:
+        with open(path, "rb") as f:
+            if tail_bytes and f.seek(0, os.SEEK_END) > tail_bytes:
+                f.seek(-tail_bytes, os.SEEK_END)
+                # The first line is most likely cut off.
+                f.readline()
+            else:
+                f.seek(0)
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    continue
+                if run_id and record.get("run_id") != run_id:
+                    continue
+                if since and record.get("ts", "") < since:
+                    continue
+                records.append(record)
+    except FileNotFoundError:
+        pass
+    return records
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a sorted list."""
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * pct // 100))
+    return values[int(rank) - 1]
+
+def histogram(durations):
+    """Counts durations per HISTOGRAM_BUCKETS bucket; the last count is the overflow."""
+    counts = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+    for duration in durations:
+        for i, bound in enumerate(HISTOGRAM_BUCKETS):
+            if duration <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+    return counts
+
+def summarize(records):
+    """
+    Aggregates spans per stage across runs.
+    Returns {stage: {count, failed, p50_s, p95_s, max_s, bytes, retries, tokens, histogram}}.
+    """
+    stages = {}
+    for record in records:
+        stages.setdefault(record["stage"], []).append(record)
+
+    summary = {}
+    for stage, spans in sorted(stages.items()):
+        durations = sorted(span["duration_s"] for span in spans)
+        summary[stage] = {
+            "count": len(spans),
+            "failed": sum(1 for span in spans if span.get("outcome") != "ok"),
+            "p50_s": percentile(durations, 50),
+            "p95_s": percentile(durations, 95),
+            "max_s": durations[-1],
+            "bytes": sum(span.get("bytes", 0) for span in spans),
+            "retries": sum(span.get("retries", 0) for span in spans),
+            "tokens": sum(span.get("usage", {}).get("total_tokens", 0) for span in spans),
+            "histogram": histogram(durations),
+        }
+    return summary
+
+def print_summary(summary, runs):
+    print(f"{len(runs)} run(s), {sum(stage['count'] for stage in summary.values())} span(s)\n")
+    print(f"{'stage':<24}{'count':>6}{'failed':>7}{'p50 s':>9}{'p95 s':>9}{'max s':>9}"
+          f"{'MB':>8}{'retries':>8}{'tokens':>9}")
+    for name, stage in summary.items():
+        print(f"{name:<24}{stage['count']:>6}{stage['failed']:>7}{stage['p50_s']:>9.3f}{stage['p95_s']:>9.3f}"
+              f"{stage['max_s']:>9.3f}{stage['bytes'] / 2**20:>8.2f}{stage['retries']:>8}{stage['tokens']:>9}")
+
+    print("\nLatency histograms (count per bucket, upper bound in seconds):")
+    labels = [f"<={bound:g}" for bound in HISTOGRAM_BUCKETS] + [f">{HISTOGRAM_BUCKETS[-1]:g}"]
+    for name, stage in summary.items():
+        peak = max(stage["histogram"])
+        print(f"\n  {name}")
+        for label, count in zip(labels, stage["histogram"]):
+            if count:
+                print(f"    {label:>8} {count:>5} {'#' * max(1, round(30 * count / peak))}")
+
+def main():
+    """
+    Usage:
+        python metrics.py [path] [--run RUN_ID] [--since YYYY-MM-DD] [--json]
+    Prints per-stage latency percentiles and histograms of the spans in the metrics file.
+    """
+    args = sys.argv[1:]
+    options = {}
+    positional = []
+    i = 0
+    while i < len(args):
+        if args[i] in ("--run", "--since"):
+            if i + 1 >= len(args):
+                print(main.__doc__)
+                exit(1)
+            options[args[i]] = args[i + 1]
+            i += 2
+        elif args[i] == "--json":
+            options["--json"] = True
+            i += 1
+        elif args[i].startswith("--"):
+            print(main.__doc__)
+            exit(1)
+        else:
+            positional.append(args[i])
+            i += 1
+
+    path = positional[0] if positional else METRICS_PATH
+    records = load_records(path, options.get("--run"), options.get("--since"))
+    if not records:
+        print(f"No spans found in '{path}'.")
+        exit(1)
+    summary = summarize(records)
+    if options.get("--json"):
+        print(json.dumps(summary, indent=2))
+    else:
+        print_summary(summary, {record.get("run_id") for record in records})
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+import os
+import sys
+import json
+import sqlite3
+import threading
+from datetime import date, datetime
+
+# --- Configuration ---
+# The queue replaces the single-slot pending_post.json: every generated post is a row
+# that moves through generated -> approved -> publishing -> published/failed (or rejected).
+# A post stays 'publishing' while TikTok has accepted it on some account but not yet
+# confirmed it, so a run that dies half-way is resumed rather than repeated.
+#
+# post_queue.db is the one file of state that runs pass on to each other. Besides the
+# posts and their publications, scene_index.py and scene_bank.py keep their tables in
+# it by default, so saving or restoring this file carries all of them at once.
+POST_QUEUE_DB = os.getenv("POST_QUEUE_DB", "post_queue.db")
+LEGACY_PENDING_FILE = "pending_post.json"
+
+STATUS_GENERATED = "generated"
+STATUS_APPROVED = "approved"
+STATUS_PUBLISHING = "publishing"
+STATUS_PUBLISHED = "published"
+STATUS_FAILED = "failed"
+STATUS_REJECTED = "rejected"
+STATUSES = (STATUS_GENERATED, STATUS_APPROVED, STATUS_PUBLISHING, STATUS_PUBLISHED, STATUS_FAILED,
+            STATUS_REJECTED)
+# A publication (one post on one account) can also be 'unknown': a run died while its
+# content/init was being sent, so TikTok may or may not have the post. It is never
+# retried automatically, only after the post is re-approved or the operator confirms it.
+STATUS_UNKNOWN = "unknown"
+PUBLICATION_STATUSES = STATUSES + (STATUS_UNKNOWN,)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    scheduled_date TEXT NOT NULL,
+    status TEXT NOT NULL,
+    description TEXT,
+    caption TEXT NOT NULL,
+    hashtags TEXT NOT NULL,
+    image_url TEXT NOT NULL,
+    extra TEXT NOT NULL DEFAULT '{}',
+    publish_id TEXT,
+    notified_at TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_posts_status_date ON posts (status, scheduled_date, id);
+CREATE INDEX IF NOT EXISTS idx_posts_scheduled_date ON posts (scheduled_date);
+CREATE INDEX IF NOT EXISTS idx_posts_image_url ON posts (image_url);
+CREATE TABLE IF NOT EXISTS publications (
+    post_id INTEGER NOT NULL,
+    account TEXT NOT NULL,
+    status TEXT NOT NULL,
+    publish_id TEXT,
+    result TEXT NOT NULL DEFAULT '{}',
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (post_id, account)
+) WITHOUT ROWID;
+"""
+
+def _now():
+    return datetime.now().isoformat(timespec="seconds")
+
+def _today():
+    return date.today().isoformat()
+
+class PostQueue:
+    """
+    SQLite-backed queue of posts shared by generate_content.py and publish_content.py.
+
+    Rows are indexed by (status, scheduled_date), so "next due approved post" and
+    similar lookups are a single index seek no matter how many posts are queued.
+    Free-form metadata (image variants, publish results, ...) lives in the JSON
+    'extra' column and is returned merged into each post dict.
+    """
+
+    def __init__(self, path=POST_QUEUE_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def _fetchone(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()
+
+    def _fetchall(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _to_post(self, row):
+        if row is None:
+            return None
+        post = dict(row)
+        extra = json.loads(post.pop("extra") or "{}")
+        post.update({key: value for key, value in extra.items() if key not in post})
+        return post
+
+    # --- Writes ---
+    def add_post(self, image_url, caption, hashtags, description=None, scheduled_date=None,
+                 extra=None, status=STATUS_GENERATED, supersede=True):
+        """
+        Inserts a post and returns its id.
+        With supersede=True, older not-yet-approved posts for the same date are
+        marked rejected, which is what a 'regenerate' means.
+        """
+        scheduled_date = scheduled_date or _today()
+        now = _now()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if supersede:
+                    self._conn.execute(
+                        "UPDATE posts SET status = ?, updated_at = ? WHERE status = ? AND scheduled_date = ?",
+                        (STATUS_REJECTED, now, STATUS_GENERATED, scheduled_date),
+                    )
+                cursor = self._conn.execute(
+                    "INSERT INTO posts (scheduled_date, status, description, caption, hashtags, image_url,"
+                    " extra, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (scheduled_date, status, description, caption, hashtags, image_url,
+                     json.dumps(extra or {}), now, now),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return cursor.lastrowid
+
+    def set_status(self, post_id, status, publish_id=None, **extra):
+        """
+        Moves a post to a new status. Keyword arguments are merged into its 'extra' metadata.
+        """
+        if status not in STATUSES:
+            raise ValueError(f"Unknown post status: {status}")
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT extra FROM posts WHERE id = ?", (post_id,)).fetchone()
+                if row is None:
+                    raise KeyError(f"No post with id {post_id}")
+                merged = {**json.loads(row["extra"] or "{}"), **extra}
+                self._conn.execute(
+                    "UPDATE posts SET status = ?, publish_id = COALESCE(?, publish_id), extra = ?,"
+                    " updated_at = ? WHERE id = ?",
+                    (status, publish_id, json.dumps(merged), _now(), post_id),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def replace_images(self, post_id, image_url, **extra):
+        """Points a post at new images. Keyword arguments are merged into its 'extra' metadata."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT extra FROM posts WHERE id = ?", (post_id,)).fetchone()
+                if row is None:
+                    raise KeyError(f"No post with id {post_id}")
+                merged = {**json.loads(row["extra"] or "{}"), **extra}
+                self._conn.execute(
+                    "UPDATE posts SET image_url = ?, extra = ?, updated_at = ? WHERE id = ?",
+                    (image_url, json.dumps(merged), _now(), post_id),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def approve(self, post_id):
+        self.set_status(post_id, STATUS_APPROVED)
+
+    def reject(self, post_id):
+        self.set_status(post_id, STATUS_REJECTED)
+
+    def record_publication(self, post_id, account, status, publish_id=None, result=None):
+        """Stores the outcome of publishing a post to one account, replacing any earlier attempt."""
+        if status not in PUBLICATION_STATUSES:
+            raise ValueError(f"Unknown publication status: {status}")
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO publications (post_id, account, status, publish_id, result, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (post_id, account, status, publish_id, json.dumps(result or {}), _now()),
+            )
+
+    def mark_notified(self, post_ids):
+        """Records that the approval message for these posts has been sent."""
+        now = _now()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE posts SET notified_at = ?, updated_at = ? WHERE id = ?",
+                [(now, now, post_id) for post_id in post_ids],
+            )
+
+    # --- Reads ---
+    def get(self, post_id):
+        return self._to_post(self._fetchone("SELECT * FROM posts WHERE id = ?", (post_id,)))
+
+    def next_due(self, status, today=None):
+        """
+        Returns the earliest-scheduled post with the given status that is due by `today`, or None.
+        Served by the (status, scheduled_date, id) index: one seek, no scan.
+        """
+        row = self._fetchone(
+            "SELECT * FROM posts WHERE status = ? AND scheduled_date <= ?"
+            " ORDER BY scheduled_date, id LIMIT 1",
+            (status, today or _today()),
+        )
+        return self._to_post(row)
+
+    def next_due_approved(self, today=None):
+        return self.next_due(STATUS_APPROVED, today)
+
+    def latest(self, status, scheduled_date=None):
+        """
+        Returns the newest post with the given status scheduled on `scheduled_date`
+        (default: today), or None. A regenerated post is newer than the one it replaced.
+        """
+        row = self._fetchone(
+            "SELECT * FROM posts WHERE status = ? AND scheduled_date = ? ORDER BY id DESC LIMIT 1",
+            (status, scheduled_date or _today()),
+        )
+        return self._to_post(row)
+
+    def unnotified(self, status=STATUS_GENERATED):
+        """Returns the posts in `status` whose approval message has not been sent yet."""
+        rows = self._fetchall(
+            "SELECT * FROM posts WHERE status = ? AND notified_at IS NULL ORDER BY scheduled_date, id",
+            (status,),
+        )
+        return [self._to_post(row) for row in rows]
+
+    def list_posts(self, status=None, limit=50):
+        if status:
+            rows = self._fetchall(
+                "SELECT * FROM posts WHERE status = ? ORDER BY scheduled_date DESC, id DESC LIMIT ?",
+                (status, limit),
+            )
+        else:
+            rows = self._fetchall(
+                "SELECT * FROM posts ORDER BY scheduled_date DESC, id DESC LIMIT ?", (limit,)
+            )
+        return [self._to_post(row) for row in rows]
+
+    def all_posts(self):
+        """Returns every post, oldest first."""
+        return [self._to_post(row) for row in self._fetchall("SELECT * FROM posts ORDER BY id")]
+
+    def publications(self, post_id):
+        """Returns {account: publication dict} for every account a post was published to (or attempted)."""
+        rows = self._fetchall("SELECT * FROM publications WHERE post_id = ? ORDER BY account", (post_id,))
+        publications = {}
+        for row in rows:
+            publication = dict(row)
+            publication["result"] = json.loads(publication["result"] or "{}")
+            publications[publication["account"]] = publication
+        return publications
+
+    def find_by_image_url(self, image_url):
+        return self._to_post(self._fetchone("SELECT * FROM posts WHERE image_url = ?", (image_url,)))
+
+    # --- Migration ---
+    def import_legacy_json(self, path=LEGACY_PENDING_FILE):
+        """
+        Imports a legacy pending_post.json as a generated post and removes the file.
+        Posts that are already queued (same image URL) are not imported twice.
+        Returns the id of the imported post, or None.
+        """
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r") as f:
+                content = json.load(f)
+            image_url = content["image_url"]
+            caption = content["caption"]
+            hashtags = content["hashtags"]
+        except (json.JSONDecodeError, KeyError) as e:
+            print(f"Could not import legacy '{path}': {e}")
+            return None
+
+        post_id = None
+        if not self.find_by_image_url(image_url):
+            extra = {"image_variants": content["image_variants"]} if content.get("image_variants") else None
+            post_id = self.add_post(image_url, caption, hashtags, extra=extra, supersede=False)
+            print(f"Imported legacy '{path}' as post {post_id}.")
+        os.remove(path)
+        return post_id
+
+def open_queue(path=POST_QUEUE_DB):
+    """Opens the post queue, creating it and importing the legacy pending file if needed."""
+    queue = PostQueue(path)
+    queue.import_legacy_json()
+    return queue
+
+# *** Command-line helper for operators ***
+def main():
+    """
+    Usage:
+        python post_queue.py list [status]
+        python post_queue.py approve <id>
+        python post_queue.py reject <id>
+        python post_queue.py journal <id>
+        python post_queue.py confirm <id> <account> published|failed
+    """
+    args = sys.argv[1:]
+    queue = open_queue()
+    if not args or args[0] == "list":
+        status = args[1] if len(args) > 1 else None
+        for post in queue.list_posts(status):
+            print(f"{post['id']:>5}  {post['scheduled_date']}  {post['status']:<10} {post['caption'][:60]}")
+    elif args[0] in ("approve", "reject") and len(args) == 2:
+        post_id = int(args[1])
+        if not queue.get(post_id):
+            print(f"Error: no post with id {post_id}.")
+            exit(1)
+        getattr(queue, args[0])(post_id)
+        print(f"Post {post_id} {args[0]}d.")
+    elif args[0] == "journal" and len(args) == 2:
+        # What each account has of a post: a 'publishing' row is a publish TikTok has
+        # accepted (or, without a publish id, one whose content/init never answered).
+        for account, publication in queue.publications(int(args[1])).items():
+            print(f"{account:<15} {publication['status']:<10} {publication['publish_id'] or '-':<24} "
+                  f"{publication['updated_at']}  {json.dumps(publication['result'])}")
+    elif args[0] == "confirm" and len(args) == 4 and args[3] in (STATUS_PUBLISHED, STATUS_FAILED):
+        # After checking TikTok by hand: 'published' if the post is there, 'failed' if not
+        # (then re-approve the post to publish it to that account).
+        post_id, account = int(args[1]), args[2]
+        publication = queue.publications(post_id).get(account)
+        if not publication or publication["status"] != STATUS_UNKNOWN:
+            print(f"Error: post {post_id} has no unknown publication on '{account}'.")
+            exit(1)
+        queue.record_publication(post_id, account, args[3], result={"confirmed_by": "operator"})
+        print(f"Recorded post {post_id} on '{account}' as {args[3]}.")
+    else:
+        print(main.__doc__)
+        exit(1)
+
+if __name__ == "__main__":
+    main()
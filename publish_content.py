@@ -1,64 +1,82 @@
-import os
 import requests
+import http_transport
 import json
 import time
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
+from concurrent.futures import ThreadPoolExecutor
+import accounts
+import publish_status
+import post_queue
+import metrics
+import slack_outbox
+from config import settings
 
 # --- Configuration ---
-SLACK_WEBHOOK_URL = os.getenv("SLACK_WEBHOOK_URL")
-TIKTOK_CLIENT_KEY = os.getenv("TIKTOK_CLIENT_KEY")
-TIKTOK_CLIENT_SECRET = os.getenv("TIKTOK_CLIENT_SECRET")
-# The script now requires a long-lived refresh token.
-TIKTOK_REFRESH_TOKEN = os.getenv("TIKTOK_REFRESH_TOKEN")
+# Credentials, the Slack webhook and the TikTok API base come from config.settings.
+# The script requires a long-lived refresh token (TIKTOK_REFRESH_TOKEN). With several
+# accounts in tiktok_accounts.json, each one has its own TIKTOK_REFRESH_TOKEN_<NAME> instead.
 
 # --- Helper Functions ---
-def get_access_token():
+@metrics.timed("tiktok.token_refresh")
+def refresh_access_token(refresh_token):
     """
-    Refreshes the access token using the refresh token.
-    Returns the new access token, or None on failure.
+    Runs a refresh_token grant against TikTok's OAuth endpoint.
+    Returns the full token response (access token, expiry and rotated refresh token), or None on failure.
     """
     print("Refreshing TikTok access token...")
-    url = "https://open.tiktokapis.com/v2/oauth/token/"
+    url = f"{settings.tiktok_api_base}/v2/oauth/token/"
     headers = {'Content-Type': 'application/x-www-form-urlencoded'}
     payload = {
-        'client_key': TIKTOK_CLIENT_KEY,
-        'client_secret': TIKTOK_CLIENT_SECRET,
+        'client_key': settings.tiktok_client_key,
+        'client_secret': settings.tiktok_client_secret,
         'grant_type': 'refresh_token',
-        'refresh_token': TIKTOK_REFRESH_TOKEN,
+        'refresh_token': refresh_token,
     }
     
     try:
-        response = requests.post(url, headers=headers, data=payload)
+        response = http_transport.post(url, headers=headers, data=payload, rate_limit="tiktok.oauth")
         response.raise_for_status()
         token_data = response.json()
         
         if "access_token" in token_data:
             print("Successfully refreshed access token.")
-            return token_data["access_token"]
+            return token_data
         else:
             print(f"Error refreshing token. Response: {token_data}")
             return None
     except requests.exceptions.RequestException as e:
         print(f"Error refreshing access token: {e}")
-        if e.response:
+        if e.response is not None:
             print(f"API Response: {e.response.text}")
         return None
 
+@metrics.timed("tiktok.token")
+def get_access_token(account=None):
+    """
+    Returns a valid access token for an account (default: the TIKTOK_REFRESH_TOKEN one)
+    from its local token store.
+    The token is only refreshed when it is close to expiring; rotated refresh
+    tokens are kept in the store, with the account's refresh token variable as the fallback.
+    Returns None on failure.
+    """
+    account = account or accounts.Account(accounts.DEFAULT_ACCOUNT, refresh_token=settings.tiktok_refresh_token)
+    metrics.set_attrs(account=account.name)
+    return account.store.get_access_token(refresh_access_token, account.refresh_token)
+
+@metrics.timed("tiktok.creator_info")
 def query_creator_info(access_token):
     """
     Queries the Creator Info endpoint to get available privacy options.
     """
     print("Querying creator info as required by TikTok API...")
-    url = "https://open.tiktokapis.com/v2/post/publish/creator_info/query/"
+    url = f"{settings.tiktok_api_base}/v2/post/publish/creator_info/query/"
     headers = {
         "Authorization": f"Bearer {access_token}",
         "Content-Type": "application/json; charset=UTF-8"
     }
     try:
-        response = requests.post(url, headers=headers)
+        response = http_transport.post(
+            url, headers=headers, rate_limit="tiktok.creator_info", rate_scope=access_token
+        )
         response.raise_for_status()
         data = response.json()
         if data.get("error", {}).get("code", "ok").lower() == "ok":
@@ -70,19 +88,24 @@ def query_creator_info(access_token):
             return None
     except requests.exceptions.RequestException as e:
         print(f"Error calling creator info endpoint: {e}")
-        if e.response:
+        if e.response is not None:
             print(f"API Response: {e.response.text}")
         return None
 
-def post_to_tiktok(access_token, image_url, caption, hashtags, privacy_level):
+@metrics.timed("tiktok.content_init")
+def post_to_tiktok(access_token, image_urls, caption, hashtags, privacy_level):
     """
     Posts the generated image to TikTok using the PULL_FROM_URL method.
     The image is now referenced by a public URL from Cloudflare R2.
+    `image_urls` may be one URL or the ordered list of a carousel; either way it is
+    a single PHOTO post, with the first image as the cover.
     """
+    image_urls = [image_urls] if isinstance(image_urls, str) else list(image_urls)
     print("Initiating post to TikTok via PULL_FROM_URL...")
-    print(f"--> Using public image URL: {image_url}")
+    for image_url in image_urls:
+        print(f"--> Using public image URL: {image_url}")
 
-    endpoint = "https://open.tiktokapis.com/v2/post/publish/content/init/"
+    endpoint = f"{settings.tiktok_api_base}/v2/post/publish/content/init/"
     headers = {
         "Authorization": f"Bearer {access_token}",
         "Content-Type": "application/json; charset=UTF-8"
@@ -103,7 +126,7 @@ def post_to_tiktok(access_token, image_url, caption, hashtags, privacy_level):
         "source_info": {
             "source": "PULL_FROM_URL",
             "photo_cover_index": 0,
-            "photo_images": [image_url]
+            "photo_images": image_urls
         },
         "post_mode": "DIRECT_POST",
         "media_type": "PHOTO"
@@ -113,7 +136,11 @@ def post_to_tiktok(access_token, image_url, caption, hashtags, privacy_level):
     print(json.dumps(payload, indent=2))
 
     try:
-        resp = requests.post(endpoint, headers=headers, json=payload)
+        # content/init is not idempotent: a retried 5xx could create a second post.
+        resp = http_transport.post(
+            endpoint, headers=headers, json=payload, idempotent=False,
+            rate_limit="tiktok.content_init", rate_scope=access_token,
+        )
         resp.raise_for_status()
         result = resp.json()
 
@@ -129,18 +156,26 @@ def post_to_tiktok(access_token, image_url, caption, hashtags, privacy_level):
             
     except requests.exceptions.RequestException as e:
         print(f"Error posting to TikTok: {e}")
-        if e.response:
+        if e.response is not None:
             print(f"TikTok API raw error response: {e.response.text}")
         return False, None
 
-def send_slack_message(status, publish_id, caption, image_url):
+@metrics.timed("slack.publish")
+def send_slack_message(status, publish_id, caption, image_url, detail=None):
     """
-    Sends a final status notification to a Slack channel.
+    Queues a final status notification to a Slack channel (see slack_outbox).
+    'detail' is an optional extra line, e.g. TikTok's final publish status.
+    Returns True once the message is queued, None without a webhook.
     """
-    print("Sending final Slack notification...")
+    if not settings.slack_webhook_url:
+        print("SLACK_WEBHOOK_URL not set, skipping final notification.")
+        return None
+    print("Queueing final Slack notification...")
     status_text = "Successfully posted to TikTok ✔️" if status else "Failed to post to TikTok ❌"
-    if status and publish_id:
+    if publish_id:
         status_text += f" (Publish ID: {publish_id})"
+    if detail:
+        status_text += f"\n{detail}"
         
     message_text = (
         f"**Publishing Result** ✨\n\n"
@@ -149,68 +184,298 @@ def send_slack_message(status, publish_id, caption, image_url):
         f"<{image_url}|View the post source image here>"
     )
 
-    slack_payload = { "text": message_text }
-    
-    try:
-        resp = requests.post(SLACK_WEBHOOK_URL, json=slack_payload)
-        resp.raise_for_status()
-        print("Slack notification sent successfully.")
-    except requests.exceptions.RequestException as e:
-        print(f"Error sending Slack message: {e}")
+    slack_outbox.send("webhook", message_text, digest="publish")
+    return True
+
+# *** Multi-account fan-out ***
+def publish_to_account(account, image_urls, caption, hashtags, journal=None):
+    """
+    Runs the token, creator-info and content/init steps of one post for one account.
+    Never raises: any error is returned in the result, so one broken account can't
+    stop the others. `journal(account_name, publish_id)` is called right before
+    content/init (with publish_id None) and again once TikTok has accepted the post.
+    Returns a dict with 'account', 'access_token', 'publish_id', 'started_at' and
+    'error' (None when TikTok accepted the post).
+    """
+    result = {"account": account.name, "access_token": None, "publish_id": None, "started_at": None, "error": None}
+    with metrics.span("publish.account", account=account.name) as span:
+        try:
+            access_token = get_access_token(account)
+            if not access_token:
+                result["error"] = "could not get an access token"
+            else:
+                result["access_token"] = access_token
+                creator_info = query_creator_info(access_token)
+                # For an unaudited app, we must use one of the allowed levels, SELF_ONLY is the safest.
+                allowed_privacy_levels = (creator_info or {}).get("privacy_level_options", [])
+                if not creator_info:
+                    result["error"] = "creator info query failed"
+                elif account.privacy_level not in allowed_privacy_levels:
+                    result["error"] = f"privacy level '{account.privacy_level}' not in {allowed_privacy_levels}"
+                else:
+                    if journal:
+                        journal(account.name, None)
+                    result["started_at"] = time.time()
+                    success, publish_id = post_to_tiktok(access_token, image_urls, caption, hashtags, account.privacy_level)
+                    result["publish_id"] = publish_id
+                    if success and journal:
+                        journal(account.name, publish_id)
+                    if not success:
+                        result["error"] = "content/init was rejected"
+        except Exception as e:
+            result["error"] = f"unexpected error: {repr(e)}"
+        if result["error"]:
+            print(f"[{account.name}] Publishing failed: {result['error']}")
+            span.fail(result["error"])
+    return result
+
+def resume_account(account, publish_id):
+    """
+    Picks up a publish that an earlier run started: TikTok has already accepted it, so
+    only its status is tracked, without a second content/init.
+    Returns a result dict like publish_to_account().
+    """
+    result = {"account": account.name, "access_token": None, "publish_id": publish_id,
+              "started_at": time.time(), "error": None}
+    with metrics.span("publish.resume", account=account.name, publish_id=publish_id) as span:
+        print(f"[{account.name}] Resuming publish {publish_id} from an earlier run.")
+        try:
+            result["access_token"] = get_access_token(account)
+            if not result["access_token"]:
+                result["error"] = "could not get an access token"
+        except Exception as e:
+            result["error"] = f"unexpected error: {repr(e)}"
+        if result["error"]:
+            print(f"[{account.name}] Resuming failed: {result['error']}")
+            span.fail(result["error"])
+    return result
+
+def publish_to_accounts(accounts, image_urls, caption, hashtags, journal=None, resume=None):
+    """
+    Publishes one post to every account at the same time and waits for TikTok to
+    ingest all of them, so the run takes as long as the slowest account.
+    `resume` maps account names to the publish id of a publish an earlier run started;
+    those accounts are only tracked, not posted to again. `journal` is passed on to
+    publish_to_account().
+    Returns one result dict per account, in order, with 'success', 'status' and 'detail' added.
+    """
+    resume = resume or {}
+    with ThreadPoolExecutor(max_workers=len(accounts)) as executor:
+        futures = [
+            executor.submit(metrics.propagate(resume_account), account, resume[account.name])
+            if account.name in resume else
+            executor.submit(metrics.propagate(publish_to_account), account, image_urls, caption, hashtags, journal)
+            for account in accounts
+        ]
+        results = [future.result() for future in futures]
+
+    # Wait for TikTok to actually ingest the images; content/init only means "accepted".
+    in_flight = [result for result in results if not result["error"]]
+    statuses = publish_status.wait_for_publishes(
+        [(result["access_token"], result["publish_id"], result["started_at"]) for result in in_flight]
+    ) if in_flight else []
+    for result, status in zip(in_flight, statuses):
+        status["account"] = result["account"]
+        result["status"] = status
+    publish_status.record_results(statuses)
+
+    for result in results:
+        status = result.get("status")
+        result["success"] = bool(status) and status["status"] in publish_status.SUCCESS_STATUSES
+        if status:
+            result["detail"] = f"Final status: {status['status']} after {status['latency_s']:.0f}s"
+            if status.get("fail_reason"):
+                result["detail"] += f" ({status['fail_reason']})"
+        else:
+            result["detail"] = f"Failed: {result['error']}"
+        # Tokens stay in the token stores, never in the queue or the logs.
+        result.pop("access_token")
+    return results
+
+def send_fanout_summary(results, caption, image_url):
+    """Queues one Slack message summarizing a post's result on every account."""
+    print("Queueing Slack fan-out summary...")
+    succeeded = sum(1 for result in results if result["success"])
+    lines = []
+    for result in results:
+        icon = "✔️" if result["success"] else "❌"
+        line = f"{icon} *{result['account']}*: {result['detail']}"
+        if result["publish_id"]:
+            line += f" (Publish ID: {result['publish_id']})"
+        lines.append(line)
+
+    message_text = (
+        f"**Publishing Result** ✨ Posted to {succeeded}/{len(results)} TikTok accounts\n\n"
+        f"*Caption:*\n{caption}\n\n"
+        f"*Accounts:*\n" + "\n".join(lines) + "\n\n"
+        f"<{image_url}|View the post source image here>"
+    )
+    slack_outbox.send("webhook", message_text, digest="publish")
+    return True
 
 # *** Main execution flow ***
-if __name__ == "__main__":
-    print("Starting publishing script...")
+def publish_post(queue, post, all_accounts):
+    """
+    Publishes a queued post to every account that doesn't have it yet, records the
+    outcome per account and for the post, and sends the Slack result.
+    Used by main() and by the daemon. Returns True if every account has the post.
+    An approved draft is first rendered at full quality (see generate_content.finalize_draft).
 
-    # 1. Load content from the pending file
-    try:
-        with open("pending_post.json", "r") as f:
-            content = json.load(f)
-        # The key is now 'image_url' and contains a full public URL
-        image_url = content["image_url"]
-        caption = content["caption"]
-        hashtags = content["hashtags"]
-    except (FileNotFoundError, KeyError) as e:
-        print(f"Error: Could not read 'pending_post.json' or file is invalid. {e}")
-        # Notify Slack about the failure if possible
-        send_slack_message(False, None, "Could not find pending post file.", "https://via.placeholder.com/512.png?text=Error")
-        exit(1)
+    Every content/init is journaled in the queue's publications table before and right
+    after it is sent, so running this again for the same post never posts twice: accounts
+    that have the post are skipped, publishes TikTok accepted are only tracked, and a
+    content/init that never answered is marked 'unknown' for the operator to check.
+    Unknown accounts are only posted to again once the post has been re-approved.
+    """
+    post_id = post["id"]
+    metrics.set_attrs(post_id=post_id)
+    # An approved post was (re-)approved by the operator; anything else is an automatic resume.
+    reapproved = post["status"] == post_queue.STATUS_APPROVED
 
-    # 2. Get a fresh access token
-    access_token = get_access_token()
-    if not access_token:
-        print("Failed to get access token, cannot publish. Exiting.")
-        send_slack_message(False, None, caption, "https://via.placeholder.com/512.png?text=Auth+Error")
-        exit(1)
-        
-    # 3. Query creator info to verify permissions
-    creator_info = query_creator_info(access_token)
-    if not creator_info:
-        send_slack_message(False, None, caption, "https://via.placeholder.com/512.png?text=Creator+Info+Error")
-        exit(1)
+    # 0. An approved draft gets its full-quality images before it goes anywhere
+    if post.get("draft"):
+        # generate_content (and the OpenAI SDK) is only needed for drafts.
+        import generate_content
+        finalized = generate_content.finalize_draft(queue, post)
+        if not finalized:
+            queue.set_status(post_id, post_queue.STATUS_FAILED, publish_result={"error": "final render failed"})
+            print(f"Post {post_id} marked as failed. Approve it again to retry the final render.")
+            return False
+        post = finalized
+    image_url = post["image_url"]
+    # Carousels list every image in order; single-image posts only have 'image_url'.
+    image_urls = post.get("image_urls") or [image_url]
+    caption = post["caption"]
+    hashtags = post["hashtags"]
 
-    # For an unaudited app, we must use one of the allowed levels, SELF_ONLY is the safest.
-    allowed_privacy_levels = creator_info.get("privacy_level_options", [])
-    print(f"Available privacy options: {allowed_privacy_levels}")
-    
-    privacy_level_to_use = "SELF_ONLY"
-    if privacy_level_to_use not in allowed_privacy_levels:
-        print(f"Error: '{privacy_level_to_use}' is not in the allowed list from TikTok: {allowed_privacy_levels}")
-        send_slack_message(False, None, "Publishing failed: Privacy level mismatch.", "https://via.placeholder.com/512.png?text=Privacy+Error")
-        exit(1)
+    # 1. Read the journal: skip accounts that already have this post (e.g. a re-approved,
+    # partially failed post) and resume the publishes an earlier run left in flight
+    publications = queue.publications(post_id)
+    published = {
+        account for account, publication in publications.items()
+        if publication["status"] == post_queue.STATUS_PUBLISHED
+    }
+    in_flight = {
+        account: publication["publish_id"] for account, publication in publications.items()
+        if publication["status"] == post_queue.STATUS_PUBLISHING
+    }
+    resume = {account: publish_id for account, publish_id in in_flight.items() if publish_id}
+    # A run died while sending content/init: TikTok may or may not have the post.
+    for account, publish_id in in_flight.items():
+        if not publish_id:
+            queue.record_publication(post_id, account, post_queue.STATUS_UNKNOWN,
+                                     result={"error": "content/init outcome unknown"})
+    unknown = sorted(
+        account for account, publication in queue.publications(post_id).items()
+        if publication["status"] == post_queue.STATUS_UNKNOWN
+    )
+    if reapproved and unknown:
+        print(f"Post {post_id} was approved again; publishing to {', '.join(unknown)} once more.")
+        unknown = []
+    for account in unknown:
+        print(f"[{account}] An earlier run stopped during content/init. Check the account on TikTok, then run "
+              f"'python post_queue.py confirm {post_id} {account} published' if the post is there, "
+              f"or re-approve post {post_id} to publish it there again.")
+    targets = [account for account in all_accounts if account.name not in published and account.name not in unknown]
+    if published:
+        print(f"Already published to: {', '.join(sorted(published))}.")
+    print(f"Publishing post {post_id} to {len(targets)} account(s): {', '.join(a.name for a in targets)}")
+
+    # 2. Publish to every remaining account at the same time
+    queue.set_status(post_id, post_queue.STATUS_PUBLISHING)
 
-    # 4. Post to TikTok
-    success, publish_id = post_to_tiktok(access_token, image_url, caption, hashtags, privacy_level_to_use)
+    def journal(account, publish_id):
+        queue.record_publication(post_id, account, post_queue.STATUS_PUBLISHING, publish_id=publish_id)
 
-    # 5. Notify via Slack
-    # We now use the image_url directly from the pending file for the notification
-    if SLACK_WEBHOOK_URL:
-        send_slack_message(success, publish_id, caption, image_url)
+    results = publish_to_accounts(targets, image_urls, caption, hashtags, journal, resume) if targets else []
+    for result in results:
+        if result["success"]:
+            publication_status = post_queue.STATUS_PUBLISHED
+        elif result.get("status", {}).get("status") == "TIMEOUT":
+            # Accepted but not confirmed in time: the next run keeps tracking it.
+            publication_status = post_queue.STATUS_PUBLISHING
+        else:
+            publication_status = post_queue.STATUS_FAILED
+        queue.record_publication(
+            post_id, result["account"], publication_status,
+            publish_id=result["publish_id"], result=result.get("status") or {"error": result["error"]},
+        )
+
+    # 3. The post counts as published once every account has it
+    success = not unknown and all(result["success"] for result in results)
+    if success:
+        final_status = post_queue.STATUS_PUBLISHED
+    elif any(result.get("status", {}).get("status") == "TIMEOUT" for result in results):
+        final_status = post_queue.STATUS_PUBLISHING
+    else:
+        final_status = post_queue.STATUS_FAILED
+    if len(all_accounts) == 1 and results:
+        queue.set_status(post_id, final_status, publish_id=results[0]["publish_id"],
+                         publish_result=results[0].get("status"))
     else:
+        queue.set_status(post_id, final_status)
+    print(f"Post {post_id} marked as {final_status}.")
+
+    # 4. Notify via Slack: one message, however many accounts were involved
+    # We now use the image_url directly from the queued post for the notification
+    if not settings.slack_webhook_url:
         print("SLACK_WEBHOOK_URL not set, skipping final notification.")
+    elif len(all_accounts) == 1 and results:
+        result = results[0]
+        send_slack_message(result["success"], result["publish_id"], caption, image_url, result["detail"])
+    elif results:
+        send_fanout_summary(results, caption, image_url)
+
+    return success
+
+@metrics.timed("publish.run", check_result=False)
+def main(argv=None):
+    """
+    Publishes the next due post from the queue to TikTok, on every configured account.
+    Usage: python publish_content.py [--accounts name1,name2]
+    """
+    import sys
+    argv = sys.argv[1:] if argv is None else argv
+    print("Starting publishing script...")
+    slack_outbox.flush_spool()
+
+    names = None
+    if "--accounts" in argv:
+        index = argv.index("--accounts")
+        if index + 1 >= len(argv):
+            print("Error: --accounts expects a comma-separated list of account names.")
+            exit(1)
+        names = [name.strip() for name in argv[index + 1].split(",") if name.strip()]
+    try:
+        all_accounts = accounts.load_accounts(names=names)
+    except ValueError as e:
+        print(f"Error: {e}")
+        exit(1)
+
+    # 1. Load the next due post from the queue, finishing a publish an earlier run left in flight first
+    queue = post_queue.open_queue()
+    post = queue.next_due(post_queue.STATUS_PUBLISHING) or queue.next_due_approved()
+    if not post:
+        # Running the publish workflow is the approval of today's post, the one the last
+        # Slack message showed. Older unapproved posts are never published this way.
+        post = queue.latest(post_queue.STATUS_GENERATED)
+        if post:
+            queue.approve(post["id"])
+            print(f"Approved post {post['id']} scheduled for {post['scheduled_date']}.")
+    if not post:
+        print(f"Error: No approved post is due and no post was generated for today in '{queue.path}'.")
+        # Notify Slack about the failure if possible
+        send_slack_message(False, None, "Could not find a post to publish.", "https://via.placeholder.com/512.png?text=Error")
+        exit(1)
+
+    # 2. Publish it to every account
+    success = publish_post(queue, post, all_accounts)
 
     if success:
         print("Script finished successfully!")
     else:
         print("Script finished with errors.")
-        exit(1) 
\ No newline at end of file
+        exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import asyncio
+from datetime import datetime
+
+import requests
+import http_transport
+import metrics
+from config import settings
+
+# --- Configuration ---
+STATUS_URL = f"{settings.tiktok_api_base}/v2/post/publish/status/fetch/"
+# Statuses after which TikTok won't change the publish any more.
+TERMINAL_STATUSES = {"PUBLISH_COMPLETE", "FAILED", "SEND_TO_USER_INBOX"}
+SUCCESS_STATUSES = {"PUBLISH_COMPLETE", "SEND_TO_USER_INBOX"}
+
+# Adaptive polling: start fast, slow down while the status stays the same, and
+# drop back to the initial delay whenever the status moves forward.
+POLL_INITIAL_DELAY = float(os.getenv("PUBLISH_POLL_INITIAL_DELAY", "2"))
+POLL_MAX_DELAY = float(os.getenv("PUBLISH_POLL_MAX_DELAY", "30"))
+POLL_BACKOFF = 1.6
+POLL_TIMEOUT = float(os.getenv("PUBLISH_POLL_TIMEOUT", "600"))
+
+PUBLISH_LOG_PATH = os.getenv("PUBLISH_LOG_PATH", "publish_log.jsonl")
+
+@metrics.timed("tiktok.status_fetch")
+def fetch_publish_status(access_token, publish_id):
+    """
+    Calls TikTok's publish-status endpoint once.
+    Returns the 'data' dict (status, fail_reason, ...), or None on failure.
+    """
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json; charset=UTF-8"
+    }
+    try:
+        response = http_transport.post(
+            STATUS_URL, headers=headers, json={"publish_id": publish_id},
+            rate_limit="tiktok.status_fetch", rate_scope=access_token,
+        )
+        response.raise_for_status()
+        result = response.json()
+        if result.get("error", {}).get("code", "ok").lower() != "ok":
+            print(f"Error fetching publish status for {publish_id}: {result.get('error')}")
+            return None
+        return result.get("data", {})
+    except requests.exceptions.RequestException as e:
+        print(f"Error calling publish status endpoint for {publish_id}: {e}")
+        return None
+
+async def track_publish(access_token, publish_id, started_at=None, timeout=POLL_TIMEOUT):
+    """
+    Polls the status of one publish until it reaches a terminal state or times out.
+    `started_at` is the time.time() at which content/init was called; the reported
+    latency is measured from there to the first poll that saw the final state.
+    Returns a result dict with 'publish_id', 'status', 'fail_reason', 'latency_s' and 'polls'.
+    """
+    started_at = started_at or time.time()
+    deadline = started_at + timeout
+    delay = POLL_INITIAL_DELAY
+    last_status = None
+    polls = 0
+
+    while True:
+        data = await asyncio.to_thread(fetch_publish_status, access_token, publish_id)
+        polls += 1
+        status = (data or {}).get("status")
+
+        if status in TERMINAL_STATUSES:
+            latency = time.time() - started_at
+            print(f"Publish {publish_id} finished with status {status} after {latency:.1f}s.")
+            return {
+                "publish_id": publish_id,
+                "status": status,
+                "fail_reason": data.get("fail_reason"),
+                "latency_s": round(latency, 3),
+                "polls": polls,
+            }
+
+        if status and status != last_status:
+            print(f"Publish {publish_id} is {status}...")
+            delay = POLL_INITIAL_DELAY
+        else:
+            delay = min(POLL_MAX_DELAY, delay * POLL_BACKOFF)
+        last_status = status or last_status
+
+        if time.time() + delay > deadline:
+            print(f"Gave up waiting for publish {publish_id} after {timeout:.0f}s (last status: {last_status}).")
+            return {
+                "publish_id": publish_id,
+                "status": "TIMEOUT",
+                "fail_reason": f"last status: {last_status}",
+                "latency_s": round(time.time() - started_at, 3),
+                "polls": polls,
+            }
+        await asyncio.sleep(delay)
+
+async def track_publishes(publishes, timeout=POLL_TIMEOUT):
+    """
+    Tracks many in-flight publishes concurrently on one event loop.
+    `publishes` is a list of (access_token, publish_id, started_at) tuples.
+    Returns the result dicts in the same order.
+    """
+    return await asyncio.gather(*(
+        track_publish(access_token, publish_id, started_at, timeout)
+        for access_token, publish_id, started_at in publishes
+    ))
+
+@metrics.timed("tiktok.publish_wait")
+def wait_for_publishes(publishes, timeout=POLL_TIMEOUT):
+    """Blocking wrapper around track_publishes() for the synchronous scripts."""
+    results = asyncio.run(track_publishes(publishes, timeout))
+    metrics.set_attrs(
+        statuses=[result["status"] for result in results],
+        polls=sum(result["polls"] for result in results),
+    )
+    if any(result["status"] not in SUCCESS_STATUSES for result in results):
+        metrics.current_span().fail()
+    return results
+
+def record_results(results, path=PUBLISH_LOG_PATH):
+    """Appends the final state and ingest latency of each publish to a JSON Lines log."""
+    with open(path, "a") as f:
+        for result in results:
+            f.write(json.dumps({"recorded_at": datetime.now().isoformat(timespec="seconds"), **result}) + "\n")
@@ -0,0 +1,220 @@
+import io
+import os
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import rate_limiter
+from config import settings
+
+# boto3 takes a few hundred milliseconds to import, so it is only imported by the
+# first call that talks to R2; commands that never upload do not pay for it.
+
+# --- Configuration ---
+# Objects are stored under '<prefix><sha256>.<extension>', so identical bytes map to
+# one object and a new image never overwrites an older one.
+R2_KEY_PREFIX = os.getenv("R2_KEY_PREFIX", "images/")
+# Objects uploaded at the same time through upload_many().
+UPLOAD_WORKERS = int(os.getenv("R2_UPLOAD_WORKERS", "8"))
+
+# Files above the threshold are sent as a multipart upload with parts sent in parallel.
+# Rendered images stay below it and go out as a single PUT.
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+TRANSFER_CONCURRENCY = int(os.getenv("R2_TRANSFER_CONCURRENCY", "8"))
+
+# S3 returns at most 1000 keys per listing page and deletes at most 1000 keys per request.
+LIST_PAGE_SIZE = 1000
+DELETE_BATCH_SIZE = 1000
+
+_client = None
+_transfer_config = None
+_client_lock = threading.Lock()
+_executor = None
+_executor_lock = threading.Lock()
+
+def is_configured():
+    return settings.r2_configured()
+
+def get_client():
+    """
+    Returns the shared boto3 S3 client for R2, creating it on first use.
+    Building a client costs tens of milliseconds, and boto3 clients are thread-safe
+    once built, so every upload of the process reuses this one and its connections.
+    """
+    global _client, _transfer_config
+    with _client_lock:
+        if _client is None:
+            with metrics.span("r2.client"):
+                import boto3
+                from boto3.s3.transfer import TransferConfig
+                from botocore.config import Config
+
+                _client = boto3.client(
+                    service_name='s3',
+                    endpoint_url=settings.r2_endpoint_url,
+                    aws_access_key_id=settings.r2_access_key_id,
+                    aws_secret_access_key=settings.r2_secret_access_key,
+                    region_name='auto', # Required by boto3, 'auto' is fine for R2
+                    config=Config(max_pool_connections=max(10, UPLOAD_WORKERS * 2)),
+                )
+                _transfer_config = TransferConfig(
+                    multipart_threshold=MULTIPART_THRESHOLD,
+                    multipart_chunksize=MULTIPART_CHUNKSIZE,
+                    max_concurrency=TRANSFER_CONCURRENCY,
+                    use_threads=True,
+                )
+    return _client
+
+def get_executor():
+    """Returns the thread pool shared by every upload_many() and delete_objects() call of the process."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="r2-upload")
+    return _executor
+
+def content_key(data, extension):
+    """Returns the content-addressed object key of some bytes."""
+    return f"{R2_KEY_PREFIX}{hashlib.sha256(data).hexdigest()}.{extension}"
+
+def public_url(object_key):
+    return f"https://{settings.r2_public_domain}/{object_key}"
+
+def object_exists(object_key):
+    """
+    Checks with a HEAD request whether an object is already in the bucket.
+    Returns True or False, or None if the check itself failed.
+    """
+    from botocore.exceptions import ClientError
+    client = get_client()
+    try:
+        with rate_limiter.get_limiter("r2.head").slot():
+            client.head_object(Bucket=settings.r2_bucket_name, Key=object_key)
+        return True
+    except ClientError as e:
+        status = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+        if status == 404 or e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return False
+        print(f"Could not check whether '{object_key}' exists in R2: {repr(e)}")
+        return None
+
+def _put(fileobj, object_key, content_type):
+    """Sends one object to R2 with the shared client. Returns the public URL, or None on failure."""
+    fileobj.seek(0, os.SEEK_END)
+    size = fileobj.tell()
+    fileobj.seek(0)
+    metrics.set_attrs(object_key=object_key)
+    limiter = rate_limiter.get_limiter("r2.put")
+    from botocore.exceptions import ClientError
+    try:
+        client = get_client()
+        print(f"Uploading '{object_key}' to R2 bucket '{settings.r2_bucket_name}'...")
+        with limiter.slot():
+            client.upload_fileobj(
+                fileobj,
+                settings.r2_bucket_name,
+                object_key,
+                ExtraArgs={'ContentType': content_type},
+                Config=_transfer_config,
+            )
+        metrics.add_bytes(size)
+        url = public_url(object_key)
+        print(f"✅ Successfully uploaded to R2. Public URL: {url}")
+        return url
+    except ClientError as e:
+        # Catch specific boto3 client errors for better diagnostics
+        error_code = e.response.get("Error", {}).get("Code")
+        metadata = e.response.get("ResponseMetadata", {})
+        limiter.observe(metadata.get("HTTPStatusCode"), metadata.get("HTTPHeaders"))
+        print(f"A client-side error occurred: {error_code}. Check your credentials and bucket settings.")
+        print(f"Full error: {repr(e)}")
+        return None
+    except Exception as e:
+        print(f"An unexpected error occurred during R2 upload: {repr(e)}")
+        return None
+
+@metrics.timed("r2.upload")
+def upload_bytes(data, extension, content_type="image/png"):
+    """
+    Uploads bytes under their content-hash key. If an object with that key already
+    exists the upload is skipped, since the same key means the same bytes.
+    Returns the public URL, or None on failure.
+    """
+    if not is_configured():
+        print("Error: Missing one or more Cloudflare R2 environment variables. Please check repository secrets.")
+        return None
+    object_key = content_key(data, extension)
+    if object_exists(object_key):
+        print(f"'{object_key}' is already in R2; skipping the upload.")
+        metrics.set_attrs(object_key=object_key, deduplicated=True)
+        return public_url(object_key)
+    # BytesIO over an immutable bytes object shares its buffer instead of copying it.
+    return _put(io.BytesIO(data), object_key, content_type)
+
+def list_objects(prefix="", delimiter=None):
+    """
+    Yields every object under `prefix` as a dict with 'Key', 'LastModified' (datetime)
+    and 'Size', fetching one page of up to LIST_PAGE_SIZE keys at a time. With a
+    delimiter such as '/', keys below the next delimiter are not listed.
+    """
+    client = get_client()
+    limiter = rate_limiter.get_limiter("r2.list")
+    params = {"Bucket": settings.r2_bucket_name, "Prefix": prefix, "MaxKeys": LIST_PAGE_SIZE}
+    if delimiter:
+        params["Delimiter"] = delimiter
+    while True:
+        with metrics.span("r2.list_page", prefix=prefix), limiter.slot():
+            page = client.list_objects_v2(**params)
+        yield from page.get("Contents", [])
+        if not page.get("IsTruncated"):
+            return
+        params["ContinuationToken"] = page["NextContinuationToken"]
+
+@metrics.timed("r2.delete_batch")
+def _delete_batch(keys):
+    """Deletes up to DELETE_BATCH_SIZE keys in one request. Returns the list of keys that failed."""
+    client = get_client()
+    try:
+        with rate_limiter.get_limiter("r2.delete").slot():
+            response = client.delete_objects(
+                Bucket=settings.r2_bucket_name,
+                Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
+            )
+    except Exception as e:
+        print(f"Could not delete a batch of {len(keys)} object(s) from R2: {repr(e)}")
+        return list(keys)
+    errors = response.get("Errors", [])
+    for error in errors[:5]:
+        print(f"Could not delete '{error.get('Key')}': {error.get('Code')} {error.get('Message')}")
+    return [error.get("Key") for error in errors]
+
+def delete_objects(keys):
+    """
+    Deletes objects in batches of DELETE_BATCH_SIZE keys, sent at the same time through
+    the shared thread pool. Returns the list of keys that could not be deleted.
+    """
+    keys = list(keys)
+    executor = get_executor()
+    futures = [
+        executor.submit(metrics.propagate(_delete_batch), keys[i:i + DELETE_BATCH_SIZE])
+        for i in range(0, len(keys), DELETE_BATCH_SIZE)
+    ]
+    return [key for future in futures for key in future.result()]
+
+def upload_many(items):
+    """
+    Uploads several objects at once through the shared thread pool.
+    `items` maps a name to (data, extension, content_type). Returns a dict mapping
+    each name to its public URL, or None if any upload failed.
+    """
+    executor = get_executor()
+    futures = {
+        name: executor.submit(metrics.propagate(upload_bytes), data, extension, content_type)
+        for name, (data, extension, content_type) in items.items()
+    }
+    urls = {name: future.result() for name, future in futures.items()}
+    if not all(urls.values()):
+        return None
+    return urls
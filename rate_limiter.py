@@ -0,0 +1,220 @@
+import os
+import re
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+import metrics
+
+# --- Configuration ---
+# Requests per minute and concurrent requests allowed per provider endpoint. They are
+# conservative defaults for new accounts; raise them for higher quota tiers with
+# RATE_LIMIT_<ENDPOINT>_RPM / _CONCURRENCY / _BURST, e.g. RATE_LIMIT_OPENAI_IMAGES_RPM=20.
+# TikTok counts its limits per user access token, so those buckets are per token.
+DEFAULT_LIMITS = {
+    "openai.chat": {"rpm": 500, "concurrency": 8},
+    "openai.images": {"rpm": 5, "concurrency": 4},
+    "r2.put": {"rpm": 600, "concurrency": 8},
+    "r2.head": {"rpm": 1200, "concurrency": 8},
+    "r2.list": {"rpm": 300, "concurrency": 2},
+    "r2.delete": {"rpm": 300, "concurrency": 4},
+    "tiktok.oauth": {"rpm": 60, "concurrency": 2},
+    "tiktok.creator_info": {"rpm": 20, "concurrency": 2},
+    "tiktok.content_init": {"rpm": 6, "concurrency": 1},
+    "tiktok.status_fetch": {"rpm": 30, "concurrency": 4},
+    "slack.webhook": {"rpm": 60, "concurrency": 1},
+    "slack.chat": {"rpm": 50, "concurrency": 2},
+}
+FALLBACK_LIMIT = {"rpm": 60, "concurrency": 4}
+# Multiplies every RPM; the offline benchmark uses it to take pacing out of the picture.
+RATE_LIMIT_SCALE = float(os.getenv("RATE_LIMIT_SCALE", "1"))
+
+# Adaptation: a 429 halves the rate (never below MIN_RATE_FRACTION of the configured
+# one) and every successful response wins back RECOVERY_STEP of it.
+MIN_RATE_FRACTION = 0.1
+RECOVERY_STEP = 0.05
+
+def _env_name(name, suffix):
+    return "RATE_LIMIT_" + re.sub(r"[^A-Z0-9]", "_", name.upper()) + "_" + suffix
+
+def _parse_duration(value):
+    """
+    Parses rate-limit reset values: plain seconds ('12', '0.5'), OpenAI durations
+    ('6m0s', '1.2s', '20ms') or an epoch timestamp. Returns seconds from now, or None.
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        number = float(value)
+    except ValueError:
+        parts = re.findall(r"([\d.]+)(ms|h|m|s)", value)
+        if not parts:
+            return None
+        scale = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+        return sum(float(amount) * scale[unit] for amount, unit in parts)
+    # Values this large are absolute epoch seconds, not a delay.
+    return max(0.0, number - time.time()) if number > 1e9 else max(0.0, number)
+
+def retry_after(headers):
+    """
+    Parses the Retry-After header (seconds or an HTTP date) of a response's headers.
+    Returns the delay in seconds, or None if the header is missing or invalid.
+    """
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    seconds = _parse_duration(value)
+    if seconds is not None:
+        return seconds
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+class RateLimiter:
+    """
+    A token bucket plus a concurrency cap for one provider endpoint.
+
+    Tokens refill at `rpm` per minute up to `burst`; every request takes one token
+    and one of `concurrency` slots, waiting for both if needed. Responses are fed
+    back with observe(): a 429 or an exhausted 'remaining' header pauses the bucket
+    until the provider's reset time and lowers the rate, and successes raise it back
+    step by step. One limiter is shared by every thread of the process.
+    """
+
+    def __init__(self, name, rpm, concurrency, burst=None):
+        self.name = name
+        self.max_rate = rpm / 60.0
+        self.rate = self.max_rate
+        self.concurrency = max(1, int(concurrency))
+        self.capacity = max(1.0, float(burst or min(self.concurrency, rpm)))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Blocks until a token and a concurrency slot are free. Returns the seconds waited."""
+        start = time.monotonic()
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                elif self.in_flight >= self.concurrency:
+                    wait = None  # woken up by release()
+                elif self.tokens < 1:
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    self.tokens -= 1
+                    self.in_flight += 1
+                    return time.monotonic() - start
+                self._cond.wait(wait)
+
+    def try_acquire(self):
+        """Takes a token and a concurrency slot if both are free right now. Returns True if it did."""
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self.blocked_until or self.in_flight >= self.concurrency or self.tokens < 1:
+                return False
+            self.tokens -= 1
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        """Holds one request's worth of quota for the duration of the block."""
+        waited = self.acquire()
+        if waited > 0.05:
+            span = metrics.current_span()
+            if span:
+                span.set(rate_limit_wait_s=round(span.attrs.get("rate_limit_wait_s", 0) + waited, 3))
+        try:
+            yield self
+        finally:
+            self.release()
+
+    def observe(self, status, headers):
+        """
+        Adapts the limiter to a response: its status code and rate-limit headers
+        (Retry-After, and x-ratelimit-limit/remaining/reset in OpenAI's or the generic form).
+        """
+        headers = headers or {}
+        limit = headers.get("x-ratelimit-limit-requests")
+        remaining = headers.get("x-ratelimit-remaining-requests", headers.get("x-ratelimit-remaining"))
+        reset = _parse_duration(headers.get("x-ratelimit-reset-requests", headers.get("x-ratelimit-reset")))
+
+        with self._cond:
+            now = time.monotonic()
+            if limit:
+                try:
+                    # OpenAI's request limit is per minute; never run faster than the real quota.
+                    self.max_rate = min(self.max_rate, float(limit) / 60.0)
+                    self.rate = min(self.rate, self.max_rate)
+                except ValueError:
+                    pass
+
+            if status == 429:
+                pause = retry_after(headers)
+                if pause is None:
+                    pause = reset if reset is not None else 1 / self.rate
+                self.blocked_until = max(self.blocked_until, now + pause)
+                self.rate = max(self.max_rate * MIN_RATE_FRACTION, self.rate / 2)
+                self.tokens = 0
+                print(f"Rate limited on {self.name}; pausing {pause:.1f}s and slowing to {self.rate * 60:.1f}/min.")
+            else:
+                try:
+                    exhausted = remaining is not None and int(float(remaining)) <= 0
+                except ValueError:
+                    exhausted = False
+                if exhausted and reset:
+                    self.blocked_until = max(self.blocked_until, now + reset)
+                self.rate = min(self.max_rate, self.rate + self.max_rate * RECOVERY_STEP)
+            self._cond.notify_all()
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def limits_for(name):
+    """Returns the configured {'rpm', 'concurrency', 'burst'} of an endpoint, with env overrides."""
+    limits = dict(DEFAULT_LIMITS.get(name, FALLBACK_LIMIT))
+    for key, suffix, cast in (("rpm", "RPM", float), ("concurrency", "CONCURRENCY", int), ("burst", "BURST", float)):
+        value = os.getenv(_env_name(name, suffix))
+        if value:
+            limits[key] = cast(value)
+    limits["rpm"] = limits["rpm"] * RATE_LIMIT_SCALE
+    return limits
+
+def get_limiter(name, scope=None):
+    """
+    Returns the shared limiter of an endpoint, e.g. 'openai.images' or 'tiktok.content_init'.
+    `scope` separates buckets of the same endpoint, such as TikTok's per-token quotas;
+    it is hashed, so access tokens can be passed as-is without being kept in memory.
+    """
+    key = (name, hashlib.sha256(scope.encode("utf-8")).hexdigest()[:16] if scope else None)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limits = limits_for(name)
+            limiter = RateLimiter(name, limits["rpm"], limits["concurrency"], limits.get("burst"))
+            _limiters[key] = limiter
+    return limiter
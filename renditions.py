@@ -0,0 +1,120 @@
+import io
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+
+# Pillow is imported on first use, so commands that never render do not load it.
+
+# *** Rendition settings ***
+# Every generated image is re-encoded into these variants before upload.
+# 'full' is the compressed image TikTok pulls via PULL_FROM_URL,
+# 'thumbnail' is the small preview shown in the Slack approval message.
+RENDITIONS = {
+    "full": {
+        "format": "JPEG",
+        "max_size": 1024,
+        "quality": 85,
+        "extension": "jpg",
+        "content_type": "image/jpeg",
+    },
+    "thumbnail": {
+        "format": "JPEG",
+        "max_size": 256,
+        "quality": 70,
+        "extension": "jpg",
+        "content_type": "image/jpeg",
+    },
+}
+
+# Number of encoder processes. Set RENDITION_WORKERS=0 to encode in the calling thread.
+RENDITION_WORKERS = int(os.getenv("RENDITION_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_process_pool = None
+
+def render_variant(image_bytes, spec):
+    """
+    Re-encodes an image according to a rendition spec.
+    Runs inside a worker process, so it only takes and returns picklable values.
+    Returns the encoded image as bytes.
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image = image.convert("RGB")
+        max_size = spec["max_size"]
+        if max(image.size) > max_size:
+            image.thumbnail((max_size, max_size), Image.LANCZOS)
+
+        output = io.BytesIO()
+        save_args = {"quality": spec["quality"]}
+        if spec["format"] == "JPEG":
+            save_args.update(optimize=True, progressive=True)
+        elif spec["format"] == "WEBP":
+            save_args.update(method=6)
+        image.save(output, spec["format"], **save_args)
+        return output.getvalue()
+
+def get_process_pool():
+    """
+    Returns the shared encoder process pool, creating it on first use.
+    Returns None when RENDITION_WORKERS is 0.
+    """
+    global _process_pool
+    if _process_pool is None and RENDITION_WORKERS > 0:
+        # Forking is much cheaper than spawning (no re-import of openai/boto3 per worker),
+        # but it is only safe before any threads exist; see start_process_pool(). A pool
+        # first needed later, e.g. by a publish run rendering a draft, uses a fork server.
+        methods = multiprocessing.get_all_start_methods()
+        if "fork" in methods and threading.active_count() == 1:
+            start_method = "fork"
+        else:
+            start_method = "forkserver" if "forkserver" in methods else "spawn"
+        context = multiprocessing.get_context(start_method)
+        _process_pool = ProcessPoolExecutor(max_workers=RENDITION_WORKERS, mp_context=context)
+    return _process_pool
+
+def start_process_pool():
+    """
+    Creates the encoder pool and starts its workers right away.
+    Call this before starting worker threads: with the 'fork' start method all
+    workers are created on the first submit, so they are forked while the
+    process is still single-threaded.
+    """
+    # Imported here so forked workers inherit it instead of importing it on their first image.
+    from PIL import Image  # noqa: F401
+
+    pool = get_process_pool()
+    if pool is not None:
+        pool.submit(int).result()
+
+def shutdown_process_pool():
+    """Stops the encoder processes, if any were started."""
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown()
+        _process_pool = None
+
+@metrics.timed("render")
+def render_all(image_bytes, renditions=RENDITIONS):
+    """
+    Encodes every rendition of an image in the shared process pool.
+    Returns a dict mapping the rendition name to its encoded bytes, or None on failure.
+    """
+    try:
+        pool = get_process_pool()
+        if pool is None:
+            variants = {name: render_variant(image_bytes, spec) for name, spec in renditions.items()}
+        else:
+            futures = {name: pool.submit(render_variant, image_bytes, spec) for name, spec in renditions.items()}
+            variants = {name: future.result() for name, future in futures.items()}
+    except Exception as e:
+        print(f"Error rendering image variants: {repr(e)}")
+        return None
+
+    metrics.add_bytes(len(image_bytes) + sum(len(data) for data in variants.values()))
+    sizes = ", ".join(f"{name}={len(data)} bytes" for name, data in variants.items())
+    print(f"Rendered {len(variants)} image variants ({sizes}).")
+    return variants
@@ -0,0 +1,257 @@
+import os
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import metrics
+
+# --- Configuration ---
+# Circuit breaker: after BREAKER_FAILURES consecutive failures (errors or missed
+# deadlines) of an endpoint, its calls fail fast for BREAKER_COOLDOWN seconds. Then a
+# single trial call is let through, and its outcome closes or re-opens the circuit.
+BREAKER_FAILURES = int(os.getenv("CIRCUIT_BREAKER_FAILURES", "3"))
+BREAKER_COOLDOWN = float(os.getenv("CIRCUIT_BREAKER_COOLDOWN", "300"))
+
+# Hedging: how many recent latencies are kept to learn when a call is slower than
+# usual, and how many are needed before any request is hedged.
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "50"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "10"))
+# How much of the end of metrics.jsonl a new process reads to seed those latencies.
+HEDGE_HISTORY_KB = int(os.getenv("HEDGE_HISTORY_KB", "512"))
+
+# A failed attempt is sent again up to CALL_RETRIES times, with jittered exponential
+# backoff, as long as its deadline leaves time. The SDK itself never retries (see
+# generate_content.create_openai_client), so an abandoned attempt ends at its deadline.
+CALL_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+RETRY_BACKOFF_BASE = 0.5
+
+# Threads that run deadline-bound calls. A call that misses its deadline is abandoned,
+# not interrupted; its request timeout is the time that was left, so it ends by then.
+CALL_WORKERS = int(os.getenv("DEADLINE_CALL_WORKERS", "16"))
+
+class DeadlineExceeded(Exception):
+    """No attempt of a call finished before its deadline."""
+
+class AttemptCancelled(Exception):
+    """An attempt was abandoned before it was sent, so it never sends its request."""
+
+class CircuitBreaker:
+    """
+    Tracks the health of one provider endpoint. While it is 'open', allow() returns
+    False and callers skip the endpoint (or use a cheaper fallback) instead of waiting
+    for another timeout. Like the rate limiters, one breaker per endpoint is shared by
+    every thread of the process, so a batch or the daemon stops hammering a degraded
+    provider after a few failures.
+    """
+
+    def __init__(self, name, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.name = name
+        self.threshold = max(1, failures)
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "open" if time.monotonic() - self.opened_at < self.cooldown else "half-open"
+
+    def allow(self):
+        """Returns True if a call may go ahead. In the half-open state only one trial call is allowed."""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                print(f"Circuit of {self.name} closed again.")
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.failures >= self.threshold:
+                if self.opened_at is None or self.state == "half-open":
+                    print(f"Circuit of {self.name} opened after {self.failures} failures; "
+                          f"failing fast for {self.cooldown:.0f}s.")
+                self.opened_at = time.monotonic()
+
+class LatencyTracker:
+    """
+    The latencies of the recent successful attempts of one call. A fresh process is
+    seeded from the matching 'openai.attempt' spans at the end of metrics.jsonl, so a
+    daily run hedges from the first request on instead of learning from scratch.
+    """
+
+    def __init__(self, endpoint, window=HEDGE_WINDOW):
+        self.endpoint = endpoint
+        self.samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        history = metrics.load_records(tail_bytes=HEDGE_HISTORY_KB * 1024) if metrics.METRICS_PATH else []
+        for record in history:
+            if (record.get("stage") == "openai.attempt" and record.get("endpoint") == endpoint
+                    and record.get("outcome") == "ok"):
+                self.samples.append(record["duration_s"])
+
+    def add(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, pct):
+        """Returns the pct-th percentile in seconds, or None until HEDGE_MIN_SAMPLES are known."""
+        with self._lock:
+            if len(self.samples) < HEDGE_MIN_SAMPLES:
+                return None
+            return metrics.percentile(sorted(self.samples), pct)
+
+_breakers = {}
+_trackers = {}
+_registry_lock = threading.Lock()
+_executor = None
+
+def get_breaker(name):
+    """Returns the shared circuit breaker of an endpoint, e.g. 'openai.images'."""
+    with _registry_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+def get_tracker(endpoint):
+    """Returns the shared latency tracker of an endpoint, loading its history on first use."""
+    with _registry_lock:
+        if endpoint not in _trackers:
+            _trackers[endpoint] = LatencyTracker(endpoint)
+        return _trackers[endpoint]
+
+def _get_executor():
+    global _executor
+    with _registry_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=CALL_WORKERS, thread_name_prefix="deadline-call")
+        return _executor
+
+def call_with_deadline(call, deadline, endpoint, hedge_after=None, tracker=None, limiter=None,
+                       retry_on=(), retries=CALL_RETRIES):
+    """
+    Runs call(timeout) on a worker thread and returns its result, waiting at most
+    `deadline` seconds. `timeout` is the time left until the deadline; call() must pass
+    it on as its request timeout and must not retry, so an attempt never outlives the
+    deadline. An attempt that raises one of `retry_on` is sent again, up to `retries`
+    times, while time is left.
+    With `hedge_after`, a second identical call starts if the first has not finished
+    by then, and the first one to succeed wins; the other is abandoned.
+    Every request is recorded as an 'openai.attempt' span, and successful ones feed `tracker`.
+    With a rate `limiter`, each attempt holds one of its slots (call() must not take one
+    itself). The first slot is taken before the deadline clock starts, so waiting in the
+    local queue never counts as a slow provider; a hedge is only sent if a slot is free
+    at that moment. Waiting for a worker thread doesn't count either, but is bounded by
+    the deadline too. An attempt abandoned before it was sent never sends its request,
+    and an abandoned attempt is not retried.
+    Raises DeadlineExceeded, or the error of the last attempt if every attempt failed.
+    """
+    cancelled = threading.Event()
+    started = threading.Event()
+    ends_at = []
+
+    def attempt(number, holds_slot):
+        last_error = None
+        try:
+            for retry in range(retries + 1):
+                if cancelled.is_set():
+                    raise AttemptCancelled(f"{endpoint} attempt {number} was abandoned before it was sent")
+                if not ends_at:
+                    ends_at.append(time.monotonic() + deadline)
+                    started.set()
+                if retry:
+                    # Jittered exponential backoff, never past the deadline.
+                    time.sleep(random.uniform(0, max(0.0, min(ends_at[0] - time.monotonic(),
+                                                              RETRY_BACKOFF_BASE * 2 ** retry))))
+                    if cancelled.is_set():
+                        raise last_error
+                remaining = ends_at[0] - time.monotonic()
+                if remaining <= 0:
+                    if retry:
+                        raise last_error
+                    raise DeadlineExceeded(f"{endpoint} attempt {number} started after the deadline")
+                if retry:
+                    metrics.add_retries()
+                try:
+                    with metrics.span("openai.attempt", endpoint=endpoint, attempt=number, retry=retry):
+                        attempt_start = time.monotonic()
+                        result = call(remaining)
+                        if tracker:
+                            tracker.add(time.monotonic() - attempt_start)
+                except retry_on as e:
+                    print(f"{endpoint} attempt {number} failed ({repr(e)}).")
+                    last_error = e
+                    continue
+                # Set before this future completes, so a hedge queued on the same worker sees it.
+                cancelled.set()
+                return result
+            raise last_error
+        finally:
+            if holds_slot:
+                limiter.release()
+
+    if limiter:
+        waited = limiter.acquire()
+        if waited > 0.05:
+            metrics.set_attrs(rate_limit_wait_s=round(waited, 3))
+    executor = _get_executor()
+    numbers = {executor.submit(metrics.propagate(attempt), 1, bool(limiter)): 1}
+    pending = set(numbers)
+    error = None
+    try:
+        # A busy worker pool is a local wait too: the clock starts when the request goes
+        # out. The wait is bounded, and a request that never went out is never sent.
+        if not started.wait(deadline):
+            metrics.set_attrs(deadline_exceeded=True)
+            raise DeadlineExceeded(f"{endpoint} found no free worker within {deadline:.0f}s")
+        start = ends_at[0] - deadline
+        while pending:
+            now = time.monotonic()
+            if now >= start + deadline:
+                metrics.set_attrs(deadline_exceeded=True)
+                raise DeadlineExceeded(f"{endpoint} did not answer within {deadline:.0f}s")
+            timeout = start + deadline - now
+            hedge_due = hedge_after is not None and len(numbers) == 1
+            if hedge_due:
+                timeout = min(timeout, max(0.0, start + hedge_after - now))
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if len(numbers) > 1:
+                    metrics.set_attrs(hedge_won=numbers[future] == 2)
+                return result
+            if hedge_due and pending and time.monotonic() >= start + hedge_after:
+                if limiter and not limiter.try_acquire():
+                    # Every slot is busy: a hedge would only queue behind the same requests.
+                    metrics.set_attrs(hedge_skipped="no free slot")
+                    hedge_after = None
+                    continue
+                print(f"{endpoint} is slower than usual ({hedge_after:.1f}s); sending a hedged request.")
+                metrics.set_attrs(hedged_after_s=round(hedge_after, 3))
+                hedge = executor.submit(metrics.propagate(attempt), 2, bool(limiter))
+                numbers[hedge] = 2
+                pending.add(hedge)
+        raise error
+    finally:
+        cancelled.set()
@@ -0,0 +1,85 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+import post_queue
+
+# --- Configuration ---
+# Entries written today are used on later days, so they are stored in the post queue's database.
+SCENE_BANK_DB = os.getenv("SCENE_BANK_DB", post_queue.POST_QUEUE_DB)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scene_bank (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL,
+    description TEXT NOT NULL,
+    caption TEXT NOT NULL,
+    hashtags TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    used_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_scene_bank_unused ON scene_bank (source, used_at, id);
+"""
+
+class SceneBank:
+    """
+    Scene descriptions, captions and hashtags generated in bulk ahead of time, each
+    used by one post. 'source' identifies the prompt and model that wrote an entry,
+    like a stage cache key, so entries written under an older prompt are never used.
+    """
+
+    def __init__(self, path=SCENE_BANK_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def add(self, entries, source):
+        """Stores entries (dicts with 'description', 'caption' and 'hashtags') in order."""
+        now = datetime.now().isoformat(timespec="seconds")
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany(
+                "INSERT INTO scene_bank (source, description, caption, hashtags, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(source, e["description"], e["caption"], e["hashtags"], now) for e in entries],
+            )
+            self._conn.execute("COMMIT")
+
+    def take(self, source):
+        """
+        Marks the oldest unused entry of `source` as used and returns it, or None if
+        there is none. Concurrent batch workers never get the same entry.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT * FROM scene_bank WHERE source = ? AND used_at IS NULL ORDER BY id LIMIT 1", (source,)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE scene_bank SET used_at = ? WHERE id = ?",
+                        (datetime.now().isoformat(timespec="seconds"), row["id"]),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return dict(row) if row is not None else None
+
+    def unused(self, source):
+        """Returns the unused entries of `source`, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM scene_bank WHERE source = ? AND used_at IS NULL ORDER BY id", (source,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+def open_bank(path=SCENE_BANK_DB):
+    return SceneBank(path)
@@ -0,0 +1,205 @@
+import os
+import re
+import json
+import zlib
+import random
+import sqlite3
+import threading
+from datetime import datetime
+
+import post_queue
+
+# --- Configuration ---
+# Defaults to the post queue's database, so the history of past scenes stays with the posts.
+SCENE_INDEX_DB = os.getenv("SCENE_INDEX_DB", post_queue.POST_QUEUE_DB)
+# Jaccard similarity of content words above which two texts count as a repeat.
+SIMILARITY_THRESHOLD = float(os.getenv("SCENE_SIMILARITY_THRESHOLD", "0.5"))
+
+# MinHash/LSH parameters: NUM_PERM hash functions split into BANDS bands of
+# NUM_PERM // BANDS rows. Two texts become candidates when any band matches,
+# which happens with high probability well below SIMILARITY_THRESHOLD; the
+# candidates are then confirmed with an exact Jaccard comparison.
+NUM_PERM = 32
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20250805)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+STOPWORDS = {
+    "the", "and", "with", "for", "from", "into", "onto", "over", "under", "its", "their", "that",
+    "this", "are", "was", "were", "has", "have", "while", "where", "which", "who", "whose",
+    "above", "below", "through", "across", "around", "among", "upon", "beneath", "each", "every",
+    "soft", "gentle", "softly", "gently", "dreamy", "whimsical", "serene", "peaceful", "cozy",
+    "your", "you", "let", "may", "all", "our", "like", "can", "will", "near", "beside",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scenes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    text TEXT NOT NULL,
+    shingles TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scene_bands (
+    kind TEXT NOT NULL,
+    band_key INTEGER NOT NULL,
+    scene_id INTEGER NOT NULL,
+    PRIMARY KEY (kind, band_key, scene_id)
+) WITHOUT ROWID;
+"""
+
+def shingles(text):
+    """
+    Returns the set of hashed content words of a text.
+    Single content words (not word n-grams) are used because repeats show up as the
+    same subjects in different sentences, e.g. "a fox asleep on the moon" and
+    "the moon cradling a sleeping fox".
+    """
+    words = re.findall(r"[a-z]+", text.lower())
+    result = set()
+    for word in words:
+        if len(word) < 3 or word in STOPWORDS:
+            continue
+        if len(word) > 4 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        result.add(zlib.crc32(word.encode("utf-8")))
+    return result
+
+def minhash(shingle_set):
+    """Returns the MinHash signature (NUM_PERM ints) of a set of hashed shingles."""
+    if not shingle_set:
+        return [0] * NUM_PERM
+    return [min((a * x + b) % _PRIME for x in shingle_set) for a, b in _PERMUTATIONS]
+
+def band_keys(signature):
+    """
+    Splits a signature into BANDS keys, one per band.
+    Each key packs the band number with a 32-bit hash of the band's rows, so a
+    lookup is a single 'band_key IN (...)' seek on the primary key.
+    """
+    keys = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS]
+        keys.append((band << 32) | zlib.crc32(json.dumps(rows).encode("ascii")))
+    return keys
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+class SceneIndex:
+    """
+    A persistent near-duplicate index over past scene descriptions and captions.
+
+    New texts are bucketed by MinHash/LSH bands stored in an indexed SQLite table,
+    so a lookup touches only the handful of rows sharing a band with the new text
+    instead of comparing it with the whole history. Adding a text is an
+    incremental insert; nothing is ever rebuilt.
+    """
+
+    def __init__(self, path=SCENE_INDEX_DB, threshold=SIMILARITY_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def _find_similar(self, kind, text):
+        shingle_set = shingles(text)
+        keys = band_keys(minhash(shingle_set))
+        placeholders = ", ".join("?" for _ in keys)
+        rows = self._conn.execute(
+            "SELECT s.id, s.text, s.shingles FROM scenes s WHERE s.id IN ("
+            f" SELECT scene_id FROM scene_bands WHERE kind = ? AND band_key IN ({placeholders}))",
+            [kind, *keys],
+        ).fetchall()
+
+        best = None
+        for scene_id, other_text, other_shingles in rows:
+            similarity = jaccard(shingle_set, set(json.loads(other_shingles)))
+            if similarity >= self.threshold and (best is None or similarity > best["similarity"]):
+                best = {"id": scene_id, "kind": kind, "text": other_text, "similarity": round(similarity, 3)}
+        return best, shingle_set, keys
+
+    def _add(self, kind, text, shingle_set, keys):
+        cursor = self._conn.execute(
+            "INSERT INTO scenes (kind, text, shingles, created_at) VALUES (?, ?, ?, ?)",
+            (kind, text, json.dumps(sorted(shingle_set)), datetime.now().isoformat(timespec="seconds")),
+        )
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO scene_bands (kind, band_key, scene_id) VALUES (?, ?, ?)",
+            [(kind, key, cursor.lastrowid) for key in keys],
+        )
+
+    def find_similar(self, kind, text):
+        """
+        Returns the most similar indexed text of the same kind ('description' or 'caption')
+        as a dict with 'id', 'text' and 'similarity', or None if there is no near-duplicate.
+        """
+        with self._lock:
+            return self._find_similar(kind, text)[0]
+
+    def add(self, kind, text):
+        """Adds a text to the index."""
+        shingle_set = shingles(text)
+        keys = band_keys(minhash(shingle_set))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._add(kind, text, shingle_set, keys)
+            self._conn.execute("COMMIT")
+
+    def check_and_add(self, description, caption):
+        """
+        Atomically checks a new description and caption against the index and, if
+        neither is a near-duplicate, adds both. Concurrent batch workers call this, so
+        two posts of the same batch can't both claim the same subject.
+        Returns the near-duplicate match dict, or None if the texts were accepted.
+        """
+        with self._lock:
+            match, description_shingles, description_keys = self._find_similar("description", description)
+            if match:
+                return match
+            match, caption_shingles, caption_keys = self._find_similar("caption", caption)
+            if match:
+                return match
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._add("description", description, description_shingles, description_keys)
+                self._add("caption", caption, caption_shingles, caption_keys)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return None
+
+    def is_empty(self):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM scenes LIMIT 1").fetchone() is None
+
+    def backfill_from_queue(self, queue):
+        """Indexes the descriptions and captions of every post already in the queue."""
+        count = 0
+        for post in queue.list_posts(limit=-1):
+            if post.get("description"):
+                self.add("description", post["description"])
+            self.add("caption", post["caption"])
+            count += 1
+        return count
+
+def open_index(path=SCENE_INDEX_DB):
+    """Opens the scene index, seeding it from the post queue the first time."""
+    index = SceneIndex(path)
+    if index.is_empty():
+        queue = post_queue.PostQueue(post_queue.POST_QUEUE_DB)
+        count = index.backfill_from_queue(queue)
+        queue.close()
+        if count:
+            print(f"Seeded the scene index with {count} past post(s).")
+    return index
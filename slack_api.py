@@ -0,0 +1,60 @@
+import requests
+
+import http_transport
+import metrics
+from config import settings
+
+# Incoming webhooks (SLACK_WEBHOOK_URL) can only post new messages. Messages that are
+# edited after posting, like the live preview of an image that is still being
+# generated, go through the Web API with a bot token and a channel instead.
+
+def is_configured():
+    return bool(settings.slack_bot_token and settings.slack_channel_id)
+
+def call(method, payload, idempotent=True):
+    """
+    Calls a Slack Web API method, e.g. 'chat.postMessage'.
+    Returns the response JSON, or None on failure.
+    """
+    try:
+        resp = http_transport.post(
+            f"{settings.slack_api_base}/{method}",
+            json=payload,
+            headers={"Authorization": f"Bearer {settings.slack_bot_token}"},
+            rate_limit="slack.chat",
+            idempotent=idempotent,
+        )
+        resp.raise_for_status()
+        data = resp.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"Error calling Slack {method}: {e}")
+        return None
+    # The Web API reports most errors with HTTP 200 and ok=false.
+    if not data.get("ok"):
+        print(f"Slack {method} failed: {data.get('error')}")
+        return None
+    return data
+
+@metrics.timed("slack.post_message")
+def post_message(text, blocks=None):
+    """
+    Posts a message to SLACK_CHANNEL_ID.
+    Returns {'channel', 'ts'}, which identifies the message for update_message(), or None on failure.
+    """
+    payload = {"channel": settings.slack_channel_id, "text": text}
+    if blocks:
+        payload["blocks"] = blocks
+    # Not idempotent: a retried request that had reached Slack would post the message twice.
+    data = call("chat.postMessage", payload, idempotent=False)
+    if not data:
+        return None
+    return {"channel": data["channel"], "ts": data["ts"]}
+
+@metrics.timed("slack.update_message")
+def update_message(message, text, blocks=None):
+    """
+    Replaces the text and blocks of a message returned by post_message().
+    Returns True, or None on failure.
+    """
+    payload = {"channel": message["channel"], "ts": message["ts"], "text": text, "blocks": blocks or []}
+    return True if call("chat.update", payload) else None
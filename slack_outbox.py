@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import atexit
+import threading
+
+import requests
+
+import http_transport
+import metrics
+import slack_api
+from config import settings
+
+# --- Configuration ---
+# Slack messages are queued here and delivered by a background thread, so generating
+# and publishing never wait on Slack. Messages that could not be delivered when the
+# process exits are written to SLACK_OUTBOX_PATH and sent by the next run.
+SPOOL_PATH = os.getenv("SLACK_OUTBOX_PATH", "slack_outbox.jsonl")
+# How long the end of a run waits for the queued messages before spooling them.
+DRAIN_SECONDS = float(os.getenv("SLACK_OUTBOX_DRAIN_SECONDS", "10"))
+# Failed deliveries are retried this many times per run (on top of the HTTP retries),
+# and spooled messages older than SLACK_OUTBOX_MAX_AGE_HOURS are dropped.
+MAX_ATTEMPTS = int(os.getenv("SLACK_OUTBOX_ATTEMPTS", "3"))
+MAX_AGE_HOURS = float(os.getenv("SLACK_OUTBOX_MAX_AGE_HOURS", "48"))
+
+# Messages of the same kind queued within DIGEST_WINDOW seconds of each other, e.g. the
+# approval requests of a batch, are sent as one digest of at most DIGEST_MAX messages.
+DIGEST_WINDOW = float(os.getenv("SLACK_DIGEST_WINDOW", "2"))
+DIGEST_MAX = int(os.getenv("SLACK_DIGEST_MAX", "10"))
+DIGEST_TITLES = {
+    "approval": "posts ready for approval",
+    "publish": "publishing results",
+}
+# Slack's limit of blocks per message.
+MAX_BLOCKS = 50
+
+def deliver(message):
+    """
+    Sends one message now. 'kind' is 'webhook' (SLACK_WEBHOOK_URL), 'post' (new bot
+    message) or 'update' (replaces the bot message in 'target').
+    Returns True, or None on failure.
+    """
+    kind = message["kind"]
+    if kind == "update":
+        return slack_api.update_message(message["target"], message["text"], message.get("blocks"))
+    if kind == "post":
+        return True if slack_api.post_message(message["text"], message.get("blocks")) else None
+    payload = {"text": message["text"]}
+    if message.get("blocks"):
+        payload["blocks"] = message["blocks"]
+    try:
+        resp = http_transport.post(settings.slack_webhook_url, json=payload, rate_limit="slack.webhook")
+        resp.raise_for_status()
+        return True
+    except requests.exceptions.RequestException as e:
+        print(f"Error sending Slack message: {e}")
+        return None
+
+def merge(messages):
+    """Combines messages of one digest group into a single message."""
+    if len(messages) == 1:
+        return messages[0]
+    title = DIGEST_TITLES.get(messages[0]["digest"], "messages")
+    header = f"🗂️ *{len(messages)} {title}*"
+    digest = dict(messages[0], text=header + "\n\n" + "\n\n———\n\n".join(m["text"] for m in messages))
+    if any(m.get("blocks") for m in messages):
+        blocks = [{"type": "section", "text": {"type": "mrkdwn", "text": header}}]
+        for m in messages:
+            blocks.append({"type": "divider"})
+            blocks += m.get("blocks") or [{"type": "section", "text": {"type": "mrkdwn", "text": m["text"]}}]
+        digest["blocks"] = blocks
+    return digest
+
+def _block_count(message):
+    return len(message.get("blocks") or [None]) + 1
+
+class Outbox:
+    """
+    A queue of Slack messages with one delivery thread. Delivery is at least once: a
+    message that was in flight when the process exited is spooled and sent again.
+    """
+
+    def __init__(self, path=SPOOL_PATH):
+        self.path = path
+        self.pending = []
+        self.parked = []
+        self.in_flight = []
+        self.closed = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        """Starts the delivery thread and queues the messages a previous run spooled."""
+        with self._cond:
+            if self._thread:
+                return self
+            self._thread = threading.Thread(target=self._run, name="slack-outbox", daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+        spooled = self._claim_spool()
+        if spooled:
+            print(f"Sending {len(spooled)} Slack message(s) spooled by an earlier run.")
+            with self._cond:
+                self.pending.extend(spooled)
+                self._cond.notify()
+        return self
+
+    def send(self, message):
+        """Queues a message and returns at once."""
+        message = dict(message, queued_at=message.get("queued_at") or time.time(), attempts=0, not_before=0)
+        self.start()
+        with self._cond:
+            self.pending.append(message)
+            self._cond.notify()
+
+    def _claim_spool(self):
+        """Takes over the spool file; renaming it first keeps two processes from both sending it."""
+        if not self.path or not os.path.exists(self.path):
+            return []
+        claimed = f"{self.path}.{os.getpid()}"
+        try:
+            os.replace(self.path, claimed)
+        except OSError:
+            return []
+        messages = []
+        with open(claimed, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    messages.append(json.loads(line))
+        os.remove(claimed)
+        cutoff = time.time() - MAX_AGE_HOURS * 3600
+        fresh = [m for m in messages if m["queued_at"] >= cutoff]
+        if len(fresh) < len(messages):
+            print(f"Dropped {len(messages) - len(fresh)} spooled Slack message(s) older than {MAX_AGE_HOURS:.0f}h.")
+        for message in fresh:
+            message["attempts"] = message["not_before"] = 0
+        return fresh
+
+    def _next_batch(self):
+        """Waits for the next deliverable message and takes it with the rest of its digest group."""
+        with self._cond:
+            while True:
+                now = time.time()
+                # A closing outbox retries right away instead of backing off.
+                due = [m for m in self.pending if self.closed or m["not_before"] <= now]
+                if due:
+                    first = due[0]
+                    # Give a burst time to arrive, unless the run is ending.
+                    wait_until = first["queued_at"] + DIGEST_WINDOW if first.get("digest") else now
+                    if self.closed or wait_until <= now:
+                        break
+                elif self.closed and not self.pending:
+                    return None
+                else:
+                    wait_until = min([m["not_before"] for m in self.pending] or [now + 60])
+                self._cond.wait(max(0.01, wait_until - now))
+            batch = [first]
+            if first.get("digest"):
+                blocks = _block_count(first)
+                for m in due[1:]:
+                    if len(batch) >= DIGEST_MAX:
+                        break
+                    if m["kind"] == first["kind"] and m.get("digest") == first["digest"]:
+                        if blocks + _block_count(m) > MAX_BLOCKS:
+                            break
+                        batch.append(m)
+                        blocks += _block_count(m)
+            for m in batch:
+                self.pending.remove(m)
+            self.in_flight = batch
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            with metrics.span("slack.deliver", kind=batch[0]["kind"], messages=len(batch)) as span:
+                try:
+                    sent = deliver(merge(batch))
+                except Exception as e:
+                    print(f"Error delivering a Slack message: {repr(e)}")
+                    sent = None
+                if not sent:
+                    span.fail("not delivered")
+            with self._cond:
+                self.in_flight = []
+                if not sent:
+                    for m in batch:
+                        m["attempts"] += 1
+                        if m["attempts"] >= MAX_ATTEMPTS:
+                            self.parked.append(m)
+                        else:
+                            m["not_before"] = time.time() + min(60, 5 * 2 ** m["attempts"])
+                            self.pending.append(m)
+                self._cond.notify_all()
+
+    def close(self, timeout=DRAIN_SECONDS):
+        """
+        Waits up to `timeout` seconds for the queued messages to be delivered, then spools
+        the rest. Runs at exit, so only long-lived callers need to call it themselves.
+        """
+        with self._cond:
+            if self._thread is None or self.closed:
+                return
+            self.closed = True
+            self._cond.notify_all()
+            deadline = time.time() + timeout
+            # Parked messages already used up their attempts; only wait for the others.
+            while (self.pending or self.in_flight) and time.time() < deadline:
+                self._cond.wait(deadline - time.time())
+            left = self.parked + self.in_flight + self.pending
+            self.pending = []
+        if left and self.path:
+            with open(self.path, "a", encoding="utf-8") as f:
+                for m in left:
+                    f.write(json.dumps(m, ensure_ascii=False) + "\n")
+            print(f"Spooled {len(left)} undelivered Slack message(s) to '{self.path}' for the next run.")
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+def get_outbox():
+    """Returns the process-wide outbox."""
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = Outbox()
+        return _outbox
+
+def send(kind, text, blocks=None, target=None, digest=None):
+    """
+    Queues a Slack message (see deliver() for the kinds). Messages with the same
+    `digest` ('approval' or 'publish') that are queued close together are combined.
+    """
+    message = {"kind": kind, "text": text, "digest": digest}
+    if blocks:
+        message["blocks"] = blocks
+    if target:
+        message["target"] = target
+    get_outbox().send(message)
+
+def flush_spool():
+    """Starts delivering what earlier runs spooled. The scripts call it when they start."""
+    get_outbox().start()
@@ -0,0 +1,136 @@
+import os
+import json
+import time
+import hashlib
+
+# --- Configuration ---
+# Content-addressed cache of pipeline stage outputs, so a 'regenerate' can redo a
+# single stage and reuse everything else.
+STAGE_CACHE_DIR = os.getenv("STAGE_CACHE_DIR", ".stage_cache")
+# Entries older than this are removed by prune().
+STAGE_CACHE_MAX_AGE_DAYS = float(os.getenv("STAGE_CACHE_MAX_AGE_DAYS", "14"))
+
+def cache_key(stage, **params):
+    """
+    Returns the cache key of a stage run: a SHA-256 over the stage name and every
+    parameter that influences its output (prompt, model, size, input hash, ...).
+    """
+    payload = json.dumps({"stage": stage, **params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def content_hash(data):
+    """Returns the SHA-256 hex digest of a bytes object."""
+    return hashlib.sha256(data).hexdigest()
+
+class StageCache:
+    """
+    Stores JSON results under '<dir>/<stage>/<key>.json' and binary blobs (image
+    bytes) under '<dir>/blobs/<sha256>', so identical bytes are stored once.
+    Writes go through a temp file and os.replace, so concurrent batch workers
+    never observe a half-written entry.
+    """
+
+    def __init__(self, directory=STAGE_CACHE_DIR):
+        self.directory = directory
+
+    def _path(self, *parts):
+        return os.path.join(self.directory, *parts)
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{id(data)}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, stage, key):
+        """Returns the cached JSON value of a stage run, or None on a miss."""
+        try:
+            with open(self._path(stage, f"{key}.json"), "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def put(self, stage, key, value):
+        """Caches the JSON-serializable result of a stage run."""
+        self._write(self._path(stage, f"{key}.json"), json.dumps(value, indent=2).encode("utf-8"))
+
+    def delete(self, stage, key):
+        """Removes a cached stage result, if present."""
+        try:
+            os.remove(self._path(stage, f"{key}.json"))
+        except FileNotFoundError:
+            pass
+
+    def values(self, stage):
+        """Yields every cached JSON value of a stage."""
+        directory = self._path(stage)
+        if not os.path.isdir(directory):
+            return
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".json"):
+                value = self.get(stage, name[:-len(".json")])
+                if value is not None:
+                    yield value
+
+    def get_blob(self, digest):
+        """Returns cached bytes by their SHA-256 digest, or None on a miss."""
+        try:
+            with open(self._path("blobs", digest), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        # Never hand out corrupted bytes as a cache hit.
+        return data if content_hash(data) == digest else None
+
+    def put_blob(self, data):
+        """Caches bytes and returns their SHA-256 digest."""
+        digest = content_hash(data)
+        path = self._path("blobs", digest)
+        if not os.path.exists(path):
+            self._write(path, data)
+        return digest
+
+    def prune(self, max_age_days=STAGE_CACHE_MAX_AGE_DAYS):
+        """Deletes cache files older than max_age_days. Returns the number of files removed."""
+        if not os.path.isdir(self.directory):
+            return 0
+        cutoff = time.time() - max_age_days * 86400
+        removed = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    pass
+        return removed
+
+class Checkpoint:
+    """
+    The journal of one post's generation: the output of every stage, written as soon as
+    the stage completes, under '<dir>/checkpoints/<key>.json'. A run that fails leaves
+    its checkpoint behind, so the next run for the same slot resumes after the last
+    completed stage instead of starting over. Image bytes stay in the cache's blobs,
+    where the image stage finds them by prompt. The checkpoint is cleared once the post
+    is queued.
+    """
+
+    def __init__(self, cache, slot):
+        self.cache = cache
+        self.key = cache_key("checkpoint", slot=slot)
+        self.stages = cache.get("checkpoints", self.key) or {}
+
+    def get(self, stage):
+        """Returns the recorded output of a stage, or None if it has not completed."""
+        return self.stages.get(stage)
+
+    def record(self, stage, output):
+        self.stages[stage] = output
+        self.cache.put("checkpoints", self.key, self.stages)
+
+    def clear(self):
+        self.stages = {}
+        self.cache.delete("checkpoints", self.key)
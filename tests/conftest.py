@@ -0,0 +1,14 @@
+import os
+import sys
+
+# Keep test runs from appending spans to the repo's metrics.jsonl.
+os.environ["METRICS_PATH"] = ""
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+@pytest.fixture(autouse=True)
+def _isolated_cwd(tmp_path, monkeypatch):
+    """Runs every test in its own directory, so default paths never touch the checkout."""
+    monkeypatch.chdir(tmp_path)
@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+import accounts
+import get_tiktok_token
+
+def write_registry(tmp_path, entries):
+    path = tmp_path / "tiktok_accounts.json"
+    path.write_text(json.dumps(entries))
+    return str(path)
+
+def test_without_a_registry_the_default_account_is_used(tmp_path, monkeypatch):
+    monkeypatch.setenv("TIKTOK_REFRESH_TOKEN", "default-token")
+
+    (account,) = accounts.load_accounts(str(tmp_path / "missing.json"))
+
+    assert account.name == accounts.DEFAULT_ACCOUNT
+    assert account.refresh_token == "default-token"
+    assert account.store.path == accounts.TOKEN_STORE_PATH
+    assert account.privacy_level == accounts.DEFAULT_PRIVACY_LEVEL
+
+def test_registry_entries(tmp_path, monkeypatch):
+    monkeypatch.setenv("TIKTOK_REFRESH_TOKEN_SECOND_ONE", "second-token")
+    monkeypatch.setenv("MAIN_TOKEN", "main-token")
+    path = write_registry(tmp_path, {"accounts": [
+        {"name": "main", "refresh_token_env": "MAIN_TOKEN", "token_store": "stores/main.json"},
+        {"name": "second-one", "privacy_level": "PUBLIC_TO_EVERYONE"},
+    ]})
+
+    main, second = accounts.load_accounts(path)
+
+    assert (main.refresh_token, main.store.path) == ("main-token", "stores/main.json")
+    assert second.refresh_token == "second-token"
+    assert second.store.path == ".tiktok_token.second-one.json"
+    assert second.privacy_level == "PUBLIC_TO_EVERYONE"
+
+def test_selecting_accounts_by_name(tmp_path):
+    path = write_registry(tmp_path, [{"name": "main"}, {"name": "second"}, {"name": "third"}])
+
+    assert [a.name for a in accounts.load_accounts(path, names=["third", "main"])] == ["main", "third"]
+    with pytest.raises(ValueError, match="Unknown account"):
+        accounts.load_accounts(path, names=["main", "fourth"])
+
+@pytest.mark.parametrize("content", [
+    "[{\"name\": \"main\"}, {\"name\": \"main\"}]",
+    "[{\"privacy_level\": \"SELF_ONLY\"}]",
+    "[\"main\"]",
+    "[]",
+    "{not json",
+])
+def test_invalid_registries_are_rejected(tmp_path, content):
+    path = tmp_path / "tiktok_accounts.json"
+    path.write_text(content)
+    with pytest.raises(ValueError):
+        accounts.load_accounts(str(path))
+
+def test_auth_saves_tokens_in_the_registered_token_store(tmp_path, monkeypatch):
+    path = write_registry(tmp_path, [{"name": "main", "token_store": str(tmp_path / "custom.json")}])
+    (account,) = accounts.load_accounts(path, names=["main"])
+
+    class Response:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"access_token": "access", "expires_in": 86400, "refresh_token": "refresh",
+                    "refresh_expires_in": 31536000, "open_id": "user"}
+
+    monkeypatch.setattr(get_tiktok_token.http_transport, "post", lambda url, **kwargs: Response())
+
+    get_tiktok_token.get_access_token("code", "verifier", account)
+
+    assert accounts.load_accounts(path)[0].store.load()["refresh_token"] == "refresh"
+    assert not (tmp_path / ".tiktok_token.main.json").exists()
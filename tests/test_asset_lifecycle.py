@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import asset_lifecycle
+import post_queue
+import r2_storage
+from post_queue import PostQueue
+from stage_cache import StageCache
+
+NOW = datetime(2024, 5, 10, tzinfo=timezone.utc)
+
+def url(key):
+    return r2_storage.public_url(key)
+
+def obj(key, age_hours=48):
+    return {"Key": key, "LastModified": NOW - timedelta(hours=age_hours), "Size": 1000}
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = PostQueue(str(tmp_path / "queue.db"))
+    yield queue
+    queue.close()
+
+def test_live_posts_and_cached_uploads_keep_their_images(queue, tmp_path):
+    queue.add_post(url("images/live.png"), "live", "#a", scheduled_date="2024-05-01", supersede=False)
+    finished = queue.add_post(url("images/done.png"), "done", "#b", scheduled_date="2024-05-02", supersede=False)
+    queue.set_status(finished, post_queue.STATUS_PUBLISHED)
+    cache = StageCache(str(tmp_path / "cache"))
+    cache.put("upload", "key", {"original": url("images/cached.png"), "other": "https://elsewhere/x.png"})
+
+    references = asset_lifecycle.collect_references(queue, cache, retention_days=30)
+
+    assert references["images/live.png"] is None
+    assert references["images/cached.png"] is None
+    remaining = references["images/done.png"] - datetime.now(timezone.utc)
+    assert timedelta(days=29) < remaining <= timedelta(days=30)
+    assert set(references) == {"images/live.png", "images/done.png", "images/cached.png"}
+
+def test_an_image_shared_with_a_live_post_is_kept(queue, tmp_path):
+    finished = queue.add_post(url("images/shared.png"), "done", "#a", scheduled_date="2024-05-01", supersede=False)
+    queue.set_status(finished, post_queue.STATUS_REJECTED)
+    queue.add_post(url("images/shared.png"), "live", "#b", scheduled_date="2024-05-02", supersede=False)
+
+    references = asset_lifecycle.collect_references(queue, StageCache(str(tmp_path / "cache")))
+
+    assert references["images/shared.png"] is None
+
+def test_classify_sorts_by_reference_and_age():
+    references = {
+        "images/live.png": None,
+        "images/expired.png": NOW - timedelta(days=1),
+        "images/retained.png": NOW + timedelta(days=1),
+    }
+    objects = [obj("images/live.png"), obj("images/expired.png"), obj("images/retained.png"),
+               obj("images/orphan.png"), obj("images/uploading.png", age_hours=1)]
+
+    plan = asset_lifecycle.classify(objects, references, NOW, grace_hours=24)
+
+    assert [o["Key"] for o in plan["keep"]] == ["images/live.png", "images/retained.png", "images/uploading.png"]
+    assert [o["Key"] for o in plan["expired"]] == ["images/expired.png"]
+    assert [o["Key"] for o in plan["orphaned"]] == ["images/orphan.png"]
+
+@pytest.fixture
+def bucket(monkeypatch):
+    """Stubs the bucket with one expired and one orphaned image; records the deleted keys."""
+    deleted = []
+    monkeypatch.setattr(r2_storage, "is_configured", lambda: True)
+    monkeypatch.setattr(asset_lifecycle, "list_assets",
+                        lambda: iter([obj("images/done.png", age_hours=24 * 60), obj("images/orphan.png")]))
+    monkeypatch.setattr(r2_storage, "delete_objects", lambda keys: deleted.extend(keys) or [])
+    return deleted
+
+def add_old_finished_post():
+    queue = post_queue.open_queue()
+    post_id = queue.add_post(url("images/done.png"), "done", "#a", scheduled_date="2024-05-01")
+    queue.set_status(post_id, post_queue.STATUS_PUBLISHED)
+    queue.close()
+
+def test_orphans_are_kept_without_the_flag(bucket):
+    add_old_finished_post()
+
+    asset_lifecycle.main(["--retention-days", "0"])
+
+    assert bucket == ["images/done.png"]
+
+def test_orphans_are_deleted_with_the_flag(bucket):
+    add_old_finished_post()
+
+    asset_lifecycle.main(["--orphans", "--retention-days", "0"])
+
+    assert bucket == ["images/done.png", "images/orphan.png"]
+
+def test_orphans_are_never_deleted_against_an_empty_queue(bucket, capsys):
+    asset_lifecycle.main(["--orphans"])
+
+    assert bucket == []
+    assert "queue is empty" in capsys.readouterr().out
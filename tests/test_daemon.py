@@ -0,0 +1,130 @@
+import threading
+from datetime import datetime
+from http.server import ThreadingHTTPServer
+
+import pytest
+import requests
+
+import daemon
+import post_queue
+from daemon import CronSchedule, parse_cron_field
+
+def test_parse_cron_field():
+    assert parse_cron_field("*", 0, 5) == {0, 1, 2, 3, 4, 5}
+    assert parse_cron_field("*/15", 0, 59) == {0, 15, 30, 45}
+    assert parse_cron_field("1-5", 0, 7) == {1, 2, 3, 4, 5}
+    assert parse_cron_field("0,30", 0, 59) == {0, 30}
+    assert parse_cron_field("8-18/4", 0, 23) == {8, 12, 16}
+
+def test_a_single_value_with_a_step_runs_to_the_end_of_the_range():
+    assert parse_cron_field("5/10", 0, 59) == {5, 15, 25, 35, 45, 55}
+    assert parse_cron_field("20/2", 0, 23) == {20, 22}
+    assert CronSchedule("5/20 * * * *").next_after(datetime(2024, 5, 1, 9, 6)) == datetime(2024, 5, 1, 9, 25)
+
+@pytest.mark.parametrize("text", ["60", "5-1", "*/0", "a", "-1", "60/5"])
+def test_parse_cron_field_rejects_invalid_fields(text):
+    with pytest.raises(ValueError):
+        parse_cron_field(text, 0, 59)
+
+def test_cron_schedule_needs_five_fields():
+    with pytest.raises(ValueError):
+        CronSchedule("0 9 * *")
+
+def test_next_after_daily():
+    schedule = CronSchedule("0 9 * * *")
+    assert schedule.next_after(datetime(2024, 5, 1, 8, 30)) == datetime(2024, 5, 1, 9, 0)
+    assert schedule.next_after(datetime(2024, 5, 1, 9, 0)) == datetime(2024, 5, 2, 9, 0)
+    assert schedule.next_after(datetime(2024, 12, 31, 23, 59)) == datetime(2025, 1, 1, 9, 0)
+
+def test_seven_is_sunday():
+    schedule = CronSchedule("30 18 * * 7")
+    # 2024-05-01 is a Wednesday; the next Sunday is 2024-05-05.
+    assert schedule.next_after(datetime(2024, 5, 1)) == datetime(2024, 5, 5, 18, 30)
+
+def test_restricted_day_fields_match_either():
+    # The 10th of the month or any Monday.
+    schedule = CronSchedule("0 0 10 * 1")
+    assert schedule.matches_day(datetime(2024, 5, 10))  # Friday the 10th
+    assert schedule.matches_day(datetime(2024, 5, 6))  # Monday
+    assert not schedule.matches_day(datetime(2024, 5, 7))
+
+    # With one day field left open, the other one alone decides.
+    assert not CronSchedule("0 0 * * 1").matches_day(datetime(2024, 5, 10))
+
+def test_next_after_gives_up_on_impossible_dates():
+    assert CronSchedule("0 0 31 2 *").next_after(datetime(2024, 1, 1)) is None
+
+@pytest.fixture
+def server(tmp_path):
+    app = daemon.Daemon(port=0, secret="s3cret")
+    app.queue = post_queue.PostQueue(str(tmp_path / "queue.db"))
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), daemon.make_handler(app))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield app, f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+    app._generator.shutdown(wait=True)
+    app._publisher.shutdown(wait=True)
+    app.queue.close()
+
+def _future_post(app):
+    return app.queue.add_post("https://example.com/a.png", "A <caption>", "#a", scheduled_date="2999-01-01")
+
+def test_get_on_a_signed_link_only_shows_a_confirmation_page(server):
+    app, base = server
+    post_id = _future_post(app)
+    url = f"{base}/posts/{post_id}/approve?sig={app.sign('approve', post_id)}"
+
+    response = requests.get(url)
+
+    assert response.status_code == 200
+    assert "<form method='post'" in response.text
+    assert "A &lt;caption&gt;" in response.text
+    assert response.headers["Referrer-Policy"] == "no-referrer"
+    assert app.queue.get(post_id)["status"] == post_queue.STATUS_GENERATED
+
+def test_post_on_a_signed_link_approves(server):
+    app, base = server
+    post_id = _future_post(app)
+
+    response = requests.post(f"{base}/posts/{post_id}/approve?sig={app.sign('approve', post_id)}")
+
+    assert response.status_code == 200
+    assert app.queue.get(post_id)["status"] == post_queue.STATUS_APPROVED
+
+def test_a_signature_is_only_valid_for_its_action(server):
+    app, base = server
+    post_id = _future_post(app)
+
+    response = requests.post(f"{base}/posts/{post_id}/reject?sig={app.sign('approve', post_id)}")
+
+    assert response.status_code == 403
+    assert app.queue.get(post_id)["status"] == post_queue.STATUS_GENERATED
+
+def test_reject_with_bearer_token(server):
+    app, base = server
+    post_id = _future_post(app)
+
+    response = requests.post(f"{base}/posts/{post_id}/reject", headers={"Authorization": "Bearer s3cret"})
+
+    assert response.status_code == 200
+    assert app.queue.get(post_id)["status"] == post_queue.STATUS_REJECTED
+
+def test_other_endpoints_need_the_bearer_token(server):
+    app, base = server
+    assert requests.get(f"{base}/posts").status_code == 403
+    assert requests.get(f"{base}/posts", headers={"Authorization": "Bearer wrong"}).status_code == 403
+    assert requests.get(f"{base}/health").status_code == 200
+
+def test_generate_rejects_an_unknown_regenerate_stage(server, monkeypatch):
+    app, base = server
+    submitted = []
+    monkeypatch.setattr(app, "submit_generation", lambda trigger, regenerate=None: submitted.append(regenerate) or True)
+    headers = {"Authorization": "Bearer s3cret"}
+
+    assert requests.post(f"{base}/generate?regenerate=everything", headers=headers).status_code == 400
+    assert submitted == []
+    assert requests.post(f"{base}/generate?regenerate=image", headers=headers).status_code == 202
+    assert submitted == ["image"]
+    assert requests.get(f"{base}/generate", headers=headers).status_code == 404
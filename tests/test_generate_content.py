@@ -0,0 +1,104 @@
+import pytest
+
+import generate_content
+import resilience
+from stage_cache import StageCache
+
+@pytest.fixture
+def image_requests(monkeypatch):
+    """Makes every image request fail and records the quality it asked for."""
+    qualities = []
+
+    def request_image(client, params, deadline, hedge_percentile=None, on_partial=None):
+        qualities.append(params["quality"])
+        raise TimeoutError("no answer")
+
+    monkeypatch.setattr(generate_content, "request_image", request_image)
+    monkeypatch.setattr(resilience, "get_breaker", lambda name: resilience.CircuitBreaker(name))
+    monkeypatch.setattr(generate_content, "IMAGE_FALLBACK_QUALITY", "low")
+    return qualities
+
+def test_a_failed_image_falls_back_to_the_lower_quality(image_requests):
+    assert generate_content.generate_image_bytes(None, "a fox", quality="medium") == (None, None)
+    assert image_requests == ["medium", "low"]
+
+def test_no_fallback_request_when_the_fallback_is_off(image_requests):
+    assert generate_content.generate_image_bytes(None, "a fox", quality="medium", fallback=False) == (None, None)
+    assert image_requests == ["medium"]
+
+def test_an_open_circuit_makes_no_request_without_a_fallback(image_requests, monkeypatch):
+    breaker = resilience.CircuitBreaker("openai.images", failures=1, cooldown=60)
+    breaker.record_failure()
+    monkeypatch.setattr(resilience, "get_breaker", lambda name: breaker)
+
+    assert generate_content.generate_image_bytes(None, "a fox", fallback=False) == (None, None)
+    assert image_requests == []
+
+def test_a_fallback_image_reports_its_quality(monkeypatch):
+    def request_image(client, params, deadline, hedge_percentile=None, on_partial=None):
+        if params["quality"] == "medium":
+            raise TimeoutError("no answer")
+        return "bG93IGltYWdl"  # base64 of b"low image"
+
+    monkeypatch.setattr(generate_content, "request_image", request_image)
+    monkeypatch.setattr(resilience, "get_breaker", lambda name: resilience.CircuitBreaker(name))
+    monkeypatch.setattr(generate_content, "IMAGE_FALLBACK_QUALITY", "low")
+
+    assert generate_content.generate_image_bytes(None, "a fox", quality="medium") == (b"low image", "low")
+
+@pytest.fixture
+def generated(monkeypatch):
+    """Stubs the image request and the upload; records the fallback flag of every generation."""
+    calls = []
+
+    def generate_image_bytes(client, description, on_partial=None, quality=None, prompt=None, fallback=True):
+        calls.append(fallback)
+        return b"fresh image", quality
+
+    monkeypatch.setattr(generate_content, "generate_image_bytes", generate_image_bytes)
+    monkeypatch.setattr(generate_content, "render_and_upload", lambda image_bytes: {"original": "https://r2/a.png"})
+    return calls
+
+def cache_fallback_image(cache, prompt):
+    """Caches an image the way older runs did: under the requested quality, without its own."""
+    key = generate_content.stage_cache.cache_key(
+        "image", model=generate_content.IMAGE_MODEL, size=generate_content.IMAGE_SIZE,
+        quality=generate_content.IMAGE_QUALITY, prompt=prompt,
+    )
+    cache.put("image", key, {"digest": cache.put_blob(b"low image")})
+
+def test_a_fallback_image_is_not_reused_for_the_requested_quality(monkeypatch, tmp_path):
+    served = ["low", "medium"]  # the first generation falls back, the second does not
+    calls = []
+
+    def generate_image_bytes(client, description, on_partial=None, quality=None, prompt=None, fallback=True):
+        calls.append(quality)
+        return b"image", served.pop(0)
+
+    monkeypatch.setattr(generate_content, "generate_image_bytes", generate_image_bytes)
+    monkeypatch.setattr(generate_content, "render_and_upload", lambda image_bytes: {"original": "https://r2/a.png"})
+    cache = StageCache(str(tmp_path / "cache"))
+
+    for _ in range(3):
+        assert generate_content.produce_image(None, None, cache, prompt="the prompt", quality="medium")
+
+    # The second run asks for the normal quality again; the third reuses what it got.
+    assert calls == ["medium", "medium"]
+
+def test_drafts_reuse_any_cached_image(generated, tmp_path):
+    cache = StageCache(str(tmp_path / "cache"))
+    cache_fallback_image(cache, "the prompt")
+
+    assert generate_content.produce_image(None, None, cache, prompt="the prompt")
+    assert generated == []
+
+def test_the_final_render_ignores_images_that_may_be_a_fallback(generated, tmp_path):
+    cache = StageCache(str(tmp_path / "cache"))
+    cache_fallback_image(cache, "the prompt")
+
+    assert generate_content.produce_image(None, None, cache, prompt="the prompt", fallback=False)
+    assert generated == [False]
+
+    # The new image records its quality, so the next final render reuses it.
+    assert generate_content.produce_image(None, None, cache, prompt="the prompt", fallback=False)
+    assert generated == [False]
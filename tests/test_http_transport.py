@@ -0,0 +1,105 @@
+import pytest
+import requests
+
+import http_transport
+
+def response(status, headers=None, body=b""):
+    resp = requests.Response()
+    resp.status_code = status
+    resp.headers.update(headers or {})
+    resp._content = body
+    resp.request = requests.Request("POST", "https://example.com/api", data=b"payload").prepare()
+    return resp
+
+class FakeSession:
+    """Answers each request with the next outcome: a response, or an exception to raise."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def request(self, method, url, timeout=None, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(http_transport.time, "sleep", delays.append)
+    return delays
+
+def use(monkeypatch, *outcomes):
+    session = FakeSession(*outcomes)
+    monkeypatch.setattr(http_transport, "_session", session)
+    return session
+
+def test_retries_server_errors_with_backoff(monkeypatch, sleeps):
+    session = use(monkeypatch, response(503), response(502), response(200))
+
+    assert http_transport.get("https://example.com/api").status_code == 200
+    assert session.calls == 3
+    assert len(sleeps) == 2
+    assert all(0 <= delay <= http_transport.BACKOFF_BASE * 2 for delay in sleeps)
+
+def test_honors_retry_after(monkeypatch, sleeps):
+    use(monkeypatch, response(429, {"Retry-After": "3"}), response(200))
+
+    assert http_transport.get("https://example.com/api").status_code == 200
+    assert sleeps == [3.0]
+
+def test_a_retry_after_beyond_the_cap_is_returned_to_the_caller(monkeypatch, sleeps):
+    session = use(monkeypatch, response(429, {"Retry-After": str(http_transport.RETRY_AFTER_MAX + 1)}))
+
+    assert http_transport.get("https://example.com/api").status_code == 429
+    assert session.calls == 1
+    assert sleeps == []
+
+def test_returns_the_last_response_when_retries_run_out(monkeypatch, sleeps):
+    session = use(monkeypatch, response(500), response(500))
+
+    assert http_transport.get("https://example.com/api", retries=1).status_code == 500
+    assert session.calls == 2
+
+def test_client_errors_are_not_retried(monkeypatch, sleeps):
+    session = use(monkeypatch, response(400))
+
+    assert http_transport.get("https://example.com/api").status_code == 400
+    assert session.calls == 1
+
+def test_a_non_idempotent_post_is_only_retried_when_it_cannot_have_been_processed(monkeypatch, sleeps):
+    # A 5xx may come after the server acted on the request: returned as is.
+    session = use(monkeypatch, response(503))
+    assert http_transport.post("https://example.com/api", idempotent=False).status_code == 503
+    assert session.calls == 1
+
+    # A 429 and a connect timeout mean the request never got through: retried.
+    session = use(monkeypatch, response(429), requests.exceptions.ConnectTimeout("connect"), response(200))
+    assert http_transport.post("https://example.com/api", idempotent=False).status_code == 200
+    assert session.calls == 3
+
+    # A read timeout may come after the server acted on the request: raised.
+    session = use(monkeypatch, requests.exceptions.ReadTimeout("read"))
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        http_transport.post("https://example.com/api", idempotent=False)
+    assert session.calls == 1
+
+def test_idempotent_requests_retry_connection_errors_until_retries_run_out(monkeypatch, sleeps):
+    session = use(monkeypatch, requests.exceptions.ConnectionError("reset"), response(200))
+    assert http_transport.get("https://example.com/api").status_code == 200
+
+    session = use(monkeypatch, *[requests.exceptions.ConnectionError("reset")] * 3)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        http_transport.get("https://example.com/api", retries=2)
+    assert session.calls == 3
+
+def test_rate_limited_responses_are_fed_to_the_limiter(monkeypatch, sleeps):
+    limiter = http_transport.rate_limiter.RateLimiter("test", rpm=6000, concurrency=2)
+    monkeypatch.setattr(http_transport.rate_limiter, "get_limiter", lambda name, scope=None: limiter)
+    use(monkeypatch, response(429, {"Retry-After": "0"}), response(200))
+
+    assert http_transport.post("https://example.com/api", rate_limit="test").status_code == 200
+    assert limiter.rate < limiter.max_rate
+    assert limiter.in_flight == 0
@@ -0,0 +1,45 @@
+import json
+
+import metrics
+
+def write_lines(path, records):
+    with open(path, "w") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+def test_load_records_filters_and_skips_broken_lines(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    write_lines(path, [{"run_id": "a", "ts": "2024-05-01T00:00:00"}, {"run_id": "b", "ts": "2024-05-03T00:00:00"}])
+    with open(path, "ab") as f:
+        f.write(b'{"run_id": "c", "ts\n\xff\xfe\n')
+
+    assert [r["run_id"] for r in metrics.load_records(str(path))] == ["a", "b"]
+    assert [r["run_id"] for r in metrics.load_records(str(path), run_id="b")] == ["b"]
+    assert [r["run_id"] for r in metrics.load_records(str(path), since="2024-05-02")] == ["b"]
+    assert metrics.load_records(str(tmp_path / "missing.jsonl")) == []
+
+def test_load_records_reads_only_the_tail(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    write_lines(path, [{"n": n, "pad": "x" * 50} for n in range(100)])
+
+    records = metrics.load_records(str(path), tail_bytes=500)
+
+    assert 0 < len(records) < 10
+    assert records[-1]["n"] == 99
+    assert [r["n"] for r in records] == list(range(100 - len(records), 100))
+
+def test_write_record_rotates_at_the_size_cap(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_MAX_MB", 1000 / 2**20)
+    path = str(tmp_path / "metrics.jsonl")
+    for n in range(35):
+        metrics.write_record({"n": n, "pad": "x" * 50}, path)
+
+    current = metrics.load_records(path)
+    rotated = metrics.load_records(path + ".1")
+    assert rotated and current
+    assert [r["n"] for r in rotated + current] == list(range(35 - len(rotated) - len(current), 35))
+
+def test_percentile():
+    assert metrics.percentile([], 50) is None
+    assert metrics.percentile([1, 2, 3, 4], 50) == 2
+    assert metrics.percentile([1, 2, 3, 4], 95) == 4
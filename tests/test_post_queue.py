@@ -0,0 +1,139 @@
+import json
+import threading
+
+import pytest
+
+import post_queue
+from post_queue import PostQueue
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = PostQueue(str(tmp_path / "queue.db"))
+    yield queue
+    queue.close()
+
+def test_add_post_supersedes_unapproved_posts_for_the_same_date(queue):
+    first = queue.add_post("a.png", "first", "#a", scheduled_date="2024-05-01")
+    approved = queue.add_post("b.png", "approved", "#b", scheduled_date="2024-05-01", supersede=False)
+    queue.approve(approved)
+    other_day = queue.add_post("c.png", "other day", "#c", scheduled_date="2024-05-02")
+
+    second = queue.add_post("d.png", "second", "#d", scheduled_date="2024-05-01")
+
+    assert queue.get(first)["status"] == post_queue.STATUS_REJECTED
+    assert queue.get(approved)["status"] == post_queue.STATUS_APPROVED
+    assert queue.get(other_day)["status"] == post_queue.STATUS_GENERATED
+    assert queue.get(second)["status"] == post_queue.STATUS_GENERATED
+
+def test_next_due_returns_the_earliest_post_scheduled_by_today(queue):
+    later = queue.add_post("a.png", "later", "#a", scheduled_date="2024-05-03", supersede=False)
+    earlier = queue.add_post("b.png", "earlier", "#b", scheduled_date="2024-05-02", supersede=False)
+    queue.add_post("c.png", "future", "#c", scheduled_date="2024-05-09", supersede=False)
+    for post_id in (later, earlier):
+        queue.approve(post_id)
+
+    assert queue.next_due_approved(today="2024-05-05")["id"] == earlier
+    assert queue.next_due_approved(today="2024-05-01") is None
+    assert queue.next_due(post_queue.STATUS_GENERATED, today="2024-05-05") is None
+
+def test_latest_ignores_other_dates_and_prefers_the_newest(queue):
+    queue.add_post("a.png", "old", "#a", scheduled_date="2024-05-01", supersede=False)
+    newest = queue.add_post("b.png", "new", "#b", scheduled_date="2024-05-01", supersede=False)
+    queue.add_post("c.png", "tomorrow", "#c", scheduled_date="2024-05-02", supersede=False)
+
+    assert queue.latest(post_queue.STATUS_GENERATED, "2024-05-01")["id"] == newest
+    assert queue.latest(post_queue.STATUS_APPROVED, "2024-05-01") is None
+    assert queue.latest(post_queue.STATUS_GENERATED, "2024-04-30") is None
+
+def test_set_status_merges_extra_and_rejects_unknown_statuses(queue):
+    post_id = queue.add_post("a.png", "caption", "#a", extra={"image_variants": ["a.png"]})
+    queue.set_status(post_id, post_queue.STATUS_PUBLISHED, publish_id="p-1", result={"ok": True})
+
+    post = queue.get(post_id)
+    assert post["publish_id"] == "p-1"
+    assert post["image_variants"] == ["a.png"]
+    assert post["result"] == {"ok": True}
+
+    with pytest.raises(ValueError):
+        queue.set_status(post_id, post_queue.STATUS_UNKNOWN)
+    with pytest.raises(KeyError):
+        queue.set_status(post_id + 1, post_queue.STATUS_APPROVED)
+    assert queue.get(post_id)["status"] == post_queue.STATUS_PUBLISHED
+
+def test_record_publication_accepts_unknown_and_replaces_earlier_attempts(queue):
+    post_id = queue.add_post("a.png", "caption", "#a")
+    queue.record_publication(post_id, "main", post_queue.STATUS_PUBLISHING)
+    queue.record_publication(post_id, "main", post_queue.STATUS_UNKNOWN, result={"error": "timeout"})
+    queue.record_publication(post_id, "backup", post_queue.STATUS_PUBLISHED, publish_id="p-2")
+
+    publications = queue.publications(post_id)
+    assert publications["main"]["status"] == post_queue.STATUS_UNKNOWN
+    assert publications["main"]["result"] == {"error": "timeout"}
+    assert publications["backup"]["publish_id"] == "p-2"
+    with pytest.raises(ValueError):
+        queue.record_publication(post_id, "main", "lost")
+
+def test_unnotified_and_mark_notified(queue):
+    first = queue.add_post("a.png", "a", "#a", scheduled_date="2024-05-01")
+    second = queue.add_post("b.png", "b", "#b", scheduled_date="2024-05-02")
+    assert [post["id"] for post in queue.unnotified()] == [first, second]
+
+    queue.mark_notified([first])
+    assert [post["id"] for post in queue.unnotified()] == [second]
+
+def test_replace_images_keeps_status_and_merges_extra(queue):
+    post_id = queue.add_post("a.png", "caption", "#a", extra={"slides": 1})
+    queue.approve(post_id)
+    queue.replace_images(post_id, "b.png", image_variants=["b.png", "b2.png"])
+
+    post = queue.get(post_id)
+    assert post["image_url"] == "b.png"
+    assert post["status"] == post_queue.STATUS_APPROVED
+    assert post["slides"] == 1 and post["image_variants"] == ["b.png", "b2.png"]
+    with pytest.raises(KeyError):
+        queue.replace_images(post_id + 1, "c.png")
+
+def test_concurrent_writers_from_two_connections(tmp_path):
+    path = str(tmp_path / "queue.db")
+    queues = [PostQueue(path), PostQueue(path)]
+    errors = []
+
+    def add(queue, worker):
+        try:
+            for number in range(20):
+                queue.add_post(f"{worker}-{number}.png", "c", "#h", supersede=False)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=add, args=(queue, worker)) for worker, queue in enumerate(queues)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(queues[0].all_posts()) == 40
+    for queue in queues:
+        queue.close()
+
+def test_import_legacy_json_is_idempotent(queue, tmp_path):
+    legacy = tmp_path / "pending_post.json"
+    content = {"image_url": "legacy.png", "caption": "c", "hashtags": "#h", "image_variants": ["legacy.png"]}
+    legacy.write_text(json.dumps(content))
+
+    post_id = queue.import_legacy_json(str(legacy))
+    assert post_id is not None
+    assert not legacy.exists()
+    assert queue.get(post_id)["image_variants"] == ["legacy.png"]
+
+    legacy.write_text(json.dumps(content))
+    assert queue.import_legacy_json(str(legacy)) is None
+    assert len(queue.all_posts()) == 1
+
+def test_import_legacy_json_leaves_a_broken_file_alone(queue, tmp_path):
+    legacy = tmp_path / "pending_post.json"
+    legacy.write_text("{not json")
+
+    assert queue.import_legacy_json(str(legacy)) is None
+    assert legacy.exists()
+    assert queue.all_posts() == []
@@ -0,0 +1,77 @@
+import pytest
+
+import post_queue
+import publish_content
+from accounts import Account
+from config import settings
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = post_queue.PostQueue(str(tmp_path / "queue.db"))
+    yield queue
+    queue.close()
+
+@pytest.fixture
+def sent(monkeypatch):
+    """Replaces the TikTok fan-out; records (account names, resume) of every call."""
+    calls = []
+
+    def publish_to_accounts(accounts, image_urls, caption, hashtags, journal=None, resume=None):
+        resume = resume or {}
+        calls.append(([account.name for account in accounts], resume))
+        return [
+            {"account": account.name, "success": True, "publish_id": resume.get(account.name) or f"new-{account.name}",
+             "status": {"status": "PUBLISH_COMPLETE"}, "detail": "ok"}
+            for account in accounts
+        ]
+
+    monkeypatch.setattr(publish_content, "publish_to_accounts", publish_to_accounts)
+    monkeypatch.setattr(settings, "slack_webhook_url", None)
+    return calls
+
+ACCOUNTS = [Account("main"), Account("backup"), Account("spare")]
+
+def interrupted_post(queue):
+    """A post whose run died with 'main' inside content/init and 'backup' accepted by TikTok."""
+    post_id = queue.add_post("a.png", "caption", "#a")
+    queue.set_status(post_id, post_queue.STATUS_PUBLISHING)
+    queue.record_publication(post_id, "main", post_queue.STATUS_PUBLISHING)
+    queue.record_publication(post_id, "backup", post_queue.STATUS_PUBLISHING, publish_id="p-1")
+    return post_id
+
+def test_an_automatic_resume_skips_accounts_with_an_unknown_outcome(queue, sent):
+    post_id = interrupted_post(queue)
+
+    assert not publish_content.publish_post(queue, queue.get(post_id), ACCOUNTS)
+
+    assert sent == [(["backup", "spare"], {"backup": "p-1"})]
+    publications = queue.publications(post_id)
+    assert publications["main"]["status"] == post_queue.STATUS_UNKNOWN
+    assert publications["backup"]["status"] == post_queue.STATUS_PUBLISHED
+    assert queue.get(post_id)["status"] == post_queue.STATUS_FAILED
+
+    # Running again, e.g. from the next scheduled run, still leaves 'main' alone.
+    queue.set_status(post_id, post_queue.STATUS_PUBLISHING)
+    assert not publish_content.publish_post(queue, queue.get(post_id), ACCOUNTS)
+    assert len(sent) == 1
+    assert queue.publications(post_id)["main"]["status"] == post_queue.STATUS_UNKNOWN
+
+def test_reapproving_publishes_to_unknown_accounts_again(queue, sent):
+    post_id = interrupted_post(queue)
+    publish_content.publish_post(queue, queue.get(post_id), ACCOUNTS)
+
+    queue.approve(post_id)
+    assert publish_content.publish_post(queue, queue.get(post_id), ACCOUNTS)
+
+    assert sent[-1] == (["main"], {})
+    assert queue.publications(post_id)["main"]["status"] == post_queue.STATUS_PUBLISHED
+    assert queue.get(post_id)["status"] == post_queue.STATUS_PUBLISHED
+
+def test_a_confirmed_unknown_account_counts_as_published(queue, sent):
+    post_id = interrupted_post(queue)
+    publish_content.publish_post(queue, queue.get(post_id), ACCOUNTS)
+
+    queue.record_publication(post_id, "main", post_queue.STATUS_PUBLISHED)
+    queue.set_status(post_id, post_queue.STATUS_PUBLISHING)
+    assert publish_content.publish_post(queue, queue.get(post_id), ACCOUNTS)
+    assert queue.get(post_id)["status"] == post_queue.STATUS_PUBLISHED
@@ -0,0 +1,98 @@
+import threading
+import time
+
+import rate_limiter
+from rate_limiter import RateLimiter
+
+def test_parse_duration_formats():
+    assert rate_limiter._parse_duration(None) is None
+    assert rate_limiter._parse_duration("12") == 12
+    assert rate_limiter._parse_duration("6m0s") == 360
+    assert abs(rate_limiter._parse_duration("1.5s20ms") - 1.52) < 1e-9
+    assert rate_limiter._parse_duration("soon") is None
+    assert rate_limiter._parse_duration("-3") == 0
+    assert 25 <= rate_limiter._parse_duration(str(time.time() + 30)) <= 30
+
+def test_retry_after_accepts_seconds_and_http_dates():
+    assert rate_limiter.retry_after({}) is None
+    assert rate_limiter.retry_after({"Retry-After": "2"}) == 2
+    assert rate_limiter.retry_after({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}) == 0
+    assert rate_limiter.retry_after({"Retry-After": "garbage"}) is None
+
+def test_concurrency_cap_holds_under_threads():
+    limiter = RateLimiter("test", rpm=60000, concurrency=2, burst=100)
+    lock = threading.Lock()
+    state = {"running": 0, "peak": 0}
+
+    def work():
+        with limiter.slot():
+            with lock:
+                state["running"] += 1
+                state["peak"] = max(state["peak"], state["running"])
+            time.sleep(0.02)
+            with lock:
+                state["running"] -= 1
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert state["peak"] == 2
+    assert limiter.in_flight == 0
+
+def test_acquire_waits_for_a_token():
+    limiter = RateLimiter("test", rpm=600, concurrency=5, burst=1)
+    assert limiter.acquire() < 0.05
+    limiter.release()
+    waited = limiter.acquire()
+    limiter.release()
+    assert 0.05 < waited < 0.5
+
+def test_try_acquire_never_blocks():
+    limiter = RateLimiter("test", rpm=60, concurrency=1, burst=5)
+    assert limiter.try_acquire()
+    assert not limiter.try_acquire()  # concurrency slot taken
+    limiter.release()
+    assert limiter.try_acquire()
+    limiter.release()
+
+    empty = RateLimiter("test", rpm=60, concurrency=5, burst=1)
+    assert empty.try_acquire()
+    empty.release()
+    assert not empty.try_acquire()  # no token left
+
+def test_429_pauses_the_bucket_and_halves_the_rate():
+    limiter = RateLimiter("test", rpm=600, concurrency=5, burst=5)
+    limiter.observe(429, {"Retry-After": "0.2"})
+
+    assert limiter.rate == limiter.max_rate / 2
+    assert not limiter.try_acquire()
+    assert limiter.acquire() >= 0.15
+    limiter.release()
+
+    limiter.observe(200, {})
+    assert limiter.rate > limiter.max_rate / 2
+
+def test_exhausted_remaining_header_blocks_until_reset():
+    limiter = RateLimiter("test", rpm=600, concurrency=5, burst=5)
+    limiter.observe(200, {"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "1s"})
+    assert not limiter.try_acquire()
+
+def test_limit_header_lowers_the_max_rate():
+    limiter = RateLimiter("test", rpm=600, concurrency=5)
+    limiter.observe(200, {"x-ratelimit-limit-requests": "60"})
+    assert limiter.max_rate == 1.0
+    assert limiter.rate == 1.0
+
+def test_limits_for_reads_env_overrides(monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_OPENAI_IMAGES_RPM", "7")
+    monkeypatch.setenv("RATE_LIMIT_OPENAI_IMAGES_CONCURRENCY", "3")
+    limits = rate_limiter.limits_for("openai.images")
+    assert limits["rpm"] == 7 * rate_limiter.RATE_LIMIT_SCALE
+    assert limits["concurrency"] == 3
+
+def test_get_limiter_is_shared_per_scope():
+    assert rate_limiter.get_limiter("test.shared") is rate_limiter.get_limiter("test.shared")
+    assert rate_limiter.get_limiter("test.shared", "a") is not rate_limiter.get_limiter("test.shared", "b")
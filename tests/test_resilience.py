@@ -0,0 +1,184 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import metrics
+import resilience
+from rate_limiter import RateLimiter
+from resilience import CircuitBreaker, DeadlineExceeded, call_with_deadline
+
+@pytest.fixture(autouse=True)
+def _private_executor(monkeypatch):
+    executor = ThreadPoolExecutor(max_workers=4)
+    monkeypatch.setattr(resilience, "_executor", executor)
+    yield executor
+    executor.shutdown(wait=True)
+
+class Counter:
+    """
+    A call that counts how often it was sent and the timeouts it got, optionally taking
+    `delay` seconds. The first `failures` calls raise ConnectionError.
+    """
+
+    def __init__(self, delay=0.0, result="ok", failures=0):
+        self.delay = delay
+        self.result = result
+        self.failures = failures
+        self.calls = 0
+        self.timeouts = []
+        self._lock = threading.Lock()
+
+    def __call__(self, timeout):
+        with self._lock:
+            self.calls += 1
+            self.timeouts.append(timeout)
+            failed = self.calls <= self.failures
+        time.sleep(self.delay)
+        if failed:
+            raise ConnectionError("connection reset")
+        return self.result
+
+def test_breaker_opens_and_lets_one_trial_through_after_the_cooldown():
+    breaker = CircuitBreaker("test", failures=2, cooldown=0.1)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    time.sleep(0.12)
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()  # only one trial at a time
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    time.sleep(0.12)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow() and breaker.allow()
+
+def test_tracker_needs_enough_samples(monkeypatch):
+    monkeypatch.setattr(resilience, "HEDGE_MIN_SAMPLES", 3)
+    tracker = resilience.LatencyTracker("test.endpoint")
+    tracker.add(1.0)
+    tracker.add(2.0)
+    assert tracker.percentile(50) is None
+    tracker.add(3.0)
+    assert tracker.percentile(50) == 2.0
+
+def test_returns_the_result_within_the_deadline():
+    call = Counter()
+    assert call_with_deadline(call, 1.0, "test") == "ok"
+    assert 0 < call.timeouts[0] <= 1.0
+
+def test_raises_when_the_deadline_passes():
+    with pytest.raises(DeadlineExceeded):
+        call_with_deadline(Counter(delay=0.3), 0.1, "test")
+
+def test_raises_the_error_of_a_failed_attempt():
+    calls = []
+
+    def call(timeout):
+        calls.append(timeout)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        call_with_deadline(call, 1.0, "test", retry_on=(ConnectionError,))
+    assert len(calls) == 1  # not a retryable error
+
+def test_retries_a_retryable_error_within_the_deadline(monkeypatch):
+    monkeypatch.setattr(resilience, "RETRY_BACKOFF_BASE", 0.01)
+    call = Counter(failures=2)
+
+    assert call_with_deadline(call, 1.0, "test", retry_on=(ConnectionError,)) == "ok"
+    assert call.calls == 3
+    assert call.timeouts[2] < call.timeouts[0] <= 1.0
+
+def test_gives_up_with_the_last_error_when_the_retries_run_out(monkeypatch):
+    monkeypatch.setattr(resilience, "RETRY_BACKOFF_BASE", 0.01)
+    call = Counter(failures=10)
+
+    with pytest.raises(ConnectionError):
+        call_with_deadline(call, 1.0, "test", retry_on=(ConnectionError,), retries=2)
+    assert call.calls == 3
+
+def test_an_abandoned_attempt_is_not_retried(monkeypatch, _private_executor):
+    monkeypatch.setattr(resilience, "RETRY_BACKOFF_BASE", 0.01)
+    call = Counter(delay=0.2, failures=10)
+
+    with pytest.raises(DeadlineExceeded):
+        call_with_deadline(call, 0.1, "test", retry_on=(ConnectionError,))
+    _private_executor.shutdown(wait=True)
+
+    assert call.calls == 1
+
+def test_hedge_wins_when_the_first_attempt_is_slow():
+    delays = iter([0.5, 0.0])
+
+    def slow_then_fast(timeout):
+        time.sleep(next(delays))
+        return "ok"
+
+    with metrics.span("test") as span:
+        assert call_with_deadline(slow_then_fast, 1.0, "test", hedge_after=0.05) == "ok"
+
+    assert span.attrs["hedge_won"] is True
+    assert span.attrs["hedged_after_s"] == 0.05
+
+def test_waiting_for_the_limiter_does_not_count_against_the_deadline():
+    limiter = RateLimiter("test", rpm=60000, concurrency=1, burst=10)
+    limiter.acquire()
+    threading.Timer(0.3, limiter.release).start()
+
+    assert call_with_deadline(Counter(), 0.2, "test", limiter=limiter) == "ok"
+    assert limiter.in_flight == 0
+
+def test_waiting_for_a_worker_does_not_count_against_the_deadline(_private_executor):
+    for _ in range(4):
+        _private_executor.submit(time.sleep, 0.15)
+
+    assert call_with_deadline(Counter(delay=0.1), 0.2, "test") == "ok"
+
+def test_a_busy_worker_pool_is_bounded_by_the_deadline(_private_executor):
+    for _ in range(4):
+        _private_executor.submit(time.sleep, 0.3)
+    limiter = RateLimiter("test", rpm=60000, concurrency=1, burst=10)
+    call = Counter()
+
+    with pytest.raises(DeadlineExceeded):
+        call_with_deadline(call, 0.1, "test", limiter=limiter)
+    _private_executor.shutdown(wait=True)
+
+    assert call.calls == 0  # the queued request was never sent
+    assert limiter.in_flight == 0
+
+def test_an_abandoned_hedge_is_never_sent(monkeypatch):
+    # One worker: the hedge is queued behind the first attempt, which then wins.
+    single = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(resilience, "_executor", single)
+    limiter = RateLimiter("test", rpm=60000, concurrency=2, burst=10)
+    call = Counter(delay=0.2)
+
+    with metrics.span("test") as span:
+        assert call_with_deadline(call, 1.0, "test", hedge_after=0.05, limiter=limiter) == "ok"
+    single.shutdown(wait=True)
+
+    assert "hedged_after_s" in span.attrs
+    assert call.calls == 1
+    assert limiter.in_flight == 0
+
+def test_no_hedge_without_a_free_slot():
+    limiter = RateLimiter("test", rpm=60000, concurrency=1, burst=10)
+    call = Counter(delay=0.2)
+
+    with metrics.span("test") as span:
+        assert call_with_deadline(call, 1.0, "test", hedge_after=0.05, limiter=limiter) == "ok"
+
+    assert span.attrs["hedge_skipped"] == "no free slot"
+    assert call.calls == 1
+    assert limiter.in_flight == 0
@@ -0,0 +1,160 @@
+import threading
+import time
+
+import pytest
+
+import generate_content
+from scene_bank import SceneBank
+
+WORDS = ["otter", "lantern", "cactus", "walrus", "violin", "glacier", "teapot", "falcon",
+         "comet", "pumpkin", "anchor", "meadow"]
+HASHTAGS = "#a #b #c #d #e"
+
+def entries(words):
+    return [{"description": f"A {word} in the garden", "caption": f"About the {word}", "hashtags": HASHTAGS}
+            for word in words]
+
+@pytest.fixture
+def bank(tmp_path, monkeypatch):
+    monkeypatch.setattr(generate_content, "_bank_refills", 0)
+    monkeypatch.setattr(generate_content, "_bank_refill_added", 0)
+    monkeypatch.setattr(generate_content, "_bank_refill_thread", None)
+    bank = SceneBank(str(tmp_path / "bank.db"))
+    yield bank
+    generate_content.wait_for_scene_bank_refill()
+    bank.close()
+
+def test_take_marks_entries_used_and_keeps_sources_apart(bank):
+    bank.add(entries(WORDS[:2]), "v1")
+    bank.add(entries(WORDS[2:3]), "v2")
+
+    assert bank.take("v1")["description"] == "A otter in the garden"
+    assert [entry["description"] for entry in bank.unused("v1")] == ["A lantern in the garden"]
+    assert bank.take("v1")["description"] == "A lantern in the garden"
+    assert bank.take("v1") is None
+    assert len(bank.unused("v2")) == 1
+
+def test_concurrent_takes_never_share_an_entry(bank, tmp_path):
+    bank.add(entries(WORDS), "v1")
+    # A second connection, like another process on the same database.
+    other = SceneBank(bank.path)
+    taken = []
+    barrier = threading.Barrier(16)
+
+    def worker(number):
+        barrier.wait()
+        entry = (bank if number % 2 else other).take("v1")
+        if entry:
+            taken.append(entry["id"])
+
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    other.close()
+
+    assert len(taken) == len(WORDS)
+    assert len(set(taken)) == len(WORDS)
+
+def test_validate_bank_entries():
+    planned = [{"description": "A otter in the garden"}]
+    candidates = entries(["otter", "lantern", "lantern"]) + [
+        {"description": "A cactus", "caption": "Cactus", "hashtags": "#only #three #tags"},
+        {"description": "", "caption": "Empty", "hashtags": HASHTAGS},
+        {"description": "A comet", "caption": "Comet", "hashtags": "no hashes at all here"},
+        "not a dict",
+    ]
+
+    valid = generate_content.validate_bank_entries(candidates, planned=planned)
+
+    assert [entry["description"] for entry in valid] == ["A lantern in the garden"]
+
+def test_refill_losers_wait_for_the_running_refill(bank, monkeypatch):
+    calls = []
+
+    def generate_scene_bank(client, count, avoid=None):
+        calls.append(count)
+        time.sleep(0.2)
+        return entries(WORDS)
+
+    monkeypatch.setattr(generate_content, "generate_scene_bank", generate_scene_bank)
+    monkeypatch.setattr(generate_content, "SCENE_BANK_SIZE", len(WORDS))
+    results = []
+    barrier = threading.Barrier(6)
+
+    def worker():
+        barrier.wait()
+        results.append(generate_content.take_from_scene_bank(None, bank))
+
+    threads = [threading.Thread(target=worker) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert all(description for description, _, _ in results)
+    assert len({description for description, _, _ in results}) == 6
+
+def test_a_failed_refill_is_not_repeated_by_the_waiters(bank, monkeypatch):
+    calls = []
+
+    def generate_scene_bank(client, count, avoid=None):
+        calls.append(count)
+        time.sleep(0.2)
+        return None
+
+    monkeypatch.setattr(generate_content, "generate_scene_bank", generate_scene_bank)
+    results = []
+    barrier = threading.Barrier(4)
+
+    def worker():
+        barrier.wait()
+        results.append(generate_content.take_from_scene_bank(None, bank))
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [(None, None, None)] * 4
+
+def test_a_waiter_counts_a_refill_whose_entries_others_took_as_success(bank, monkeypatch):
+    started = threading.Event()
+
+    def generate_scene_bank(client, count, avoid=None):
+        started.set()
+        time.sleep(0.2)
+        return entries(WORDS[:2])
+
+    add = bank.add
+
+    def add_and_take_all(new_entries, source):
+        add(new_entries, source)
+        while bank.take(source):  # other batch workers take them right away
+            pass
+
+    monkeypatch.setattr(generate_content, "generate_scene_bank", generate_scene_bank)
+    monkeypatch.setattr(bank, "add", add_and_take_all)
+    refiller = threading.Thread(target=generate_content.refill_scene_bank, args=(None, bank))
+    refiller.start()
+    started.wait()
+
+    assert generate_content.refill_scene_bank(None, bank) is True
+    refiller.join()
+    assert bank.unused(generate_content.SCENE_BANK_SOURCE) == []
+
+def test_taken_entries_that_repeat_a_past_post_are_skipped(bank, tmp_path):
+    import scene_index
+
+    index = scene_index.SceneIndex(str(tmp_path / "index.db"))
+    index.add("description", "A otter in the garden")
+    bank.add(entries(WORDS[:5]), generate_content.SCENE_BANK_SOURCE)
+
+    description, _, _ = generate_content.take_from_scene_bank(None, bank, index)
+
+    assert description == "A lantern in the garden"
+    index.close()
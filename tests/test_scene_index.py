@@ -0,0 +1,75 @@
+import threading
+
+import pytest
+
+import post_queue
+import scene_index
+from scene_index import SceneIndex
+
+@pytest.fixture
+def index(tmp_path):
+    index = SceneIndex(str(tmp_path / "index.db"), threshold=0.5)
+    yield index
+    index.close()
+
+def test_shingles_ignore_stopwords_short_words_and_plurals():
+    assert scene_index.shingles("The fox and a cat") == scene_index.shingles("fox cat")
+    assert scene_index.shingles("a an of to") == set()
+    assert scene_index.shingles("moon moons") == scene_index.shingles("moon")
+    assert scene_index.shingles("glass") != scene_index.shingles("glas")
+
+def test_jaccard():
+    assert scene_index.jaccard({1, 2}, {2, 3}) == 1 / 3
+    assert scene_index.jaccard(set(), {1}) == 0.0
+
+def test_check_and_add_rejects_a_reworded_scene(index):
+    assert index.check_and_add("A sleepy fox curled up on the crescent moon", "Goodnight, little fox") is None
+
+    match = index.check_and_add("The crescent moon cradling a sleepy fox curled up", "Something else entirely")
+
+    assert match is not None
+    assert match["kind"] == "description"
+    assert match["similarity"] >= 0.5
+    # Neither text of a rejected post is indexed.
+    assert index.find_similar("caption", "Something else entirely") is None
+
+def test_check_and_add_accepts_a_different_scene(index):
+    index.check_and_add("A sleepy fox curled up on the crescent moon", "Goodnight, little fox")
+    assert index.check_and_add("A lighthouse keeper feeding seagulls at dawn", "Morning shift") is None
+    assert index.find_similar("caption", "Morning shift")["text"] == "Morning shift"
+
+def test_kinds_are_separate(index):
+    index.add("caption", "A whale singing under the northern lights")
+    assert index.find_similar("description", "A whale singing under the northern lights") is None
+
+def test_only_one_of_two_concurrent_duplicates_is_accepted(index):
+    barrier = threading.Barrier(8)
+    results = []
+
+    def worker(number):
+        barrier.wait()
+        results.append(index.check_and_add("A red panda knitting a scarf in a snowy forest", f"Caption {number}"))
+
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results.count(None) == 1
+
+def test_index_persists_and_backfills(tmp_path):
+    path = str(tmp_path / "index.db")
+    queue = post_queue.PostQueue(str(tmp_path / "queue.db"))
+    queue.add_post("a.png", "Octopus barista pouring latte art", "#a", description="An octopus barista pouring latte art")
+
+    index = SceneIndex(path)
+    assert index.is_empty()
+    assert index.backfill_from_queue(queue) == 1
+    index.close()
+
+    reopened = SceneIndex(path)
+    assert not reopened.is_empty()
+    assert reopened.find_similar("description", "latte art poured by an octopus barista") is not None
+    reopened.close()
+    queue.close()
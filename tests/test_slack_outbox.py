@@ -0,0 +1,110 @@
+import json
+import threading
+import time
+
+import pytest
+
+import slack_outbox
+from slack_outbox import Outbox
+
+def message(text, kind="webhook", digest=None, **extra):
+    return {"kind": kind, "text": text, "digest": digest, **extra}
+
+@pytest.fixture
+def delivered(monkeypatch):
+    """Records the messages the outbox delivers instead of sending them to Slack."""
+    sent = []
+    monkeypatch.setattr(slack_outbox, "deliver", lambda m: sent.append(m) or True)
+    return sent
+
+def test_merge_combines_texts_and_blocks():
+    assert slack_outbox.merge([message("solo")])["text"] == "solo"
+
+    digest = slack_outbox.merge([
+        message("first", digest="approval"),
+        message("second", digest="approval", blocks=[{"type": "section"}]),
+    ])
+    assert digest["text"].startswith("🗂️ *2 posts ready for approval*")
+    assert "first" in digest["text"] and "second" in digest["text"]
+    assert [block["type"] for block in digest["blocks"]] == ["section", "divider", "section", "divider", "section"]
+
+def test_a_burst_of_the_same_digest_is_sent_once(delivered, monkeypatch, tmp_path):
+    monkeypatch.setattr(slack_outbox, "DIGEST_WINDOW", 0.2)
+    outbox = Outbox(str(tmp_path / "spool.jsonl"))
+    for number in range(3):
+        outbox.send(message(f"post {number}", digest="approval"))
+    outbox.send(message("alone"))
+    time.sleep(0.4)
+    outbox.close(timeout=1)
+
+    digest, alone = delivered
+    assert all(f"post {number}" in digest["text"] for number in range(3))
+    assert alone["text"] == "alone"
+
+def test_digests_respect_digest_max(delivered, monkeypatch, tmp_path):
+    monkeypatch.setattr(slack_outbox, "DIGEST_WINDOW", 0.1)
+    monkeypatch.setattr(slack_outbox, "DIGEST_MAX", 2)
+    outbox = Outbox(str(tmp_path / "spool.jsonl"))
+    for number in range(5):
+        outbox.send(message(f"post {number}", digest="publish"))
+    time.sleep(0.3)
+    outbox.close(timeout=1)
+
+    assert len(delivered) == 3
+
+def test_undelivered_messages_are_spooled_on_close(monkeypatch, tmp_path):
+    monkeypatch.setattr(slack_outbox, "deliver", lambda m: None)
+    path = tmp_path / "spool.jsonl"
+    outbox = Outbox(str(path))
+    outbox.send(message("lost"))
+    outbox.close(timeout=0.5)
+
+    spooled = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [m["text"] for m in spooled] == ["lost"]
+
+def test_a_failing_deliver_does_not_kill_the_thread(monkeypatch, tmp_path):
+    sent = []
+
+    def deliver(m):
+        if m["text"] == "boom":
+            raise RuntimeError("boom")
+        sent.append(m)
+        return True
+
+    monkeypatch.setattr(slack_outbox, "deliver", deliver)
+    outbox = Outbox(str(tmp_path / "spool.jsonl"))
+    outbox.send(message("boom"))
+    outbox.send(message("fine"))
+    outbox.close(timeout=1)
+
+    assert [m["text"] for m in sent] == ["fine"]
+
+def test_spooled_messages_are_sent_by_the_next_run_and_stale_ones_dropped(delivered, tmp_path):
+    path = tmp_path / "spool.jsonl"
+    fresh = message("fresh", queued_at=time.time(), attempts=3, not_before=time.time() + 600)
+    stale = message("stale", queued_at=time.time() - (slack_outbox.MAX_AGE_HOURS + 1) * 3600, attempts=0, not_before=0)
+    path.write_text("".join(json.dumps(m) + "\n" for m in (fresh, stale)))
+
+    outbox = Outbox(str(path)).start()
+    outbox.close(timeout=1)
+
+    assert [m["text"] for m in delivered] == ["fresh"]
+    assert not path.exists()
+
+def test_only_one_process_claims_the_spool(tmp_path):
+    path = tmp_path / "spool.jsonl"
+    path.write_text(json.dumps(message("once", queued_at=time.time(), attempts=0, not_before=0)) + "\n")
+    claims = []
+    barrier = threading.Barrier(4)
+
+    def claim():
+        barrier.wait()
+        claims.append(Outbox(str(path))._claim_spool())
+
+    threads = [threading.Thread(target=claim) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(len(claimed) for claimed in claims) == 1
@@ -0,0 +1,67 @@
+import os
+import time
+
+import pytest
+
+from stage_cache import Checkpoint, StageCache, cache_key, content_hash
+
+@pytest.fixture
+def cache(tmp_path):
+    return StageCache(str(tmp_path / "cache"))
+
+def test_cache_key_is_stable_and_depends_on_every_parameter():
+    key = cache_key("image", prompt="a fox", size="1024x1024")
+    assert key == cache_key("image", size="1024x1024", prompt="a fox")
+    assert key != cache_key("image", prompt="a fox", size="512x512")
+    assert key != cache_key("caption", prompt="a fox", size="1024x1024")
+
+def test_put_get_and_delete(cache):
+    assert cache.get("text", "k") is None
+    cache.put("text", "k", {"caption": "hi"})
+    assert cache.get("text", "k") == {"caption": "hi"}
+    assert list(cache.values("text")) == [{"caption": "hi"}]
+    cache.delete("text", "k")
+    cache.delete("text", "k")
+    assert cache.get("text", "k") is None
+
+def test_a_half_written_entry_is_a_miss(cache):
+    cache.put("text", "k", {"caption": "hi"})
+    with open(os.path.join(cache.directory, "text", "k.json"), "w") as f:
+        f.write('{"capt')
+    assert cache.get("text", "k") is None
+    assert list(cache.values("text")) == []
+
+def test_blobs_are_content_addressed_and_verified(cache):
+    digest = cache.put_blob(b"image bytes")
+    assert digest == content_hash(b"image bytes")
+    assert cache.put_blob(b"image bytes") == digest
+    assert cache.get_blob(digest) == b"image bytes"
+    assert cache.get_blob(content_hash(b"missing")) is None
+
+    with open(os.path.join(cache.directory, "blobs", digest), "wb") as f:
+        f.write(b"truncated")
+    assert cache.get_blob(digest) is None
+
+def test_prune_removes_only_old_files(cache):
+    cache.put("text", "old", {"a": 1})
+    cache.put("text", "new", {"b": 2})
+    old_path = os.path.join(cache.directory, "text", "old.json")
+    long_ago = time.time() - 30 * 86400
+    os.utime(old_path, (long_ago, long_ago))
+
+    assert cache.prune(max_age_days=14) == 1
+    assert cache.get("text", "old") is None
+    assert cache.get("text", "new") == {"b": 2}
+    assert StageCache(os.path.join(cache.directory, "missing")).prune() == 0
+
+def test_checkpoint_resumes_and_clears(cache):
+    checkpoint = Checkpoint(cache, slot="2024-05-01#0")
+    checkpoint.record("text", {"description": "a fox"})
+
+    resumed = Checkpoint(cache, slot="2024-05-01#0")
+    assert resumed.get("text") == {"description": "a fox"}
+    assert resumed.get("image") is None
+    assert Checkpoint(cache, slot="2024-05-01#1").get("text") is None
+
+    resumed.clear()
+    assert Checkpoint(cache, slot="2024-05-01#0").get("text") is None
@@ -0,0 +1,96 @@
+import os
+import stat
+import threading
+import time
+
+import pytest
+
+import token_store
+from token_store import TokenStore
+
+@pytest.fixture
+def store(tmp_path):
+    return TokenStore(str(tmp_path / ".tiktok_token.json"))
+
+class Refresher:
+    """Stands in for TikTok's token endpoint; rotates the refresh token on every call."""
+
+    def __init__(self, valid=("env-token",), expires_in=86400):
+        self.valid = set(valid)
+        self.expires_in = expires_in
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, refresh_token):
+        with self._lock:
+            self.calls.append(refresh_token)
+            if refresh_token not in self.valid:
+                return None
+            number = len(self.calls)
+            rotated = f"rotated-{number}"
+            self.valid.add(rotated)
+        time.sleep(0.05)
+        return {"access_token": f"access-{number}", "expires_in": self.expires_in,
+                "refresh_token": rotated, "refresh_expires_in": 31536000, "open_id": "user"}
+
+def test_refreshes_once_and_then_uses_the_cached_token(store):
+    refresh = Refresher()
+
+    assert store.get_access_token(refresh, "env-token") == "access-1"
+    assert store.get_access_token(refresh, "env-token") == "access-1"
+    assert refresh.calls == ["env-token"]
+
+    data = store.load()
+    assert data["refresh_token"] == "rotated-1"
+    assert data["expires_at"] == pytest.approx(time.time() + 86400, abs=5)
+    assert stat.S_IMODE(os.stat(store.path).st_mode) == 0o600
+
+def test_refreshes_with_the_rotated_token_close_to_expiry(store):
+    refresh = Refresher(expires_in=token_store.REFRESH_MARGIN - 1)
+    store.get_access_token(refresh, "env-token")
+
+    assert store.get_access_token(refresh, "env-token") == "access-2"
+    assert refresh.calls == ["env-token", "rotated-1"]
+
+def test_falls_back_to_the_configured_token_when_the_stored_one_is_rejected(store):
+    store.save({"refresh_token": "revoked", "access_token": "old", "expires_at": 0})
+    refresh = Refresher()
+
+    assert store.get_access_token(refresh, "env-token") == "access-2"
+    assert refresh.calls == ["revoked", "env-token"]
+    assert store.load()["refresh_token"] == "rotated-2"
+
+def test_returns_none_when_every_refresh_token_is_rejected(store):
+    refresh = Refresher(valid=())
+    assert store.get_access_token(refresh, "env-token") is None
+    assert store.get_access_token(refresh, None) is None
+    assert store.load() == {}
+
+def test_a_response_without_a_refresh_token_keeps_the_stored_one(store):
+    store.save({"refresh_token": "keep-me", "refresh_expires_at": 1, "open_id": "user"})
+    data = store.save_token_response({"access_token": "a", "expires_in": 60})
+    assert data["refresh_token"] == "keep-me"
+    assert data["open_id"] == "user"
+
+def test_a_corrupted_store_reads_as_empty(store):
+    with open(store.path, "w") as f:
+        f.write("{broken")
+    assert store.load() == {}
+
+@pytest.mark.skipif(token_store.fcntl is None, reason="needs file locks")
+def test_concurrent_publishers_refresh_only_once(store):
+    refresh = Refresher()
+    tokens = []
+
+    def publisher():
+        # Each publisher opens the store itself, like separate processes do.
+        tokens.append(TokenStore(store.path).get_access_token(refresh, "env-token"))
+
+    threads = [threading.Thread(target=publisher) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert refresh.calls == ["env-token"]
+    assert tokens == ["access-1"] * 5
@@ -0,0 +1,103 @@
+import os
+import json
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory file locks, the store works unlocked.
+    fcntl = None
+
+# --- Configuration ---
+# Where the cached TikTok tokens live. The file holds secrets, so keep it out of git.
+TOKEN_STORE_PATH = os.getenv("TIKTOK_TOKEN_STORE", ".tiktok_token.json")
+# Refresh the access token when it has less than this many seconds left.
+REFRESH_MARGIN = int(os.getenv("TIKTOK_TOKEN_REFRESH_MARGIN", "300"))
+
+class TokenStore:
+    """
+    A small file-backed cache for TikTok OAuth tokens.
+
+    Keeps the access token with its expiry time and the latest (rotated) refresh
+    token. All reads and refreshes happen under an exclusive file lock, so two
+    publishers running at the same time never both spend the same refresh token.
+    """
+
+    def __init__(self, path=TOKEN_STORE_PATH):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+
+    @contextmanager
+    def locked(self):
+        """Holds an exclusive lock on the store for the duration of the block."""
+        with open(self.lock_path, "a") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def load(self):
+        """Returns the stored token data, or an empty dict if there is none."""
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def save(self, data):
+        """Atomically writes the token data, readable by the current user only."""
+        tmp_path = f"{self.path}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=4)
+        os.replace(tmp_path, self.path)
+
+    def save_token_response(self, token_data):
+        """
+        Stores a token response from TikTok's /oauth/token/ endpoint.
+        Relative 'expires_in' values are turned into absolute timestamps.
+        """
+        now = time.time()
+        data = self.load()
+        data.update({
+            "access_token": token_data["access_token"],
+            "expires_at": now + int(token_data.get("expires_in", 0)),
+            "open_id": token_data.get("open_id", data.get("open_id")),
+            "scope": token_data.get("scope", data.get("scope")),
+        })
+        if token_data.get("refresh_token"):
+            data["refresh_token"] = token_data["refresh_token"]
+            data["refresh_expires_at"] = now + int(token_data.get("refresh_expires_in", 0))
+        self.save(data)
+        return data
+
+    def get_access_token(self, refresh_fn, fallback_refresh_token=None):
+        """
+        Returns a valid access token, refreshing it only when it is close to expiry.
+
+        `refresh_fn(refresh_token)` must return TikTok's token response dict, or None
+        on failure. The stored (most recently rotated) refresh token is tried first;
+        `fallback_refresh_token`, e.g. from the environment, is used when the store is
+        empty or its refresh token has been rejected.
+        """
+        with self.locked():
+            data = self.load()
+            if data.get("access_token") and data.get("expires_at", 0) - REFRESH_MARGIN > time.time():
+                remaining = int(data["expires_at"] - time.time())
+                print(f"Using cached access token (expires in {remaining}s).")
+                return data["access_token"]
+
+            candidates = [data.get("refresh_token"), fallback_refresh_token]
+            tried = set()
+            for refresh_token in candidates:
+                if not refresh_token or refresh_token in tried:
+                    continue
+                tried.add(refresh_token)
+                token_data = refresh_fn(refresh_token)
+                if token_data:
+                    self.save_token_response(token_data)
+                    return token_data["access_token"]
+            return None